@@ -0,0 +1,157 @@
+import asyncio
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import HTTPException, status
+
+from .coordination import CoordinationBackend, InMemoryCoordination, get_coordination
+from .utils.logger_config import get_app_logger
+
+logger = get_app_logger(__name__)
+
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "4"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "16"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "30"))
+USER_EXTRACTIONS_PER_MINUTE = float(os.getenv("USER_EXTRACTIONS_PER_MINUTE", "10"))
+USER_EXTRACTION_BURST = int(os.getenv("USER_EXTRACTION_BURST", "5"))
+
+
+@dataclass
+class AdmissionStats:
+    admitted: int = 0
+    rejected_rate_limited: int = 0
+    rejected_queue_full: int = 0
+    rejected_queue_timeout: int = 0
+    queued: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+    total_run_time: float = 0.0
+    completed: int = 0
+
+
+class AdmissionController:
+    """Bounds how many expensive extraction pipelines run at once and how often each user may start one.
+
+    A request first takes a token from its user's bucket (429 with Retry-After when empty), then
+    waits for one of `max_concurrent` slots. At most `max_queue` requests wait at a time and each
+    waits at most `queue_timeout` seconds; beyond that the request gets 503 with Retry-After.
+    Only extractions go through here: reads and edits of stored recipes never queue, and the extraction
+    endpoints answer URLs whose recipes are already stored before admitting the request.
+    User buckets live in the coordination backend, so the rate holds across worker processes; the
+    slot limit applies per worker.
+    """
+
+    def __init__(self, max_concurrent: int = ADMISSION_MAX_CONCURRENT, max_queue: int = ADMISSION_MAX_QUEUE, queue_timeout: float = ADMISSION_QUEUE_TIMEOUT_SECONDS, user_rate_per_minute: float = USER_EXTRACTIONS_PER_MINUTE, user_burst: int = USER_EXTRACTION_BURST, coordination: Optional[CoordinationBackend] = None):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.user_rate_per_minute = user_rate_per_minute
+        self.user_burst = user_burst
+        self.running = 0
+        self.waiting = 0
+        self.stats = AdmissionStats()
+        self.coordination = coordination or InMemoryCoordination()
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    def _estimated_wait(self) -> int:
+        average_run = self.stats.total_run_time / self.stats.completed if self.stats.completed else 10.0
+        return max(1, math.ceil(average_run * (self.waiting + 1) / self.max_concurrent))
+
+    def saturated(self) -> bool:
+        """True when every slot is taken, i.e. the next request will queue."""
+        return self._semaphore.locked()
+
+    async def admit(self, user_id: int):
+        """Fast admission check: the user's token bucket, then room in the wait queue. Raises 429/503.
+
+        The bucket is a blocking call into the coordination backend, so it runs in a thread.
+        """
+        allowed, retry_after = await asyncio.to_thread(
+            self.coordination.take_token, f"extractions:user:{user_id}", self.user_burst, self.user_rate_per_minute / 60,
+        )
+        if not allowed:
+            self.stats.rejected_rate_limited += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many recipe extractions. Please wait before importing another recipe.",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.stats.rejected_queue_full += 1
+            logger.warning(f"Extraction queue full ({self.waiting} waiting, {self.running} running); rejecting user {user_id}.")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="The server is busy extracting other recipes. Please try again shortly.",
+                headers={"Retry-After": str(self._estimated_wait())},
+            )
+
+    async def acquire(self) -> float:
+        """Waits for a pipeline slot, raising 503 after `queue_timeout`. Returns the time spent queued."""
+        queued = self._semaphore.locked()
+        started = time.monotonic()
+        if queued:
+            self.waiting += 1
+            self.stats.queued += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.stats.rejected_queue_timeout += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Timed out waiting for an extraction slot. Please try again shortly.",
+                headers={"Retry-After": str(self._estimated_wait())},
+            )
+        finally:
+            if queued:
+                self.waiting -= 1
+
+        waited = time.monotonic() - started
+        self.running += 1
+        self.stats.admitted += 1
+        self.stats.total_wait += waited
+        self.stats.max_wait = max(self.stats.max_wait, waited)
+        return waited
+
+    def release(self, run_time: float):
+        self.running -= 1
+        self.stats.completed += 1
+        self.stats.total_run_time += run_time
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self, user_id: int):
+        await self.admit(user_id)
+        await self.acquire()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def snapshot(self) -> dict:
+        stats = self.stats
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": self.running,
+            "queue_depth": self.waiting,
+            "max_queue": self.max_queue,
+            "admitted": stats.admitted,
+            "queued": stats.queued,
+            "rejected": {
+                "rate_limited": stats.rejected_rate_limited,
+                "queue_full": stats.rejected_queue_full,
+                "queue_timeout": stats.rejected_queue_timeout,
+            },
+            "avg_wait_seconds": stats.total_wait / stats.admitted if stats.admitted else None,
+            "max_wait_seconds": stats.max_wait,
+            "avg_run_seconds": stats.total_run_time / stats.completed if stats.completed else None,
+            "user_rate_per_minute": self.user_rate_per_minute,
+            "user_burst": self.user_burst,
+        }
+
+
+admission = AdmissionController(coordination=get_coordination())
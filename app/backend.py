@@ -1,21 +1,40 @@
+import time
+_import_started = time.perf_counter()
+
 import asyncio
+import json
 import sys
-from typing import List
+from contextlib import asynccontextmanager
+from typing import List, Union
 from datetime import timedelta
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, File, Query, Request, UploadFile, status
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, HttpUrl
 from fastapi.middleware.cors import CORSMiddleware
-from .recipe_service import RecipeService
-from .models.recipe import Recipe as RecipePydantic, RecipeUpdate
+from fastapi.middleware.gzip import GZipMiddleware
+from .recipe_service import RecipeService, get_recipe_service
+from .startup import WARMUP_ENABLED, startup_report, warm_up
+from .recipe_agent import cascade_stats
+from .admission import admission
+from .cancellation import ClientDisconnected, cancel_on_disconnect, cancellation_stats, iterate_until_disconnected
+from .deadline import DeadlineExceeded, deadline_for, deadline_stats, request_deadline
+from .domain_templates import template_stats
+from .fetch_scheduler import FetchDisallowed, fetch_scheduler
+from .near_duplicates import near_duplicate_stats
+from .negative_cache import FAILURE_POLICIES, CachedUrlFailure
+from .library_transfer import NDJSON_MEDIA_TYPE, ZIP_MEDIA_TYPE, export_ndjson, export_zip, import_library
+from .models.recipe import Recipe as RecipePydantic, RecipeUpdate, SimilarRecipe
 from .models.user import UserCreate, UserDisplay, Token
-from .database import create_db_and_tables, SessionLocal, get_db, UserDB
+from .utils.image_utils import image_path_for_key
+from .database import create_db_and_tables, load_similar_index, SessionLocal, get_db, UserDB
+from .similar_recipes import similar_index
 from sqlalchemy.orm import Session
 from .utils.logger_config import get_app_logger
 from .auth import create_access_token, verify_password, ACCESS_TOKEN_EXPIRE_MINUTES, get_current_active_user, get_user_by_email, create_user
-from fastapi.staticfiles import StaticFiles
+from .static_assets import PrecompressedStaticFiles
+from .serialization import MSGPACK_MEDIA_TYPE, ORJSONResponse, negotiated_response
 import os
 
 load_dotenv()
@@ -33,10 +52,36 @@ if sys.platform == "win32":
 else:
     logger.info("BACKEND (module-level): Not on Windows, skipping Proactor policy setting.")
 
+# Everything imported above (FastAPI, SQLAlchemy, the client assets); providers and the crawler load later.
+startup_report.component("app").import_seconds = round(time.perf_counter() - _import_started, 3)
+startup_report.component("app").status = "ready"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info("BACKEND (lifespan): Running startup tasks (create_db_and_tables, background warm-up).")
+    with startup_report.measure("database", "init") as database:
+        create_db_and_tables()
+    database.status = "ready"
+    startup_report.database_ready = True
+    similar_index_task = asyncio.create_task(asyncio.to_thread(load_similar_index))
+
+    warmup_task = None
+    if WARMUP_ENABLED:
+        warmup_task = asyncio.create_task(warm_up(get_recipe_service))
+    else:
+        startup_report.finish_warmup()
+    yield
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    await similar_index_task
+    if similar_index is not None:
+        await asyncio.to_thread(similar_index.save)
+
 app = FastAPI(
     title="Recipe API",
     version="0.1.0",
-    description="An API to fetch, process, and store recipes from URLs."
+    description="An API to fetch, process, and store recipes from URLs.",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -47,10 +92,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.on_event("startup")
-async def startup_event():
-    logger.info("BACKEND (startup_event): Running startup tasks (e.g., create_db_and_tables).")
-    create_db_and_tables()
+# Compresses large API responses such as /getallrecipes. Responses that already carry a
+# Content-Encoding (the precompressed client assets), images and event streams pass through.
+app.add_middleware(GZipMiddleware, minimum_size=int(os.getenv("RESPONSE_GZIP_MIN_BYTES", "1024")), compresslevel=6)
+
 
 # --- Authentication Endpoints --- #
 
@@ -96,45 +141,142 @@ async def read_users_me(current_user: UserDB = Depends(get_current_active_user))
 
 class UrlRequest(BaseModel):
     url: HttpUrl
+    all_recipes: bool = False
+    force: bool = False # retry a URL even if it failed recently
+
+@app.post("/obtainrecipe", response_model=Union[RecipePydantic, List[RecipePydantic]])
+async def obtain_recipe_endpoint(request: UrlRequest, http_request: Request, current_user: UserDB = Depends(get_current_active_user), recipe_service: RecipeService = Depends(get_recipe_service)):
+    url_str = str(request.url)
+    deadline = deadline_for("obtainrecipe", current_user.tier)
+
+    async def extract():
+        # Recipes already stored (or pages that failed recently) are answered without a token or slot.
+        stored = recipe_service.stored_recipes(url=url_str, user_id=current_user.id, all_recipes=request.all_recipes, db_session_generator=get_db, force=request.force)
+        if stored is not None:
+            logger.info(f"Backend: Returning {len(stored)} stored recipe(s) for URL: {url_str}")
+            return stored if request.all_recipes else stored[0]
+        async with admission.slot(current_user.id):
+            if request.all_recipes:
+                recipes = await recipe_service.process_url_and_store_recipes(url=url_str, user_id=current_user.id, db_session_generator=get_db, force=request.force)
+                if not recipes:
+                    logger.warning(f"Backend: Failed to process recipes for URL: {url_str}")
+                    raise HTTPException(status_code=422, detail="Failed to process and store recipes. Check server logs for details.")
+                logger.info(f"Backend: Returning {len(recipes)} recipes for URL: {url_str}")
+                return recipes
+
+            db_recipe_pydantic = await recipe_service.process_url_and_store_recipe(
+                url=url_str, 
+                user_id=current_user.id, 
+                db_session_generator=get_db,
+                force=request.force
+            )
+
+            if db_recipe_pydantic is None:
+                logger.warning(f"Backend: Failed to process recipe for URL: {url_str}")
+                raise HTTPException(status_code=422, detail="Failed to process and store recipe. Check server logs for details.")
+            else:
+                logger.info(f"Backend: Successfully processed and returned recipe for URL: {url_str}")
+                return db_recipe_pydantic
 
-@app.post("/obtainrecipe", response_model=RecipePydantic)
-async def obtain_recipe_endpoint(request: UrlRequest, current_user: UserDB = Depends(get_current_active_user), recipe_service: RecipeService = Depends(RecipeService)):
     try:
         logger.info(f"Backend: Received request for URL: {request.url} by user {current_user.email}")
-        url_str = str(request.url)
-        db_recipe_pydantic = await recipe_service.process_url_and_store_recipe(
-            url=url_str, 
-            user_id=current_user.id, 
-            db_session_generator=get_db
-        )
-
-        if db_recipe_pydantic is None:
-            logger.warning(f"Backend: Failed to process recipe for URL: {url_str}")
-            raise HTTPException(status_code=422, detail="Failed to process and store recipe. Check server logs for details.")
-        else:
-            logger.info(f"Backend: Successfully processed and returned recipe for URL: {url_str}")
-            return db_recipe_pydantic
+        # The pipeline is cancelled if the client goes away; nobody would read the result.
+        with request_deadline(deadline):
+            return await cancel_on_disconnect(http_request, extract())
+    except ClientDisconnected:
+        logger.info(f"Backend: Client of {current_user.email} disconnected; cancelled extraction of {url_str}.")
+        return Response(status_code=499)  # Client Closed Request; never delivered
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=f"The request ran out of time in the {e.stage} stage. Try again later.", headers={"X-Deadline-Stage": e.stage})
     except HTTPException as http_exc: 
         raise http_exc
+    except CachedUrlFailure as cached:
+        raise HTTPException(
+            status_code=cached.policy.status_code,
+            detail=cached.message,
+            headers={"Retry-After": str(cached.retry_after), "X-Failure-Class": cached.failure_class},
+        )
+    except FetchDisallowed:
+        policy = FAILURE_POLICIES["robots_disallowed"]
+        raise HTTPException(status_code=policy.status_code, detail=policy.message, headers={"X-Failure-Class": "robots_disallowed"})
     except Exception as e:
         logger.error(f"Backend: An unexpected error occurred in /obtainrecipe endpoint: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
-@app.get("/getallrecipes", response_model=List[RecipePydantic])
+@app.post("/obtainrecipe/stream")
+async def obtain_recipe_stream_endpoint(request: UrlRequest, http_request: Request, current_user: UserDB = Depends(get_current_active_user), recipe_service: RecipeService = Depends(get_recipe_service)):
+    """Streams the extraction as Server-Sent Events: stage updates, partial recipes, then the stored recipe."""
+    url_str = str(request.url)
+    logger.info(f"Backend: Received streaming request for URL: {url_str} by user {current_user.email}")
+
+    # Recipes already stored (or pages that failed recently) are streamed without a token or slot.
+    stored_events = None
+    try:
+        stored = recipe_service.stored_recipes(url=url_str, user_id=current_user.id, db_session_generator=get_db, force=request.force)
+        if stored is not None:
+            stored_events = [("complete", stored[0].model_dump(mode="json"))]
+    except CachedUrlFailure as cached:
+        stored_events = [("error", {"detail": cached.message, "failure_class": cached.failure_class, "retry_after": cached.retry_after})]
+    if stored_events is None:
+        await admission.admit(current_user.id)
+    deadline = deadline_for("stream", current_user.tier)
+
+    async def pipeline_events():
+        if stored_events is not None:
+            for event, data in stored_events:
+                yield event, data
+            return
+        # The slot is taken inside the stream so a client that disconnects before streaming starts never holds one.
+        if admission.saturated():
+            yield "status", {"stage": "queued"}
+        try:
+            await admission.acquire()
+        except HTTPException as e:
+            yield "error", {"detail": e.detail, "retry_after": int(e.headers["Retry-After"])}
+            return
+        started = time.monotonic()
+        try:
+            with request_deadline(deadline):
+                async for event, data in recipe_service.stream_url_and_store_recipe(url=url_str, user_id=current_user.id, db_session_generator=get_db, force=request.force):
+                    yield event, data
+        finally:
+            admission.release(time.monotonic() - started)
+
+    async def event_stream():
+        try:
+            async for event, data in iterate_until_disconnected(http_request, pipeline_events()):
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        except ClientDisconnected:
+            logger.info(f"Backend: Client of {current_user.email} disconnected; cancelled streamed extraction of {url_str}.")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# The rows are serialised directly, so both media types are documented here rather than through response_model.
+@app.get("/getallrecipes", response_class=ORJSONResponse, responses={200: {
+    "model": List[RecipePydantic],
+    "description": "The user's recipes, as JSON or, with `Accept: application/msgpack`, as msgpack.",
+    "content": {MSGPACK_MEDIA_TYPE: {"schema": {"type": "array", "items": {"$ref": "#/components/schemas/Recipe"}}}},
+}})
 async def get_all_recipes_endpoint(
+    request: Request,
     current_user: UserDB = Depends(get_current_active_user), 
-    recipe_service: RecipeService = Depends(RecipeService)
+    recipe_service: RecipeService = Depends(get_recipe_service)
 ):
+    """Returns the user's library. Rows are serialised directly (orjson, or msgpack for `Accept: application/msgpack`)."""
     logger.info(f"Backend: Received request for /getallrecipes by user {current_user.email}")
     recipes = await recipe_service.get_all_recipes(user_id=current_user.id, db_session_generator=get_db) 
     if not recipes:
         logger.info(f"Backend: No recipes found for user {current_user.email} or error occurred.")
     else:
         logger.info(f"Backend: Returning {len(recipes)} recipes.")
-    return recipes
+    return negotiated_response(recipes, request)
 
 @app.delete("/deleterecipe/{recipe_id}", status_code=200)
-async def delete_recipe_endpoint(recipe_id: int, current_user: UserDB = Depends(get_current_active_user), service: RecipeService = Depends(RecipeService), db: Session = Depends(get_db)):
+async def delete_recipe_endpoint(recipe_id: int, current_user: UserDB = Depends(get_current_active_user), service: RecipeService = Depends(get_recipe_service), db: Session = Depends(get_db)):
     """Deletes a specific recipe by its ID, ensuring ownership."""
     user_email_for_logging = current_user.email  # Cache email
     logger.info(f"BACKEND: Received request to delete recipe with ID: {recipe_id} by user {user_email_for_logging}")
@@ -150,7 +292,7 @@ async def delete_recipe_endpoint(recipe_id: int, current_user: UserDB = Depends(
     return {"message": f"Recipe with ID {recipe_id} deleted successfully."}
 
 @app.put("/recipes/{recipe_id}", response_model=RecipePydantic)
-async def update_recipe_endpoint(recipe_id: int, recipe_data: RecipeUpdate, current_user: UserDB = Depends(get_current_active_user), service: RecipeService = Depends(RecipeService)):
+async def update_recipe_endpoint(recipe_id: int, recipe_data: RecipeUpdate, current_user: UserDB = Depends(get_current_active_user), service: RecipeService = Depends(get_recipe_service)):
     """Updates an existing recipe by its ID, ensuring ownership."""
     logger.info(f"BACKEND: Received request to update recipe ID: {recipe_id} by user {current_user.email} with data: {recipe_data.model_dump(exclude_unset=True)}")
     
@@ -164,17 +306,104 @@ async def update_recipe_endpoint(recipe_id: int, recipe_data: RecipeUpdate, curr
     logger.info(f"BACKEND: Successfully updated recipe ID {recipe_id} for user {current_user.email}.")
     return updated_recipe
 
+@app.get("/recipes/{recipe_id}/similar", response_model=List[SimilarRecipe])
+async def similar_recipes_endpoint(recipe_id: int, k: int = Query(10, ge=1, le=50), scope: str = Query("library", pattern="^(library|catalogue)$"), current_user: UserDB = Depends(get_current_active_user), service: RecipeService = Depends(get_recipe_service)):
+    """Returns the `k` recipes most similar to one of the user's, from their library or the shared catalogue."""
+    similar = await asyncio.to_thread(service.similar_recipes, recipe_id=recipe_id, user_id=current_user.id, k=k, scope=scope, db_session_generator=get_db)
+    if similar is None:
+        raise HTTPException(status_code=404, detail=f"Recipe with ID {recipe_id} not found.")
+    return similar
+
+@app.get("/recipes/export")
+async def export_recipes_endpoint(format: str = Query("ndjson", pattern="^(ndjson|zip)$"), current_user: UserDB = Depends(get_current_active_user)):
+    """Streams the user's library as NDJSON, or as a ZIP that also holds the stored images."""
+    logger.info(f"BACKEND: Exporting library of user {current_user.email} as {format}.")
+    if format == "zip":
+        body, media_type = export_zip(current_user.id), ZIP_MEDIA_TYPE
+    else:
+        body, media_type = export_ndjson(current_user.id), NDJSON_MEDIA_TYPE
+    return StreamingResponse(body, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="recipes.{format}"'})
+
+@app.post("/recipes/import")
+async def import_recipes_endpoint(file: UploadFile = File(...), current_user: UserDB = Depends(get_current_active_user)):
+    """Imports an NDJSON or ZIP export. Recipes already in the library are kept; invalid lines are reported."""
+    logger.info(f"BACKEND: Importing library file '{file.filename}' for user {current_user.email}.")
+    try:
+        return await asyncio.to_thread(import_library, file.file, current_user.id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # Health check endpoint (optional but good practice)
 @app.get("/health")
 async def health_check():
     logger.info("Health check endpoint was called.")
     return {"status": "healthy"}
 
+@app.get("/health/live")
+async def liveness_check():
+    """The process is up and serving requests; never depends on the warm-up."""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """200 once the database is migrated and the warm-up has finished, 503 until then."""
+    if not startup_report.ready:
+        return JSONResponse(status_code=503, content={"status": "starting", "database_ready": startup_report.database_ready, "warmup_done": startup_report.warmup_done})
+    return {"status": "ready"}
+
+@app.get("/health/startup")
+async def startup_timings():
+    """Import and initialisation time per component (app, database, agent, crawler)."""
+    return startup_report.snapshot()
+
+@app.get("/stats/extraction")
+async def extraction_stats():
+    """Reports how many requests each model tier of the extraction cascade handled."""
+    return cascade_stats.snapshot()
+
+@app.get("/stats/admission")
+async def admission_stats():
+    """Reports extraction queue depth, running pipelines, rejections and wait times."""
+    return admission.snapshot()
+
+@app.get("/stats/cancellation")
+async def cancellation_stats_endpoint():
+    """Reports extractions cancelled because the client disconnected, and pages kept for a retry."""
+    return cancellation_stats.snapshot()
+
+@app.get("/stats/deadlines")
+async def deadline_stats_endpoint():
+    """Reports per-stage runs, budget overruns, degraded runs and average time."""
+    return deadline_stats.snapshot()
+
+@app.get("/stats/templates")
+async def template_stats_endpoint():
+    """Reports per-domain template hits, fallbacks to the model, and templates learned or relearned."""
+    return template_stats.snapshot()
+
+@app.get("/stats/near-duplicates")
+async def near_duplicate_stats_endpoint():
+    """Reports pages fingerprinted, near-duplicate candidates compared, and extractions avoided by reusing a match."""
+    return near_duplicate_stats.snapshot()
+
+@app.get("/stats/fetch")
+async def fetch_stats():
+    """Reports page fetches, retries after 429/503 responses, and URLs skipped because of robots.txt."""
+    return fetch_scheduler.snapshot()
+
+@app.get("/images/{key:path}")
+async def get_image(key: str):
+    """Serves a stored image variant. Keys are content hashes, so responses never change and cache forever."""
+    image_path = image_path_for_key(key)
+    if image_path is None or not image_path.is_file():
+        raise HTTPException(status_code=404, detail="Image not found")
+    return FileResponse(image_path, headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
 # Determine the path to the 'client' directory
 # backend.py is in 'app' directory, client is sibling to 'app'
 CLIENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "client")
 
 # Mount static files. This should be added after all API routes
 # so that API routes are matched first.
-# html=True allows serving index.html for the root path '/'.
-app.mount("/", StaticFiles(directory=CLIENT_DIR, html=True), name="static_client_files")
+# The client is precompressed and fingerprinted once, when the module loads; '/' serves index.html.
+app.mount("/", PrecompressedStaticFiles(directory=CLIENT_DIR), name="static_client_files")
@@ -0,0 +1,114 @@
+"""Request-scoped cancellation: stop extraction work once the client that asked for it has gone.
+
+Starlette keeps running a handler after its client disconnects, so without this a closed tab
+still costs a full crawl and model call. The work runs alongside a task that waits for the ASGI
+`http.disconnect` message; whichever finishes first wins, and the loser is cancelled. Cancellation
+reaches the page fetch and the model call as ordinary asyncio cancellation, and the crawl4ai
+thread through `MarkdownConverter`.
+"""
+import asyncio
+import os
+from contextlib import suppress
+from dataclasses import asdict, dataclass
+from typing import AsyncIterator, Awaitable, TypeVar
+
+from fastapi import Request
+
+CANCEL_ON_DISCONNECT = os.getenv("CANCEL_ON_DISCONNECT", "true").lower() in ("1", "true", "yes")
+KEEP_PARTIAL_ON_CANCEL = os.getenv("KEEP_PARTIAL_ON_CANCEL", "true").lower() in ("1", "true", "yes")
+PARTIAL_PAGE_TTL_SECONDS = float(os.getenv("PARTIAL_PAGE_TTL_SECONDS", "900"))
+
+T = TypeVar("T")
+
+
+@dataclass
+class CancellationStats:
+    cancelled_requests: int = 0
+    cancelled_streams: int = 0
+    partial_pages_kept: int = 0
+    partial_pages_resumed: int = 0
+
+    def snapshot(self) -> dict:
+        return {"enabled": CANCEL_ON_DISCONNECT, "keep_partial": KEEP_PARTIAL_ON_CANCEL, **asdict(self)}
+
+
+cancellation_stats = CancellationStats()
+
+
+class ClientDisconnected(Exception):
+    """Raised when the client went away and the work on its behalf was cancelled."""
+
+
+async def _wait_for_disconnect(request: Request):
+    # The body has been read by now, so the next message is the disconnect.
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def _cancel(task: asyncio.Future):
+    # Waits for the cancelled work to unwind, so its locks and admission slot are released first.
+    task.cancel()
+    with suppress(asyncio.CancelledError):
+        await task
+
+
+async def cancel_on_disconnect(request: Request, work: Awaitable[T]) -> T:
+    """Awaits `work`, cancelling it and raising ClientDisconnected if the client disconnects first."""
+    if not CANCEL_ON_DISCONNECT:
+        return await work
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if task.done():
+            return task.result()
+        await _cancel(task)
+        cancellation_stats.cancelled_requests += 1
+        raise ClientDisconnected()
+    finally:
+        watcher.cancel()
+        if not task.done():
+            await _cancel(task)
+
+
+async def iterate_until_disconnected(request: Request, events: AsyncIterator[T]) -> AsyncIterator[T]:
+    """Re-yields `events`, cancelling them and raising ClientDisconnected if the client disconnects.
+
+    StreamingResponse only notices a disconnect when it next sends, which can be minutes away
+    while a page is crawled or the model runs; this notices it straight away. `events` is driven
+    by a single task, so timeouts and context variables set inside it behave as in a plain loop.
+    """
+    if not CANCEL_ON_DISCONNECT:
+        async for item in events:
+            yield item
+        return
+    queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+
+    async def pump():
+        async for item in events:
+            await queue.put(item)
+
+    producer = asyncio.ensure_future(pump())
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            await asyncio.wait({getter, producer, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield getter.result()
+                continue
+            getter.cancel()
+            if producer.done():
+                producer.result()  # re-raises what the events raised
+                while not queue.empty():
+                    yield queue.get_nowait()
+                return
+            await _cancel(producer)
+            cancellation_stats.cancelled_streams += 1
+            raise ClientDisconnected()
+    finally:
+        watcher.cancel()
+        if not producer.done():
+            await _cancel(producer)
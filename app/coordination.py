@@ -0,0 +1,256 @@
+"""Coordination shared by every worker process: locks, a key/value cache and rate-limit buckets.
+
+With several uvicorn workers each process has its own memory, so anything that must hold across
+workers (one extraction per URL at a time, per-user rate limits, cached robots.txt files) goes
+through a backend here. `SqliteCoordination` keeps the state in a small WAL-mode SQLite file that
+all workers on the host open; `InMemoryCoordination` is for a single process and for tests.
+"""
+import abc
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from .utils.logger_config import get_app_logger
+
+logger = get_app_logger(__name__)
+
+COORDINATION_BACKEND = os.getenv("COORDINATION_BACKEND", "sqlite").lower()
+COORDINATION_DB_PATH = Path(os.getenv("COORDINATION_DB_PATH", Path(__file__).resolve().parent / "database" / "coordination.db"))
+LOCK_POLL_SECONDS = 0.2
+PRUNE_EVERY_OPERATIONS = 500
+
+
+@dataclass
+class TokenBucket:
+    capacity: float
+    refill_per_second: float
+    tokens: float
+    updated: float = field(default_factory=time.time)
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + max(0.0, now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def take(self, now: Optional[float] = None) -> Tuple[bool, float]:
+        """Takes one token. Returns (allowed, seconds until a token is available)."""
+        self._refill(time.time() if now is None else now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True, 0.0
+        if self.refill_per_second <= 0:
+            return False, 60.0
+        return False, (1 - self.tokens) / self.refill_per_second
+
+    def seconds_until_full(self) -> float:
+        return (self.capacity - self.tokens) / self.refill_per_second if self.refill_per_second > 0 else 0.0
+
+
+@dataclass
+class Lease:
+    name: str
+    owner: str
+    acquired: bool  # False when waiting timed out and the caller went ahead without the lock
+    waited: bool  # True when another holder had the lock first
+
+
+class CoordinationBackend(abc.ABC):
+    """Interface of a coordination backend. Methods are synchronous and may block; call them from the event loop through asyncio.to_thread."""
+
+    @abc.abstractmethod
+    def acquire_lock(self, name: str, owner: str, ttl: float) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def release_lock(self, name: str, owner: str):
+        ...
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Any:
+        ...
+
+    @abc.abstractmethod
+    def set(self, key: str, value: Any, ttl: float):
+        ...
+
+    @abc.abstractmethod
+    def delete(self, key: str):
+        ...
+
+    @abc.abstractmethod
+    def take_token(self, key: str, capacity: float, refill_per_second: float) -> Tuple[bool, float]:
+        """Takes one token from a shared bucket. Returns (allowed, seconds until a token is available)."""
+        ...
+
+    @asynccontextmanager
+    async def single_flight(self, name: str, ttl: float, wait: float):
+        """Holds the lock `name` for the block, waiting up to `wait` seconds for another holder.
+
+        The lock expires after `ttl` seconds so a crashed worker never blocks others for good. If the
+        wait times out the block still runs, unlocked (`lease.acquired` is False): duplicated work
+        is better than a failed request.
+        """
+        owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+        deadline = time.monotonic() + wait
+        waited = False
+        acquired = await asyncio.to_thread(self.acquire_lock, name, owner, ttl)
+        while not acquired and time.monotonic() < deadline:
+            waited = True
+            await asyncio.sleep(LOCK_POLL_SECONDS)
+            acquired = await asyncio.to_thread(self.acquire_lock, name, owner, ttl)
+        if not acquired:
+            logger.warning(f"Gave up waiting {wait}s for lock '{name}'; continuing without it.")
+        try:
+            yield Lease(name, owner, acquired, waited)
+        finally:
+            if acquired:
+                await asyncio.to_thread(self.release_lock, name, owner)
+
+
+class InMemoryCoordination(CoordinationBackend):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks: Dict[str, Tuple[str, float]] = {}
+        self._values: Dict[str, Tuple[Any, float]] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def acquire_lock(self, name: str, owner: str, ttl: float) -> bool:
+        with self._lock:
+            now = time.time()
+            current = self._locks.get(name)
+            if current is not None and current[1] > now and current[0] != owner:
+                return False
+            self._locks[name] = (owner, now + ttl)
+            return True
+
+    def release_lock(self, name: str, owner: str):
+        with self._lock:
+            if self._locks.get(name, (None,))[0] == owner:
+                del self._locks[name]
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            value, expires_at = self._values.get(key, (None, 0.0))
+            return value if expires_at > time.time() else None
+
+    def set(self, key: str, value: Any, ttl: float):
+        with self._lock:
+            self._values[key] = (value, time.time() + ttl)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def take_token(self, key: str, capacity: float, refill_per_second: float) -> Tuple[bool, float]:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(capacity, refill_per_second, tokens=capacity)
+            return bucket.take()
+
+
+class SqliteCoordination(CoordinationBackend):
+    """Coordination state in a SQLite file shared by the worker processes of one host.
+
+    Every write runs in a BEGIN IMMEDIATE transaction, so check-and-set operations (taking a lock,
+    a rate-limit token) are atomic across processes. Expired rows are pruned periodically.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS locks (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL);
+        CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL);
+        CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, expires_at REAL NOT NULL);
+    """
+
+    def __init__(self, path: Path = COORDINATION_DB_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._operations = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # Opened on first use so importing the app never touches the file.
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(self.SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+                self._operations += 1
+                if self._operations % PRUNE_EVERY_OPERATIONS == 0:
+                    now = time.time()
+                    for table in ("locks", "cache", "buckets"):
+                        connection.execute(f"DELETE FROM {table} WHERE expires_at <= ?", (now,))
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+    def acquire_lock(self, name: str, owner: str, ttl: float) -> bool:
+        with self._transaction() as connection:
+            now = time.time()
+            connection.execute("DELETE FROM locks WHERE name = ? AND expires_at <= ?", (name, now))
+            cursor = connection.execute("INSERT OR IGNORE INTO locks (name, owner, expires_at) VALUES (?, ?, ?)", (name, owner, now + ttl))
+            return cursor.rowcount == 1
+
+    def release_lock(self, name: str, owner: str):
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM locks WHERE name = ? AND owner = ?", (name, owner))
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            row = self._connect().execute("SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any, ttl: float):
+        with self._transaction() as connection:
+            connection.execute("INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)", (key, json.dumps(value), time.time() + ttl))
+
+    def delete(self, key: str):
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def take_token(self, key: str, capacity: float, refill_per_second: float) -> Tuple[bool, float]:
+        with self._transaction() as connection:
+            now = time.time()
+            row = connection.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+            bucket = TokenBucket(capacity, refill_per_second, tokens=row[0] if row else capacity, updated=row[1] if row else now)
+            result = bucket.take(now)
+            connection.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated_at, expires_at) VALUES (?, ?, ?, ?)",
+                (key, bucket.tokens, bucket.updated, now + bucket.seconds_until_full() + 1),
+            )
+            return result
+
+
+_coordination: Optional[CoordinationBackend] = None
+
+
+def get_coordination() -> CoordinationBackend:
+    """The process-wide backend chosen by COORDINATION_BACKEND ('sqlite', the default, or 'memory')."""
+    global _coordination
+    if _coordination is None:
+        if COORDINATION_BACKEND == "memory":
+            _coordination = InMemoryCoordination()
+        elif COORDINATION_BACKEND == "sqlite":
+            _coordination = SqliteCoordination()
+        else:
+            raise ValueError(f"Unsupported COORDINATION_BACKEND: '{COORDINATION_BACKEND}'. Choose 'sqlite' or 'memory'.")
+    return _coordination
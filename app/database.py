@@ -1,11 +1,16 @@
-from sqlalchemy import create_engine, Column, Integer, String, JSON, Boolean, ForeignKey
+from sqlalchemy import create_engine, inspect, text, case, func, or_, Column, Index, Integer, String, JSON, Boolean, DateTime, ForeignKey
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session, relationship
-from typing import List
+from typing import Dict, Iterator, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit
 from pathlib import Path
 import os
 
 from .models.recipe import Recipe as RecipePydantic
+from .near_duplicates import format_signature, signature_bands
+from .similar_recipes import similar_index
 from .utils.logger_config import get_app_logger
 
 logger = get_app_logger(__name__)
@@ -33,24 +38,208 @@ class UserDB(Base):
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
     is_active = Column(Boolean, default=True)
+    tier = Column(String, default="standard")  # free, standard or premium; scales request deadlines
 
     recipes = relationship("RecipeDB", back_populates="owner")
 
+class CanonicalRecipeDB(Base):
+    """The extraction result for one source URL, shared by every user who imports that page."""
+    __tablename__ = "canonical_recipes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    source_url = Column(String, nullable=False, unique=True, index=True)
+    name = Column(String)
+    ingredients = Column(JSON(none_as_null=True))
+    instructions = Column(JSON(none_as_null=True))
+    image_url = Column(String, nullable=True)
+    image_variants = Column(JSON(none_as_null=True), nullable=True)
+    html_sha256 = Column(String, nullable=True) # keys into the page archive (app/page_archive.py)
+    markdown_sha256 = Column(String, nullable=True)
+    extraction_model = Column(String, nullable=True, index=True) # model tier(s) configured when the recipe was extracted
+    content_signature = Column(String, nullable=True) # MinHash of the page's Markdown, hex (app/near_duplicates.py)
+    created_at = Column(DateTime, nullable=True, default=lambda: datetime.now(timezone.utc), index=True)
+    updated_at = Column(DateTime, nullable=True, index=True) # last re-extraction that changed the recipe
+
+    links = relationship("RecipeDB", back_populates="canonical")
+    signature_bands = relationship("SignatureBandDB", cascade="all, delete-orphan")
+
+OVERRIDABLE_FIELDS = ("name", "ingredients", "instructions", "image_url")
+CLEARABLE_FIELDS = ("image_url",)
+# Stored in a clearable override column when the user removed the value, since NULL means "no override".
+CLEARED = ""
+
+def _with_override(field_name: str) -> property:
+    def getter(self):
+        override = getattr(self, f"{field_name}_override")
+        if override is not None or self.canonical is None:
+            return None if override == CLEARED else override
+        return getattr(self.canonical, field_name)
+
+    def setter(self, value):
+        if value is None and field_name in CLEARABLE_FIELDS:
+            value = CLEARED
+        setattr(self, f"{field_name}_override", value)
+
+    return property(getter, setter)
+
 class RecipeDB(Base):
+    """A recipe in one user's library: a link to the shared canonical recipe plus the user's own edits.
+
+    Override columns stay NULL until the user edits that field (copy-on-write), so re-extracting
+    the canonical recipe updates every library that has not changed it. The `name`, `ingredients`,
+    `instructions`, `image_url` and `image_variants` properties return the effective values and
+    write overrides when assigned; assigning None to `image_url` stores CLEARED, so the recipe
+    keeps no image instead of falling back to the canonical one. A recipe with no canonical recipe (one the user imported) holds
+    all of its fields in the override columns and is never shown to other users.
+    """
     __tablename__ = "recipes"
+    __table_args__ = (Index("uq_recipes_user_source_url", "user_id", "source_url", unique=True),)
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, index=True)
-    source_url = Column(String, nullable=False, unique=True, index=True) 
-    ingredients = Column(JSON)  
-    instructions = Column(JSON) 
-    image_url = Column(String, nullable=True)
+    source_url = Column(String, nullable=False, index=True)
+    canonical_id = Column(Integer, ForeignKey("canonical_recipes.id"), nullable=True, index=True)
+    name_override = Column("name", String, index=True)
+    ingredients_override = Column("ingredients", JSON(none_as_null=True))
+    instructions_override = Column("instructions", JSON(none_as_null=True))
+    image_url_override = Column("image_url", String, nullable=True)
+    image_variants_override = Column("image_variants", JSON(none_as_null=True), nullable=True) # variants of image_url_override
+    created_at = Column(DateTime, nullable=True, default=lambda: datetime.now(timezone.utc), index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
 
     owner = relationship("UserDB", back_populates="recipes")
+    canonical = relationship("CanonicalRecipeDB", back_populates="links", lazy="joined")
+
+    name = _with_override("name")
+    ingredients = _with_override("ingredients")
+    instructions = _with_override("instructions")
+    image_url = _with_override("image_url")
+
+    @property
+    def image_variants(self):
+        if self.image_url_override is not None or self.canonical is None:
+            return self.image_variants_override
+        return self.canonical.image_variants
+
+    @image_variants.setter
+    def image_variants(self, value):
+        self.image_variants_override = value
+
+class UrlFailureDB(Base):
+    """A page that recently failed to yield a recipe, so retries fail fast until `expires_at`."""
+    __tablename__ = "url_failures"
+
+    id = Column(Integer, primary_key=True, index=True)
+    url = Column(String, nullable=False, unique=True, index=True) # canonical page URL (app/negative_cache.py)
+    failure_class = Column(String, nullable=False)
+    detail = Column(String, nullable=True)
+    failures = Column(Integer, nullable=False, default=1)
+    last_failed_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class DomainTemplateDB(Base):
+    """Selectors learned for one site's recipe pages (app/domain_templates.py)."""
+    __tablename__ = "domain_templates"
 
-def create_db_and_tables():
-    Base.metadata.create_all(bind=engine)
+    id = Column(Integer, primary_key=True, index=True)
+    domain = Column(String, nullable=False, unique=True, index=True)
+    selectors = Column(JSON, nullable=False)
+    learned_from = Column(String, nullable=True) # the page whose model extraction it was verified against
+    learned_at = Column(DateTime, nullable=False)
+
+class SignatureBandDB(Base):
+    """One band of a canonical recipe's content_signature; the index that finds near-duplicate pages."""
+    __tablename__ = "signature_bands"
+
+    id = Column(Integer, primary_key=True)
+    band = Column(Integer, nullable=False, index=True) # band position and hashed values (near_duplicates.signature_bands)
+    canonical_id = Column(Integer, ForeignKey("canonical_recipes.id"), nullable=False, index=True)
+
+def _ensure_columns(bind):
+    """Adds columns introduced after a table was first created; create_all only creates missing tables."""
+    inspector = inspect(bind)
+    with bind.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=bind.dialect)
+                    logger.info(f"Adding missing column {table.name}.{column.name} ({column_type}).")
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'))
+
+def _ensure_indexes(bind):
+    """Creates missing indexes and recreates those whose uniqueness changed (e.g. recipes.source_url)."""
+    inspector = inspect(bind)
+    with bind.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing = {index["name"]: index for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                current = existing.get(index.name)
+                if current is not None and bool(current["unique"]) == bool(index.unique):
+                    continue
+                if current is not None:
+                    logger.info(f"Recreating index {index.name} (unique={bool(index.unique)}).")
+                    connection.execute(text(f'DROP INDEX "{index.name}"'))
+                index.create(connection)
+
+def _migrate_recipes_to_canonical(bind):
+    """Moves recipes stored before the shared store existed into canonical rows. Runs only when
+    the canonical_recipes table is first created: later rows without one are private imports.
+
+    The first row for each URL becomes the canonical recipe; every row is linked to it and keeps
+    only the fields that differ as overrides.
+    """
+    with Session(bind=bind) as db:
+        legacy = db.query(RecipeDB).filter(RecipeDB.canonical_id.is_(None)).order_by(RecipeDB.id).all()
+        if not legacy:
+            return
+        legacy_columns = {column["name"] for column in inspect(bind).get_columns("recipes")}
+        page_columns = [c for c in ("html_sha256", "markdown_sha256", "extraction_model") if c in legacy_columns]
+        page_values = {}
+        if page_columns:
+            for row in db.execute(text(f"SELECT id, {', '.join(page_columns)} FROM recipes")):
+                page_values[row[0]] = dict(zip(page_columns, row[1:]))
+
+        canonicals = {}
+        for link in legacy:
+            canonical = canonicals.get(link.source_url) or get_canonical_recipe_by_url(db, link.source_url)
+            if canonical is None:
+                canonical = CanonicalRecipeDB(
+                    source_url=link.source_url,
+                    name=link.name_override,
+                    ingredients=link.ingredients_override or [],
+                    instructions=link.instructions_override or [],
+                    image_url=link.image_url_override,
+                    image_variants=link.image_variants_override,
+                    created_at=link.created_at,
+                    **page_values.get(link.id, {}),
+                )
+                db.add(canonical)
+                canonicals[link.source_url] = canonical
+            link.canonical = canonical
+            for field_name in OVERRIDABLE_FIELDS:
+                if getattr(link, f"{field_name}_override") == getattr(canonical, field_name):
+                    setattr(link, f"{field_name}_override", None)
+            if link.image_url_override is None:
+                link.image_variants_override = None
+        db.commit()
+        logger.info(f"Linked {len(legacy)} recipes to {len(canonicals)} new canonical recipes.")
+
+def _clear_json_nulls(bind):
+    """Turns JSON `null` values, which canonical columns stored before they were none_as_null, into SQL NULL."""
+    with bind.begin() as connection:
+        for column in ("ingredients", "instructions", "image_variants"):
+            connection.execute(text(f"UPDATE canonical_recipes SET {column} = NULL WHERE {column} = 'null'"))
+
+def create_db_and_tables(bind=engine):
+    before_canonical_store = not inspect(bind).has_table(CanonicalRecipeDB.__tablename__)
+    Base.metadata.create_all(bind=bind)
+    _ensure_columns(bind)
+    _ensure_indexes(bind)
+    _clear_json_nulls(bind)
+    if before_canonical_store:
+        _migrate_recipes_to_canonical(bind)
 
 def get_db():
     db = SessionLocal()
@@ -59,31 +248,277 @@ def get_db():
     finally:
         db.close()
 
-def add_recipe_to_db(db: Session, recipe_data: RecipePydantic, source_url: str, user_id: int):
-    db_recipe = RecipeDB(
-        name=recipe_data.name,
-        source_url=source_url, 
-        ingredients=recipe_data.ingredients, 
-        instructions=recipe_data.instructions, 
-        image_url=str(recipe_data.image_url) if recipe_data.image_url else None,
-        user_id=user_id
-    )
-    db.add(db_recipe)
+def get_canonical_recipe_by_url(db: Session, url: str) -> CanonicalRecipeDB | None:
+    """Fetches the shared extraction result for a source URL, whoever imported it first."""
+    return db.query(CanonicalRecipeDB).filter(CanonicalRecipeDB.source_url == url).first()
+
+def get_canonical_recipes_by_url_prefix(db: Session, prefix: str) -> List[CanonicalRecipeDB]:
+    """Fetches the canonical recipes whose source_url starts with `prefix`, e.g. all anchors of one page."""
+    return db.query(CanonicalRecipeDB).filter(CanonicalRecipeDB.source_url.startswith(prefix, autoescape=True)).order_by(CanonicalRecipeDB.id).all()
+
+def add_canonical_recipes(db: Session, recipes_with_urls: List[Tuple[RecipePydantic, str]], html_sha256: str | None = None, markdown_sha256: str | None = None, extraction_model: str | None = None, content_signature: List[int] | None = None) -> List[CanonicalRecipeDB]:
+    """Stores extraction results from one page. If another request stored a URL first, its row is reused."""
+    bands = signature_bands(content_signature) if content_signature else []
+    canonicals = [
+        CanonicalRecipeDB(
+            name=recipe_data.name,
+            source_url=source_url,
+            ingredients=recipe_data.ingredients,
+            instructions=recipe_data.instructions,
+            image_url=str(recipe_data.image_url) if recipe_data.image_url else None,
+            html_sha256=html_sha256,
+            markdown_sha256=markdown_sha256,
+            extraction_model=extraction_model,
+            content_signature=format_signature(content_signature) if content_signature else None,
+            signature_bands=[SignatureBandDB(band=band) for band in bands]
+        )
+        for recipe_data, source_url in recipes_with_urls
+    ]
+    db.add_all(canonicals)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        logger.info("Canonical recipes were stored concurrently by another request; reusing them.")
+        canonicals = [get_canonical_recipe_by_url(db, source_url) or c for c, (_, source_url) in zip(canonicals, recipes_with_urls)]
+        db.add_all(c for c in canonicals if c.id is None)
+        db.commit()
+    if similar_index is not None:
+        similar_index.enqueue(canonicals)
+    return canonicals
+
+def link_recipes_for_user(db: Session, canonicals: List[CanonicalRecipeDB], user_id: int) -> List[RecipeDB]:
+    """Adds canonical recipes to a user's library, reusing links the user already has."""
+    links = []
+    for canonical in canonicals:
+        link = get_recipe_by_url(db, url=canonical.source_url, user_id=user_id)
+        if link is None:
+            link = RecipeDB(source_url=canonical.source_url, canonical=canonical, user_id=user_id)
+            db.add(link)
+        links.append(link)
+    db.commit()
+    for link in links:
+        db.refresh(link)
+    return links
+
+def add_recipe_to_db(db: Session, recipe_data: RecipePydantic, source_url: str, user_id: int, html_sha256: str | None = None, markdown_sha256: str | None = None, extraction_model: str | None = None, content_signature: List[int] | None = None) -> RecipeDB:
+    """Stores a newly extracted recipe in the shared store and links it to the user's library."""
+    canonicals = add_canonical_recipes(db, [(recipe_data, source_url)], html_sha256, markdown_sha256, extraction_model, content_signature)
+    return link_recipes_for_user(db, canonicals, user_id)[0]
+
+def add_recipes_to_db(db: Session, recipes_with_urls: List[Tuple[RecipePydantic, str]], user_id: int, html_sha256: str | None = None, markdown_sha256: str | None = None, extraction_model: str | None = None, content_signature: List[int] | None = None) -> List[RecipeDB]:
+    """Stores several recipes from one page in the shared store and links them to the user's library."""
+    canonicals = add_canonical_recipes(db, recipes_with_urls, html_sha256, markdown_sha256, extraction_model, content_signature)
+    return link_recipes_for_user(db, canonicals, user_id)
+
+def import_recipes_for_user(db: Session, records: List[dict], user_id: int) -> Tuple[int, int]:
+    """Adds exported recipes to a user's library in one transaction. Returns (imported, already in the library).
+
+    Uploaded content is never written to the shared store, since other users would then receive
+    it for that URL. A URL that is already there is linked to its canonical recipe, and any
+    imported fields that differ become the user's overrides. A new URL is stored as a private
+    recipe with no canonical recipe; extracting the page later creates the shared one as usual.
+    """
+    urls = [record["source_url"] for record in records]
+    for attempt in range(2):
+        try:
+            existing_links = {url for (url,) in db.query(RecipeDB.source_url).filter(RecipeDB.user_id == user_id, RecipeDB.source_url.in_(urls))}
+            canonicals = {c.source_url: c for c in db.query(CanonicalRecipeDB).filter(CanonicalRecipeDB.source_url.in_(urls))}
+            imported = present = 0
+            for record in records:
+                url = record["source_url"]
+                if url in existing_links:
+                    present += 1
+                    continue
+                link = RecipeDB(source_url=url, user_id=user_id, canonical=canonicals.get(url))
+                for field_name in OVERRIDABLE_FIELDS:
+                    if link.canonical is None or record[field_name] != getattr(link.canonical, field_name):
+                        setattr(link, field_name, record[field_name])
+                if link.image_url_override is not None or link.canonical is None:
+                    link.image_variants_override = record.get("image_variants")
+                db.add(link)
+                existing_links.add(url)
+                imported += 1
+            db.commit()
+            return imported, present
+        except IntegrityError:
+            # Another request added one of these URLs to the library meanwhile; the retry counts it as present.
+            db.rollback()
+            if attempt:
+                raise
+
+def set_canonical_image_variants(db: Session, canonical_id: int, image_url: str, variants: dict) -> bool:
+    """Records image variants on a shared recipe, unless its image changed while they were being built."""
+    canonical = db.query(CanonicalRecipeDB).filter(CanonicalRecipeDB.id == canonical_id).first()
+    if not canonical or canonical.image_url != image_url:
+        return False
+    canonical.image_variants = variants
     db.commit()
-    db.refresh(db_recipe)
-    return db_recipe
+    return True
+
+def set_recipe_image_variants(db: Session, recipe_id: int, image_url: str, variants: dict) -> bool:
+    """Records variants for a user's own image, unless it changed while they were being built."""
+    db_recipe = db.query(RecipeDB).filter(RecipeDB.id == recipe_id).first()
+    if not db_recipe or db_recipe.image_url_override != image_url:
+        return False
+    db_recipe.image_variants_override = variants
+    db.commit()
+    return True
+
+def get_image_variants_for_url(db: Session, image_url: str) -> dict | None:
+    """Returns variants already built for this image URL by any recipe, so the image is downloaded once."""
+    canonical = db.query(CanonicalRecipeDB).filter(CanonicalRecipeDB.image_url == image_url, CanonicalRecipeDB.image_variants.isnot(None)).first()
+    if canonical:
+        return canonical.image_variants
+    db_recipe = db.query(RecipeDB).filter(RecipeDB.image_url_override == image_url, RecipeDB.image_variants_override.isnot(None)).first()
+    return db_recipe.image_variants_override if db_recipe else None
 
-def get_recipe_by_url(db: Session, url: str) -> RecipeDB | None:
-    """Fetches a recipe from the database by its source_url."""
-    return db.query(RecipeDB).filter(RecipeDB.source_url == url).first()
+def get_recipe_by_url(db: Session, url: str, user_id: int) -> RecipeDB | None:
+    """Fetches the user's library entry for a source_url."""
+    return db.query(RecipeDB).filter(RecipeDB.user_id == user_id, RecipeDB.source_url == url).first()
 
 def get_all_recipes_from_db(db: Session, user_id: int) -> List[RecipeDB]:
     """Fetches all recipes for a specific user from the database."""
     logger.info(f"Fetching all recipes from database for user_id: {user_id}")
     return db.query(RecipeDB).filter(RecipeDB.user_id == user_id).all()
 
+RECIPE_ROW_COLUMNS = ("id", "name", "ingredients", "instructions", "image_url", "source_url", "image_variants")
+
+def get_recipe_rows_for_user(db: Session, user_id: int) -> List[dict]:
+    """Fetches a user's recipes as plain dicts, selecting only the response columns.
+
+    Overrides are resolved against the canonical recipe in SQL. No ORM objects are built and the
+    JSON columns arrive already decoded, so the rows can be serialised directly.
+    """
+    return [dict(zip(RECIPE_ROW_COLUMNS, row)) for row in _recipe_rows_query(db, user_id).all()]
+
+def iter_recipe_rows_for_user(db: Session, user_id: int, batch_size: int = 500) -> Iterator[dict]:
+    """Same rows as get_recipe_rows_for_user, read from the cursor `batch_size` rows at a time."""
+    for row in _recipe_rows_query(db, user_id).yield_per(batch_size):
+        yield dict(zip(RECIPE_ROW_COLUMNS, row))
+
+def _recipe_rows_query(db: Session, user_id: int):
+    canonical = CanonicalRecipeDB
+    columns = [
+        RecipeDB.id,
+        func.coalesce(RecipeDB.name_override, canonical.name),
+        func.coalesce(RecipeDB.ingredients_override, canonical.ingredients, type_=JSON),
+        func.coalesce(RecipeDB.instructions_override, canonical.instructions, type_=JSON),
+        func.nullif(func.coalesce(RecipeDB.image_url_override, canonical.image_url), CLEARED),
+        RecipeDB.source_url,
+        case((or_(RecipeDB.image_url_override.isnot(None), RecipeDB.canonical_id.is_(None)), RecipeDB.image_variants_override), else_=canonical.image_variants),
+    ]
+    return db.query(*columns).outerjoin(canonical, RecipeDB.canonical_id == canonical.id).filter(RecipeDB.user_id == user_id).order_by(RecipeDB.id)
+
+def _matches_domain(source_url: str, domain: str) -> bool:
+    host = (urlsplit(source_url).hostname or "").lower()
+    domain = domain.lower().removeprefix("www.")
+    return host == domain or host.endswith(f".{domain}")
+
+def get_recipes_for_reextraction(db: Session, user_id: Optional[int] = None, domain: Optional[str] = None, since: Optional[datetime] = None, until: Optional[datetime] = None, model: Optional[str] = None, limit: Optional[int] = None) -> List[CanonicalRecipeDB]:
+    """Selects canonical recipes for bulk re-extraction. `model` matches part of extraction_model; 'unknown' selects rows without one."""
+    query = db.query(CanonicalRecipeDB)
+    if user_id is not None:
+        query = query.filter(CanonicalRecipeDB.links.any(RecipeDB.user_id == user_id))
+    if domain:
+        query = query.filter(CanonicalRecipeDB.source_url.contains(domain.lower().removeprefix("www."), autoescape=True))
+    if since is not None:
+        query = query.filter(CanonicalRecipeDB.created_at >= since)
+    if until is not None:
+        query = query.filter(CanonicalRecipeDB.created_at < until)
+    if model == "unknown":
+        query = query.filter(CanonicalRecipeDB.extraction_model.is_(None))
+    elif model:
+        query = query.filter(CanonicalRecipeDB.extraction_model.contains(model, autoescape=True))
+    recipes = query.order_by(CanonicalRecipeDB.id).all()
+    if domain:
+        recipes = [r for r in recipes if _matches_domain(r.source_url, domain)]
+    return recipes[:limit] if limit else recipes
+
+def _utcnow() -> datetime:
+    # SQLite drops time zones, so failure timestamps are stored and compared as naive UTC.
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def get_active_url_failure(db: Session, url: str) -> UrlFailureDB | None:
+    """Returns the recorded failure for a canonical URL while it has not expired."""
+    return db.query(UrlFailureDB).filter(UrlFailureDB.url == url, UrlFailureDB.expires_at > _utcnow()).first()
+
+def record_url_failure(db: Session, url: str, failure_class: str, detail: str | None, ttl_seconds: float) -> UrlFailureDB:
+    failure = db.query(UrlFailureDB).filter(UrlFailureDB.url == url).first()
+    now = _utcnow()
+    if failure is None:
+        failure = UrlFailureDB(url=url, failures=0)
+        db.add(failure)
+    failure.failure_class = failure_class
+    failure.detail = detail
+    failure.failures += 1
+    failure.last_failed_at = now
+    failure.expires_at = now + timedelta(seconds=ttl_seconds)
+    db.commit()
+    return failure
+
+def clear_url_failure(db: Session, url: str):
+    if db.query(UrlFailureDB).filter(UrlFailureDB.url == url).delete():
+        db.commit()
+
+def replace_signature_bands(db: Session, bands_by_canonical_id: Dict[int, List[int]]):
+    """Replaces the band keys of canonical recipes whose page was processed again; the caller commits."""
+    db.query(SignatureBandDB).filter(SignatureBandDB.canonical_id.in_(list(bands_by_canonical_id))).delete(synchronize_session=False)
+    db.add_all(SignatureBandDB(band=band, canonical_id=canonical_id) for canonical_id, bands in bands_by_canonical_id.items() for band in bands)
+
+def get_canonical_recipes_sharing_bands(db: Session, bands: List[int]) -> List[CanonicalRecipeDB]:
+    """Canonical recipes whose page signature shares at least one band with `bands`: the near-duplicate candidates."""
+    matching = db.query(SignatureBandDB.canonical_id).filter(SignatureBandDB.band.in_(bands))
+    return db.query(CanonicalRecipeDB).filter(CanonicalRecipeDB.id.in_(matching.scalar_subquery())).order_by(CanonicalRecipeDB.id).all()
+
+def sync_similar_index(db: Session, batch_size: int = 5000):
+    """Indexes canonical recipes stored or re-extracted since the index last looked (by other workers and the CLIs, or all of them on first run)."""
+    if similar_index is None or not similar_index.loaded:
+        return
+    columns = (CanonicalRecipeDB.id, CanonicalRecipeDB.name, CanonicalRecipeDB.ingredients, CanonicalRecipeDB.updated_at)
+    while True:
+        rows = db.query(*columns).filter(CanonicalRecipeDB.id > similar_index.synced_through).order_by(CanonicalRecipeDB.id).limit(batch_size).all()
+        if not rows:
+            break
+        similar_index.add(rows, synced=True)
+    updated = db.query(*columns).filter(CanonicalRecipeDB.updated_at.isnot(None))
+    if similar_index.updated_through is not None:
+        updated = updated.filter(CanonicalRecipeDB.updated_at > similar_index.updated_through)
+    similar_index.replace(updated.order_by(CanonicalRecipeDB.updated_at).all(), synced=True)
+
+def load_similar_index():
+    """Reads the saved similar-recipes index and brings it up to date with the database."""
+    if similar_index is None:
+        return
+    similar_index.load()
+    db = SessionLocal()
+    try:
+        sync_similar_index(db)
+    finally:
+        db.close()
+    similar_index.save()
+
+def get_canonical_ids_for_user(db: Session, user_id: int) -> List[int]:
+    """The canonical recipes in a user's library."""
+    return [canonical_id for (canonical_id,) in db.query(RecipeDB.canonical_id).filter(RecipeDB.user_id == user_id, RecipeDB.canonical_id.isnot(None))]
+
+def get_domain_template(db: Session, domain: str) -> DomainTemplateDB | None:
+    return db.query(DomainTemplateDB).filter(DomainTemplateDB.domain == domain).first()
+
+def save_domain_template(db: Session, domain: str, selectors: dict, learned_from: str) -> DomainTemplateDB:
+    """Stores a domain's template, replacing the one it had."""
+    template = get_domain_template(db, domain)
+    if template is None:
+        template = DomainTemplateDB(domain=domain)
+        db.add(template)
+    template.selectors = selectors
+    template.learned_from = learned_from
+    template.learned_at = _utcnow()
+    db.commit()
+    return template
+
 def delete_recipe_from_db(db: Session, recipe_id: int) -> bool:
-    """Deletes a recipe from the database by its ID."""
+    """Removes a recipe from its user's library. The shared canonical recipe is kept for other users."""
     recipe_to_delete = db.query(RecipeDB).filter(RecipeDB.id == recipe_id).first()
     if recipe_to_delete:
         db.delete(recipe_to_delete)
@@ -93,6 +528,12 @@ def delete_recipe_from_db(db: Session, recipe_id: int) -> bool:
     logger.warning(f"Recipe with ID {recipe_id} not found for deletion.")
     return False
 
+def get_canonical_recipes_by_ids(db: Session, canonical_ids: List[int]) -> List[CanonicalRecipeDB]:
+    return db.query(CanonicalRecipeDB).filter(CanonicalRecipeDB.id.in_(canonical_ids)).all()
+
+def get_user_recipes_by_canonical_ids(db: Session, user_id: int, canonical_ids: List[int]) -> List[RecipeDB]:
+    return db.query(RecipeDB).filter(RecipeDB.user_id == user_id, RecipeDB.canonical_id.in_(canonical_ids)).all()
+
 def get_recipe_by_id_from_db(db: Session, recipe_id: int) -> RecipeDB | None:
     """Fetches a recipe from the database by its primary key ID."""
     return db.query(RecipeDB).filter(RecipeDB.id == recipe_id).first()
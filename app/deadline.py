@@ -0,0 +1,148 @@
+"""Per-request deadlines, shared out as budgets across the pipeline stages.
+
+A request gets the deadline of its endpoint scaled by the user's tier. That deadline is split
+into budgets for fetch, conversion and extraction. A stage may use its own share plus whatever
+the earlier stages left unused, but never more than what remains of the request. The current
+request's deadline travels in a context variable, so the fetcher, the converter and the agent
+can read it (and degrade when it runs short) without it being threaded through every call.
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Optional
+
+STAGES = ("fetch", "convert", "extract")
+DEFAULT_TIER = "standard"
+
+
+def _parse_pairs(spec: str) -> Dict[str, float]:
+    """Parses 'name:value,name:value' into a dict."""
+    pairs = {}
+    for item in spec.split(","):
+        name, _, value = item.strip().partition(":")
+        if name and value:
+            pairs[name.strip()] = float(value)
+    return pairs
+
+
+ENDPOINT_DEADLINES = {
+    "obtainrecipe": float(os.getenv("DEADLINE_OBTAIN_SECONDS", "120")),
+    "stream": float(os.getenv("DEADLINE_STREAM_SECONDS", "180")),
+}
+DEADLINE_TIER_FACTORS = _parse_pairs(os.getenv("DEADLINE_TIER_FACTORS", "free:0.5,standard:1,premium:2"))
+DEADLINE_STAGE_SHARES = _parse_pairs(os.getenv("DEADLINE_STAGE_SHARES", "fetch:0.25,convert:0.25,extract:0.5"))
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a stage used up its budget."""
+
+    def __init__(self, stage: str, budget: float):
+        self.stage = stage
+        self.budget = budget
+        super().__init__(f"The {stage} stage ran out of its {budget:.1f}s budget")
+
+
+@dataclass
+class StageStats:
+    runs: int = 0
+    overruns: int = 0
+    degraded: int = 0  # ran in a cheaper mode because its budget was short
+    total_seconds: float = 0.0
+
+
+@dataclass
+class DeadlineStats:
+    stages: Dict[str, StageStats] = field(default_factory=dict)
+
+    def stage(self, name: str) -> StageStats:
+        return self.stages.setdefault(name, StageStats())
+
+    def snapshot(self) -> dict:
+        return {
+            "endpoint_deadlines": ENDPOINT_DEADLINES,
+            "tier_factors": DEADLINE_TIER_FACTORS,
+            "stage_shares": DEADLINE_STAGE_SHARES,
+            "stages": {
+                name: {**asdict(stats), "total_seconds": round(stats.total_seconds, 3), "avg_seconds": round(stats.total_seconds / stats.runs, 3) if stats.runs else None}
+                for name, stats in self.stages.items()
+            },
+        }
+
+
+deadline_stats = DeadlineStats()
+
+
+class Deadline:
+    def __init__(self, total: float, shares: Dict[str, float] = DEADLINE_STAGE_SHARES):
+        self.total = total
+        self.started = time.monotonic()
+        weight = sum(shares.get(stage, 0.0) for stage in STAGES) or 1.0
+        self._stage_ends: Dict[str, float] = {}
+        cumulative = 0.0
+        for stage in STAGES:
+            cumulative += shares.get(stage, 0.0)
+            self._stage_ends[stage] = total * cumulative / weight
+
+    def remaining(self, stage: Optional[str] = None) -> float:
+        """Seconds left for `stage` (its share plus what earlier stages left), or for the whole request."""
+        end = self._stage_ends[stage] if stage else self.total
+        return max(0.0, end - (time.monotonic() - self.started))
+
+    def short(self, stage: str, needed: float) -> bool:
+        """True, and counted as a degradation, when `stage` has less than `needed` seconds left."""
+        if self.remaining(stage) >= needed:
+            return False
+        deadline_stats.stage(stage).degraded += 1
+        return True
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("current_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+def deadline_for(endpoint: str, tier: Optional[str] = None) -> Deadline:
+    factor = DEADLINE_TIER_FACTORS.get(tier or DEFAULT_TIER, DEADLINE_TIER_FACTORS.get(DEFAULT_TIER, 1.0))
+    return Deadline(ENDPOINT_DEADLINES[endpoint] * factor)
+
+
+@contextmanager
+def request_deadline(deadline: Deadline):
+    """Makes `deadline` the current one for the block, and for tasks and threads started from it."""
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+@asynccontextmanager
+async def stage_budget(stage: str):
+    """Runs the block within what remains of `stage`'s budget, raising DeadlineExceeded when it runs out.
+
+    Without a current deadline (CLI tools, tests) the block runs unbounded.
+    """
+    deadline = current_deadline()
+    if deadline is None:
+        yield None
+        return
+    budget = deadline.remaining(stage)
+    stats = deadline_stats.stage(stage)
+    stats.runs += 1
+    started = time.monotonic()
+    timeout = asyncio.timeout(budget)
+    try:
+        async with timeout:
+            yield budget
+    except TimeoutError:
+        if not timeout.expired():
+            raise
+        stats.overruns += 1
+        raise DeadlineExceeded(stage, budget) from None
+    finally:
+        stats.total_seconds += time.monotonic() - started
@@ -0,0 +1,329 @@
+"""Discovery of recipe pages on a site, starting from a category page or a sitemap.
+
+    python -m app.discovery https://www.directoalpaladar.com/recetas-de-postres --user-id 3 --max-depth 2 --include /recetas
+
+Pages are walked breadth-first from the start URL, following links on the same site up to
+`--max-depth` hops. A `sitemap.xml` (or a sitemap index) is read for its `<loc>` entries instead.
+The frontier of pages waiting to be visited is bounded; links found once it is full are dropped.
+Each fetched page is classified cheaply, without the model: structured recipe data (JSON-LD,
+microdata, a recipe plugin's card) declaring a single recipe or, failing that, both an
+ingredients and a method section in its Markdown. Recipe pages are queued for extraction into the user's library.
+
+Fetches go through the shared scheduler (robots.txt, per-domain pacing and retries), and each
+host is further limited to `--requests-per-minute`. The frontier, the visited URLs and the
+status of every recipe found are saved to a state file, so an interrupted run resumes where it
+stopped when started again with the same state file.
+"""
+import argparse
+import asyncio
+import html
+import json
+import os
+import re
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+from urllib.parse import urldefrag, urljoin, urlsplit
+
+from .html_processor import HtmlFetcher
+from .negative_cache import canonical_url
+from .recipe_repair import SECTION_KEYWORDS
+from .utils.batch import AsyncRateLimiter
+from .utils.html_stream import recipe_markup_counts
+from .utils.logger_config import get_app_logger
+from .utils.markdown_utils import find_section, html_to_markdown
+
+logger = get_app_logger(__name__)
+
+SKIPPED_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp", ".svg", ".pdf", ".zip", ".mp4", ".mp3", ".css", ".js", ".xml.gz", ".ico")
+_LOC_RE = re.compile(r"<loc>\s*(?:<!\[CDATA\[)?\s*(.*?)\s*(?:\]\]>)?\s*</loc>", re.IGNORECASE | re.DOTALL)
+_SITEMAP_RE = re.compile(r"<(urlset|sitemapindex)\b", re.IGNORECASE)
+
+
+class _LinkParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.hrefs: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        attributes = dict(attrs)
+        if tag == "a" or (tag == "link" and (attributes.get("rel") or "").lower() == "next"):
+            if attributes.get("href"):
+                self.hrefs.append(attributes["href"])
+
+
+def extract_links(html_content: str, base_url: str) -> List[str]:
+    """Absolute http(s) links of a page, without fragments, in document order and without repeats."""
+    parser = _LinkParser()
+    parser.feed(html_content)
+    links: List[str] = []
+    for href in parser.hrefs:
+        url, _ = urldefrag(urljoin(base_url, href.strip()))
+        if url.startswith(("http://", "https://")) and url not in links:
+            links.append(url)
+    return links
+
+
+def parse_sitemap(text: str) -> Optional[Tuple[List[str], bool]]:
+    """(URLs, is_index) for a sitemap or sitemap index, or None when `text` is not a sitemap."""
+    kind = _SITEMAP_RE.search(text[:2000])
+    if kind is None:
+        return None
+    return [html.unescape(loc) for loc in _LOC_RE.findall(text)], kind.group(1).lower() == "sitemapindex"
+
+
+def classify_page(html_content: str, url: str) -> Optional[str]:
+    """Why a page looks like a recipe ("json-ld", "microdata", "recipe-card", "sections"), or None.
+
+    Markup counts only when it declares a single recipe: a category page whose cards each carry
+    recipe markup is a listing, and falls through to the sections check like any other page.
+    """
+    counts = recipe_markup_counts(html_content)
+    if counts and max(counts.values()) == 1:
+        return next(iter(counts))
+    markdown = html_to_markdown(html_content, url)
+    if all(find_section(markdown, keywords, max_chars=1) for keywords in SECTION_KEYWORDS.values()):
+        return "sections"
+    return None
+
+
+def _is_sitemap_url(url: str) -> bool:
+    # Sitemaps are followed even when `--include` would filter them out.
+    return "sitemap" in urlsplit(url).path.lower()
+
+
+def _site(url: str) -> str:
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+@dataclass
+class DiscoveryOptions:
+    max_depth: int = 2
+    max_pages: int = 200
+    max_frontier: int = 5000
+    include: List[str] = field(default_factory=list)  # regexes; a URL must match one of them, when given
+    exclude: List[str] = field(default_factory=list)
+    requests_per_minute: float = 30  # per host; 0 disables
+    save_every: int = 10  # pages between state file writes
+
+
+@dataclass
+class DiscoveryState:
+    """Everything a run needs to resume: the frontier, what was visited, and the recipes found."""
+    start_url: str
+    frontier: Deque[Tuple[str, int]] = field(default_factory=deque)  # (url, depth), breadth-first
+    seen: Set[str] = field(default_factory=set)  # canonical URLs already queued or visited
+    recipes: Dict[str, str] = field(default_factory=dict)  # url -> queued | extracted | failed
+    pages_fetched: int = 0
+    counts: Counter = field(default_factory=Counter)
+
+    @classmethod
+    def start(cls, start_url: str) -> "DiscoveryState":
+        state = cls(start_url=start_url)
+        state.frontier.append((start_url, 0))
+        state.seen.add(canonical_url(start_url))
+        return state
+
+    @classmethod
+    def load(cls, path: Path) -> "DiscoveryState":
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        return cls(
+            start_url=data["start_url"],
+            frontier=deque((url, depth) for url, depth in data["frontier"]),
+            seen=set(data["seen"]),
+            recipes=data["recipes"],
+            pages_fetched=data["pages_fetched"],
+            counts=Counter(data["counts"]),
+        )
+
+    def save(self, path: Path):
+        """Writes the state atomically, so a crash mid-write leaves the previous state intact."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "start_url": self.start_url,
+            "frontier": list(self.frontier),
+            "seen": sorted(self.seen),
+            "recipes": self.recipes,
+            "pages_fetched": self.pages_fetched,
+            "counts": dict(self.counts),
+        }
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+
+class SiteDiscovery:
+    def __init__(self, state: DiscoveryState, options: DiscoveryOptions, fetcher: HtmlFetcher, enqueue: Callable[[str], Awaitable[None]], state_path: Optional[Path] = None):
+        self.state = state
+        self.options = options
+        self.fetcher = fetcher
+        self.enqueue = enqueue
+        self.state_path = state_path
+        self.site = _site(state.start_url)
+        self.include = [re.compile(pattern) for pattern in options.include]
+        self.exclude = [re.compile(pattern) for pattern in options.exclude]
+        self._limiters: Dict[str, AsyncRateLimiter] = {}
+
+    def _admit(self, url: str, depth: int):
+        """Adds a link to the frontier unless it is off-site, filtered out, already seen, too deep, or the frontier is full."""
+        counts = self.state.counts
+        if depth > self.options.max_depth or _site(url) != self.site or urlsplit(url).path.lower().endswith(SKIPPED_EXTENSIONS):
+            return
+        if self.include and not any(pattern.search(url) for pattern in self.include) and not _is_sitemap_url(url):
+            counts["filtered"] += 1
+            return
+        if any(pattern.search(url) for pattern in self.exclude):
+            counts["filtered"] += 1
+            return
+        key = canonical_url(url)
+        if key in self.state.seen:
+            return
+        if len(self.state.frontier) >= self.options.max_frontier:
+            counts["frontier_full"] += 1
+            return
+        self.state.seen.add(key)
+        self.state.frontier.append((url, depth))
+
+    async def _fetch(self, url: str) -> str:
+        host = (urlsplit(url).hostname or "").lower()
+        limiter = self._limiters.setdefault(host, AsyncRateLimiter(self.options.requests_per_minute))
+        await limiter.acquire()
+        # The whole page: links past the first recipe-like card are what discovery is after.
+        return await self.fetcher.fetch_html(url, stop_early=False)
+
+    async def _visit(self, url: str, depth: int):
+        try:
+            content = await self._fetch(url)
+        except Exception as e:
+            logger.info(f"Discovery could not fetch {url}: {e}")
+            self.state.counts["fetch_errors"] += 1
+            return
+        self.state.pages_fetched += 1
+
+        sitemap = parse_sitemap(content)
+        if sitemap is not None:
+            urls, _ = sitemap
+            self.state.counts["sitemap_entries"] += len(urls)
+            for entry in urls:
+                self._admit(entry, depth + 1)
+            return
+
+        reason = classify_page(content, url)
+        if reason:
+            self.state.counts[f"recipe:{reason}"] += 1
+            if url not in self.state.recipes:
+                self.state.recipes[url] = "queued"
+                await self.enqueue(url)
+        if depth < self.options.max_depth:
+            for link in extract_links(content, url):
+                self._admit(link, depth + 1)
+
+    async def run(self) -> DiscoveryState:
+        """Walks the frontier until it is empty or `max_pages` pages have been fetched; saves the state as it goes."""
+        state = self.state
+        try:
+            while state.frontier and state.pages_fetched < self.options.max_pages:
+                url, depth = state.frontier[0]
+                await self._visit(url, depth)
+                state.frontier.popleft()  # only once visited, so an interrupted visit is retried on resume
+                if self.state_path and state.pages_fetched % self.options.save_every == 0:
+                    state.save(self.state_path)
+        finally:
+            if self.state_path:
+                state.save(self.state_path)
+        return state
+
+
+async def _extract_worker(queue: asyncio.Queue, service, user_id: int, state: DiscoveryState):
+    while True:
+        url = await queue.get()
+        try:
+            recipe = await service.process_url_and_store_recipe(url, user_id)
+            state.recipes[url] = "extracted" if recipe else "failed"
+        except Exception as e:
+            logger.info(f"Extraction of discovered page {url} failed: {e}")
+            state.recipes[url] = "failed"
+        finally:
+            queue.task_done()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.discovery", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("start_url", help="A category page, or a sitemap.xml / sitemap index.")
+    parser.add_argument("--user-id", type=int, help="Extract the recipes found into this user's library; without it they are only listed.")
+    parser.add_argument("--max-depth", type=int, default=2, help="Link hops followed from the start URL (default 2).")
+    parser.add_argument("--max-pages", type=int, default=200, help="Pages fetched at most, across resumed runs (default 200).")
+    parser.add_argument("--max-frontier", type=int, default=5000, help="Pages waiting to be visited at most (default 5000).")
+    parser.add_argument("--include", action="append", default=[], help="Regex a URL must match to be visited; repeatable.")
+    parser.add_argument("--exclude", action="append", default=[], help="Regex of URLs never visited; repeatable.")
+    parser.add_argument("--requests-per-minute", type=float, default=30, help="Discovery fetches per host per minute (default 30; 0 disables).")
+    parser.add_argument("--concurrency", type=int, default=2, help="Recipes extracted at the same time (default 2).")
+    parser.add_argument("--state", type=Path, default=Path("discovery-state.json"), help="State file used to resume.")
+    parser.add_argument("--fresh", action="store_true", help="Ignore and replace an existing state file.")
+    parser.add_argument("--retry-failed", action="store_true", help="Extract again the recipes the state records as failed.")
+    return parser
+
+
+async def main_async(args: argparse.Namespace) -> DiscoveryState:
+    if args.state.exists() and not args.fresh:
+        state = DiscoveryState.load(args.state)
+        if state.start_url != args.start_url:
+            raise SystemExit(f"{args.state} belongs to a discovery from {state.start_url}; use --fresh or another --state.")
+        print(f"Resuming: {state.pages_fetched} pages fetched, {len(state.frontier)} waiting, {len(state.recipes)} recipes found.")
+    else:
+        state = DiscoveryState.start(args.start_url)
+    options = DiscoveryOptions(
+        max_depth=args.max_depth, max_pages=args.max_pages, max_frontier=args.max_frontier,
+        include=args.include, exclude=args.exclude, requests_per_minute=args.requests_per_minute,
+    )
+
+    queue: asyncio.Queue = asyncio.Queue()
+    workers: List[asyncio.Task] = []
+    if args.user_id is not None:
+        from .database import create_db_and_tables
+        from .recipe_service import RecipeService
+
+        create_db_and_tables()
+        service = RecipeService()
+        if not service.recipe_agent.tiers:
+            raise SystemExit("The extraction agent is not configured; check AI_PROVIDER / AI_CASCADE.")
+        workers = [asyncio.create_task(_extract_worker(queue, service, args.user_id, state)) for _ in range(max(1, args.concurrency))]
+        resumed = [url for url, status in state.recipes.items() if status == "queued" or (args.retry_failed and status == "failed")]
+        for url in resumed:
+            queue.put_nowait(url)
+
+    async def enqueue(url: str):
+        print(f"Recipe page: {url}")
+        if workers:
+            queue.put_nowait(url)
+
+    started = time.perf_counter()
+    try:
+        await SiteDiscovery(state, options, HtmlFetcher(), enqueue, args.state).run()
+        if workers:
+            await queue.join()
+    finally:
+        for worker in workers:
+            worker.cancel()
+        state.save(args.state)
+
+    statuses = Counter(state.recipes.values())
+    print(
+        f"Done in {time.perf_counter() - started:.1f}s: {state.pages_fetched} pages fetched, {len(state.frontier)} left in the frontier, "
+        f"{len(state.recipes)} recipe pages ({statuses['extracted']} extracted, {statuses['failed']} failed, {statuses['queued']} not extracted). "
+        f"State: {args.state}"
+    )
+    return state
+
+
+def main(argv: Optional[List[str]] = None):
+    asyncio.run(main_async(build_parser().parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
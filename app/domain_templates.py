@@ -0,0 +1,243 @@
+"""Per-domain extraction templates learned from successful model extractions.
+
+Pages on one site share a layout, so once the model has extracted a recipe from a page, the
+elements holding its name, ingredients, method and image can be located in the page's HTML
+and described as CSS selectors. The template is applied back to the same page and kept only
+if it reproduces what the model returned. Later pages from the domain are extracted with the
+selectors in milliseconds; when the result fails the usual quality checks, the model runs as
+before and the template is learned again from its answer.
+"""
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+from .recipe_quality import content_words, find_field_issues, normalize_text
+from .utils.logger_config import get_app_logger
+
+try:
+    from bs4 import BeautifulSoup
+except ImportError:  # without beautifulsoup4 every page goes to the model
+    BeautifulSoup = None
+
+logger = get_app_logger(__name__)
+
+DOMAIN_TEMPLATES_ENABLED = os.getenv("DOMAIN_TEMPLATES_ENABLED", "true").lower() in ("1", "true", "yes") and BeautifulSoup is not None
+TEMPLATE_MIN_AGREEMENT = float(os.getenv("TEMPLATE_MIN_AGREEMENT", "0.8"))
+TEMPLATE_EXTRACTION_MODEL = "template"
+
+LIST_FIELDS = ("ingredients", "instructions")
+_TEXT_TAGS = ["li", "p", "span", "div", "td", "dd", "h1", "h2", "h3", "h4", "label"]
+_MAX_ELEMENT_TEXT = 1000
+_STABLE_CLASS_RE = re.compile(r"^[A-Za-z_-][\w-]*$")
+_LINE_PREFIX_RE = re.compile(r"^\s*(?:[-*•·]|\d+[.)]|paso \d+[:.]?|step \d+[:.]?)\s+", re.IGNORECASE)
+_STEP_NUMBER_RE = re.compile(r"^\d+\s+(?=[^\W\d])")  # "2 Batir..." from a step-number badge; not "2 huevos" in ingredients
+
+
+@dataclass
+class DomainTemplateStats:
+    attempts: int = 0
+    hits: int = 0
+    misses: int = 0  # the template's result failed validation and the model ran instead
+    learned: int = 0
+    relearned: int = 0
+    learn_failures: int = 0
+
+
+@dataclass
+class TemplateStats:
+    domains: Dict[str, DomainTemplateStats] = field(default_factory=dict)
+
+    def domain(self, name: str) -> DomainTemplateStats:
+        return self.domains.setdefault(name, DomainTemplateStats())
+
+    def snapshot(self) -> dict:
+        attempts = sum(stats.attempts for stats in self.domains.values())
+        hits = sum(stats.hits for stats in self.domains.values())
+        return {
+            "enabled": DOMAIN_TEMPLATES_ENABLED,
+            "attempts": attempts,
+            "hits": hits,
+            "hit_rate": round(hits / attempts, 3) if attempts else None,
+            "domains": {
+                name: {**vars(stats), "hit_rate": round(stats.hits / stats.attempts, 3) if stats.attempts else None}
+                for name, stats in sorted(self.domains.items())
+            },
+        }
+
+
+template_stats = TemplateStats()
+
+
+def template_domain(url: str) -> str:
+    """Pages of `www.example.com` and `example.com` share a template."""
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def _clean_line(text: str) -> str:
+    return _LINE_PREFIX_RE.sub("", " ".join((text or "").split()))
+
+
+def _same_line(a: str, b: str) -> bool:
+    """Lines agree when they are equal once normalised, or share nearly all their content words."""
+    if normalize_text(_clean_line(a)) == normalize_text(_clean_line(b)):
+        return True
+    words_a, words_b = set(content_words(a)), set(content_words(b))
+    if not words_a or not words_b:
+        return False
+    return len(words_a & words_b) / len(words_a | words_b) >= TEMPLATE_MIN_AGREEMENT
+
+
+def agreement(found: List[str], expected: List[str]) -> float:
+    """F1 of the lines a selector found against the lines the model returned."""
+    if not found or not expected:
+        return 0.0
+    precision = sum(1 for line in found if any(_same_line(line, other) for other in expected)) / len(found)
+    recall = sum(1 for line in expected if any(_same_line(line, other) for other in found)) / len(expected)
+    return 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+
+
+def _element_text(element) -> str:
+    return _clean_line(element.get_text(" ", strip=True))
+
+
+def _simple_selector(element) -> str:
+    classes = sorted(c for c in element.get("class", []) if _STABLE_CLASS_RE.match(c))
+    return element.name + "".join(f".{c}" for c in classes)
+
+
+def _candidate_selectors(element) -> List[str]:
+    """Selectors for `element`, from its own tag and classes to ones anchored on an ancestor's id or class."""
+    own = _simple_selector(element)
+    candidates = [own]
+    for ancestor in element.parents:
+        if ancestor.name in (None, "[document]", "html", "body"):
+            break
+        if ancestor.get("id") and _STABLE_CLASS_RE.match(ancestor["id"]):
+            candidates.append(f"#{ancestor['id']} {own}")
+            break
+        if any(_STABLE_CLASS_RE.match(c) for c in ancestor.get("class", [])):
+            candidates.append(f"{_simple_selector(ancestor)} {own}")
+    return candidates
+
+
+def _matching_elements(soup, lines: List[str]) -> list:
+    """The outermost elements whose whole text is one of `lines`."""
+    matches, matched_ids = [], set()
+    for element in soup.find_all(_TEXT_TAGS):
+        if any(id(ancestor) in matched_ids for ancestor in element.parents):
+            continue
+        text = _element_text(element)
+        if not text or len(text) > _MAX_ELEMENT_TEXT or not any(_same_line(text, line) for line in lines):
+            continue
+        matches.append(element)
+        matched_ids.add(id(element))
+    return matches
+
+
+def _select_texts(soup, selector: str) -> List[str]:
+    try:
+        return [text for text in (_element_text(element) for element in soup.select(selector)) if text]
+    except Exception:  # soupsieve rejects selectors built from unusual class names
+        return []
+
+
+def _learn_list(soup, lines: List[str]) -> Optional[Tuple[str, float]]:
+    candidates: List[str] = []
+    for element in _matching_elements(soup, lines):
+        candidates.extend(c for c in _candidate_selectors(element) if c not in candidates)
+    scored = [(agreement(_select_texts(soup, selector), lines), selector) for selector in candidates]
+    if not scored:
+        return None
+    score, selector = max(scored, key=lambda item: item[0])
+    return (selector, score) if score >= TEMPLATE_MIN_AGREEMENT else None
+
+
+def _learn_name(soup, name: str) -> Optional[str]:
+    elements = [e for e in soup.find_all(["h1", "h2", "h3", "span", "div", "p"]) if _same_line(_element_text(e), name)]
+    elements.sort(key=lambda e: (e.name not in ("h1", "h2"), len(list(e.parents))))
+    for element in elements:
+        for selector in _candidate_selectors(element):
+            texts = _select_texts(soup, selector)
+            if texts and _same_line(texts[0], name):
+                return selector
+    return None
+
+
+def _learn_image(soup, image_url: str, page_url: str) -> Optional[Dict[str, str]]:
+    for selector, attribute in (('meta[property="og:image"]', "content"), ('meta[name="twitter:image"]', "content")):
+        element = soup.select_one(selector)
+        if element is not None and urljoin(page_url, element.get(attribute, "")) == image_url:
+            return {"selector": selector, "attribute": attribute}
+    for element in soup.find_all("img"):
+        for attribute in ("src", "data-src", "data-lazy-src"):
+            if element.get(attribute) and urljoin(page_url, element[attribute]) == image_url:
+                for selector in _candidate_selectors(element):
+                    found = soup.select_one(selector)
+                    if found is element:
+                        return {"selector": selector, "attribute": attribute}
+    return None
+
+
+def _parse(html_content: str):
+    return BeautifulSoup(html_content, "html.parser")
+
+
+def apply_template(template: dict, html_content: str, page_url: str) -> Optional[dict]:
+    """Runs a template's selectors over a page; returns the recipe fields, or None when a required one is missing."""
+    soup = _parse(html_content)
+    names = _select_texts(soup, template["name"])
+    ingredients = _select_texts(soup, template["ingredients"])
+    instructions = _select_texts(soup, template["instructions"])
+    if not (names and ingredients and instructions):
+        return None
+    instructions = [_STEP_NUMBER_RE.sub("", line) for line in instructions]
+    recipe = {"name": names[0], "ingredients": ingredients, "instructions": instructions, "image_url": None}
+    image = template.get("image_url")
+    if image:
+        element = soup.select_one(image["selector"])
+        if element is not None and element.get(image["attribute"]):
+            recipe["image_url"] = urljoin(page_url, element[image["attribute"]])
+    return recipe
+
+
+def learn_template(html_content: str, page_url: str, recipe) -> Optional[dict]:
+    """Derives selectors that reproduce `recipe` (the model's answer) from the page it came from.
+
+    Returns None unless the template, applied back to the page, agrees with the model on every field.
+    """
+    soup = _parse(html_content)
+    name_selector = _learn_name(soup, recipe.name)
+    ingredients = _learn_list(soup, recipe.ingredients)
+    instructions = _learn_list(soup, recipe.instructions)
+    if not (name_selector and ingredients and instructions):
+        return None
+    template = {"name": name_selector, "ingredients": ingredients[0], "instructions": instructions[0], "image_url": None}
+    if recipe.image_url:
+        template["image_url"] = _learn_image(soup, str(recipe.image_url), page_url)
+
+    verified = apply_template(template, html_content, page_url)
+    if verified is None or not _same_line(verified["name"], recipe.name):
+        return None
+    if any(agreement(verified[key], getattr(recipe, key)) < TEMPLATE_MIN_AGREEMENT for key in LIST_FIELDS):
+        return None
+    return template
+
+
+def extract_with_template(template: dict, html_content: str, page_url: str, markdown_content: str, output_model):
+    """The recipe a stored template finds on a page, or None when it fails the checks applied to model output."""
+    fields = apply_template(template, html_content, page_url)
+    if fields is None:
+        return None
+    try:
+        recipe = output_model(**fields, source_url=page_url)
+    except Exception as e:
+        logger.info(f"Template result for {page_url} is not a valid recipe: {e}")
+        return None
+    issues = find_field_issues(recipe, markdown_content)
+    if issues:
+        logger.info(f"Template result for {page_url} failed validation: {issues}")
+        return None
+    return recipe
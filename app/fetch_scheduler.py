@@ -0,0 +1,249 @@
+import asyncio
+import email.utils
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Optional
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+import httpx
+
+from .coordination import CoordinationBackend, get_coordination
+from .deadline import current_deadline
+from .utils.logger_config import get_app_logger
+
+logger = get_app_logger(__name__)
+
+FETCH_USER_AGENT = os.getenv("FETCH_USER_AGENT", "RecipesBot/1.0 (+https://github.com/OriolFF/Recipes_be)")
+FETCH_TIMEOUT_SECONDS = float(os.getenv("FETCH_TIMEOUT_SECONDS", "20"))
+FETCH_DOMAIN_CONCURRENCY = int(os.getenv("FETCH_DOMAIN_CONCURRENCY", "2"))
+FETCH_DOMAIN_MIN_DELAY_SECONDS = float(os.getenv("FETCH_DOMAIN_MIN_DELAY_SECONDS", "1.0"))
+FETCH_MAX_RETRIES = int(os.getenv("FETCH_MAX_RETRIES", "3"))
+FETCH_BACKOFF_BASE_SECONDS = float(os.getenv("FETCH_BACKOFF_BASE_SECONDS", "1.0"))
+FETCH_MAX_BACKOFF_SECONDS = float(os.getenv("FETCH_MAX_BACKOFF_SECONDS", "60"))
+FETCH_RESPECT_ROBOTS = os.getenv("FETCH_RESPECT_ROBOTS", "true").lower() in ("1", "true", "yes")
+ROBOTS_TTL_SECONDS = float(os.getenv("ROBOTS_TTL_SECONDS", "3600"))
+ROBOTS_ERROR_TTL_SECONDS = 60.0
+RETRYABLE_STATUSES = {429, 503}
+
+
+class FetchDisallowed(Exception):
+    """Raised when a site's robots.txt does not allow our user agent to fetch a URL."""
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None if absent/invalid."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - (time.time() if now is None else now))
+
+
+@dataclass
+class DomainState:
+    semaphore: asyncio.Semaphore
+    next_start: float = 0.0
+    crawl_delay: Optional[float] = None
+
+
+@dataclass
+class RobotsEntry:
+    parser: Optional[RobotFileParser]  # None allows everything
+    expires: float
+
+
+@dataclass
+class FetchStats:
+    requests: int = 0
+    retries: int = 0
+    disallowed: int = 0
+    throttled_by_status: Dict[int, int] = field(default_factory=dict)
+    bytes_downloaded: int = 0
+    html_chars_kept: int = 0  # after stripping scripts, styles, comments and data URIs
+    truncated: int = 0  # bodies cut off at the size cap
+    stopped_early: int = 0  # bodies abandoned once the recipe had been seen
+    rejected_content: int = 0  # bodies that were not HTML
+
+
+class FetchScheduler:
+    """Polite page fetching: per-domain pacing, robots.txt, and backoff on 429/503.
+
+    Each domain gets `per_domain_concurrency` simultaneous requests and at least `min_delay`
+    seconds (or the robots.txt Crawl-delay, if larger) between request starts, so many domains
+    can be fetched in parallel without hammering any one of them. robots.txt is cached per origin
+    for `robots_ttl` seconds, in `shared_cache` too when given so other workers reuse it. A 429 or 503 is retried up to `max_retries` times after its
+    Retry-After, or after an exponential backoff with jitter, and pushes back every queued request
+    to that domain.
+    """
+
+    def __init__(self, user_agent: str = FETCH_USER_AGENT, per_domain_concurrency: int = FETCH_DOMAIN_CONCURRENCY, min_delay: float = FETCH_DOMAIN_MIN_DELAY_SECONDS, max_retries: int = FETCH_MAX_RETRIES, backoff_base: float = FETCH_BACKOFF_BASE_SECONDS, max_backoff: float = FETCH_MAX_BACKOFF_SECONDS, respect_robots: bool = FETCH_RESPECT_ROBOTS, robots_ttl: float = ROBOTS_TTL_SECONDS, timeout: float = FETCH_TIMEOUT_SECONDS, transport: Optional[httpx.AsyncBaseTransport] = None, shared_cache: Optional[CoordinationBackend] = None):
+        self.user_agent = user_agent
+        self.per_domain_concurrency = per_domain_concurrency
+        self.min_delay = min_delay
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.respect_robots = respect_robots
+        self.robots_ttl = robots_ttl
+        self.timeout = timeout
+        self.transport = transport
+        self.shared_cache = shared_cache
+        self.stats = FetchStats()
+        self._domains: Dict[str, DomainState] = {}
+        self._robots: Dict[str, RobotsEntry] = {}
+        self._robots_fetches: Dict[str, asyncio.Task] = {}
+
+    def _client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=self.timeout,
+            headers={"User-Agent": self.user_agent},
+            transport=self.transport,
+        )
+
+    def _domain(self, host: str) -> DomainState:
+        state = self._domains.get(host)
+        if state is None:
+            state = self._domains[host] = DomainState(asyncio.Semaphore(self.per_domain_concurrency))
+        return state
+
+    def _robots_entry(self, status_code: int, text: str) -> RobotsEntry:
+        now = time.monotonic()
+        if status_code in (401, 403):
+            parser = RobotFileParser()
+            parser.disallow_all = True
+            return RobotsEntry(parser, now + self.robots_ttl)
+        if status_code >= 400:
+            # A missing robots.txt allows everything; a failing one is retried soon rather than cached.
+            ttl = self.robots_ttl if status_code < 500 else ROBOTS_ERROR_TTL_SECONDS
+            return RobotsEntry(None, now + ttl)
+        parser = RobotFileParser()
+        parser.parse(text.splitlines())
+        return RobotsEntry(parser, now + self.robots_ttl)
+
+    async def _load_robots(self, origin: str) -> RobotsEntry:
+        cache_key = f"robots:{origin}"
+        if self.shared_cache is not None:
+            cached = await asyncio.to_thread(self.shared_cache.get, cache_key)
+            if cached is not None:
+                return self._robots_entry(cached["status"], cached["text"])
+        try:
+            async with self._client() as client:
+                response = await client.get(f"{origin}/robots.txt")
+        except httpx.HTTPError as e:
+            logger.info(f"Could not fetch robots.txt for {origin} ({e}); allowing fetches for now.")
+            return RobotsEntry(None, time.monotonic() + ROBOTS_ERROR_TTL_SECONDS)
+        if self.shared_cache is not None and response.status_code < 500:
+            await asyncio.to_thread(self.shared_cache.set, cache_key, {"status": response.status_code, "text": response.text}, self.robots_ttl)
+        return self._robots_entry(response.status_code, response.text)
+
+    async def robots_for(self, url: str) -> Optional[RobotFileParser]:
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        entry = self._robots.get(origin)
+        if entry is None or entry.expires <= time.monotonic():
+            # Concurrent first requests to an origin share a single robots.txt fetch. It is shielded,
+            # so a waiter that is cancelled (client gone, deadline) does not cancel it for the others.
+            task = self._robots_fetches.get(origin)
+            if task is None:
+                task = self._robots_fetches[origin] = asyncio.ensure_future(self._load_robots(origin))
+                task.add_done_callback(lambda done: self._robots_loaded(origin, done))
+            entry = await asyncio.shield(task)
+        return entry.parser
+
+    def _robots_loaded(self, origin: str, task: asyncio.Task):
+        self._robots_fetches.pop(origin, None)
+        if not task.cancelled() and task.exception() is None:
+            self._robots[origin] = task.result()
+
+    async def _wait_turn(self, state: DomainState):
+        delay = max(self.min_delay, state.crawl_delay or 0.0)
+        now = time.monotonic()
+        start = max(now, state.next_start)
+        state.next_start = start + delay
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    def _backoff(self, attempt: int, response: httpx.Response) -> float:
+        retry_after = parse_retry_after(response.headers.get("retry-after"))
+        if retry_after is None:
+            retry_after = self.backoff_base * (2 ** attempt) * (1 + random.random() / 2)
+        return min(retry_after, self.max_backoff)
+
+    @asynccontextmanager
+    async def open(self, url: str) -> AsyncIterator[httpx.Response]:
+        """GETs a URL within the domain's limits and yields the final response with its body still unread.
+
+        The domain slot is held while the caller streams the body, and the response is closed on exit.
+        Raises FetchDisallowed when robots.txt forbids the URL. The final response is yielded whatever
+        its status; callers decide what counts as an error. Retries stop early when the request's
+        fetch budget would run out before the retry.
+        """
+        host = (urlsplit(url).hostname or "").lower()
+        state = self._domain(host)
+        if self.respect_robots:
+            robots = await self.robots_for(url)
+            if robots is not None:
+                if not robots.can_fetch(self.user_agent, url):
+                    self.stats.disallowed += 1
+                    raise FetchDisallowed(f"robots.txt for {host} disallows {url}")
+                state.crawl_delay = robots.crawl_delay(self.user_agent)
+
+        async with self._client() as client:
+            for attempt in range(self.max_retries + 1):
+                async with state.semaphore:
+                    await self._wait_turn(state)
+                    self.stats.requests += 1
+                    response = await client.send(client.build_request("GET", url), stream=True)
+                    try:
+                        wait = None
+                        if response.status_code in RETRYABLE_STATUSES and attempt < self.max_retries:
+                            wait = self._backoff(attempt, response)
+                            deadline = current_deadline()
+                            if deadline is not None and deadline.short("fetch", wait + self.min_delay):
+                                logger.warning(f"{host} answered {response.status_code} for {url}; no fetch budget left to retry in {wait:.1f}s.")
+                                wait = None
+                        if wait is None:
+                            yield response
+                            return
+                    finally:
+                        await response.aclose()
+
+                self.stats.retries += 1
+                self.stats.throttled_by_status[response.status_code] = self.stats.throttled_by_status.get(response.status_code, 0) + 1
+                state.next_start = max(state.next_start, time.monotonic() + wait)
+                logger.warning(f"{host} answered {response.status_code} for {url}; retrying in {wait:.1f}s (attempt {attempt + 1}/{self.max_retries}).")
+
+    async def fetch(self, url: str) -> httpx.Response:
+        """Like `open`, with the body read into the returned response."""
+        async with self.open(url) as response:
+            await response.aread()
+            self.stats.bytes_downloaded += response.num_bytes_downloaded
+            return response
+
+    def snapshot(self) -> dict:
+        return {
+            "user_agent": self.user_agent,
+            "domains": len(self._domains),
+            "requests": self.stats.requests,
+            "retries": self.stats.retries,
+            "disallowed": self.stats.disallowed,
+            "throttled_by_status": {str(k): v for k, v in self.stats.throttled_by_status.items()},
+            "bytes_downloaded": self.stats.bytes_downloaded,
+            "html_chars_kept": self.stats.html_chars_kept,
+            "truncated": self.stats.truncated,
+            "stopped_early": self.stats.stopped_early,
+            "rejected_content": self.stats.rejected_content,
+        }
+
+
+fetch_scheduler = FetchScheduler(shared_cache=get_coordination())
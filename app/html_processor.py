@@ -1,27 +1,106 @@
 import asyncio
+import codecs
+import os
 import sys
+import threading
+from typing import Optional
+
 import httpx
-from crawl4ai import AsyncWebCrawler
+
+from .deadline import current_deadline
+from .fetch_scheduler import FetchScheduler, fetch_scheduler
+from .utils.html_stream import HtmlStreamCleaner, looks_like_html
+from .utils.markdown_utils import html_to_markdown
+
+# Below this much conversion budget, a browser would not start in time; use the quick converter instead.
+CONVERT_BROWSER_MIN_SECONDS = float(os.getenv("CONVERT_BROWSER_MIN_SECONDS", "15"))
+FETCH_MAX_HTML_BYTES = int(os.getenv("FETCH_MAX_HTML_BYTES", str(3 * 1024 * 1024)))
+FETCH_STOP_EARLY = os.getenv("FETCH_STOP_EARLY", "true").lower() in ("1", "true", "yes")
 
 # Set asyncio event loop policy for Windows if applicable
 # if sys.platform == "win32":
 #     asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 
+class NotHtmlContent(Exception):
+    """Raised when a URL serves something other than an HTML page (a PDF, an image, a download)."""
+
 class HtmlFetcher:
-    async def fetch_html(self, url: str) -> str:
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(url)
+    def __init__(self, scheduler: FetchScheduler = fetch_scheduler, max_bytes: int = FETCH_MAX_HTML_BYTES, stop_early: bool = FETCH_STOP_EARLY):
+        # Shared by every fetcher so per-domain limits hold across requests and users.
+        self.scheduler = scheduler
+        self.max_bytes = max_bytes
+        self.stop_early = stop_early
+
+    async def fetch_html(self, url: str, stop_early: Optional[bool] = None) -> str:
+        """Streams the page and returns its cleaned HTML, never holding more than `max_bytes` of it.
+
+        Scripts (except JSON-LD), styles, comments and inline data URIs are dropped as the body
+        arrives, and the download stops once the recipe markup and its enclosing article are complete.
+        `stop_early` overrides the fetcher's setting for this page.
+        """
+        stop_early = self.stop_early if stop_early is None else stop_early
+        stats = self.scheduler.stats
+        try:
+            async with self.scheduler.open(url) as response:
                 response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
-                return response.text
-            except httpx.RequestError as exc:
-                # Handle network errors, DNS failures, etc.
-                print(f"An error occurred while requesting {url}: {exc}")
-                raise  # Re-raise the exception to be handled by the caller
-            except httpx.HTTPStatusError as exc:
-                # Handle HTTP error responses (4xx, 5xx)
-                print(f"Error response {exc.response.status_code} while requesting {exc.request.url!r}: {exc.response.text}")
-                raise # Re-raise the exception to be handled by the caller
+                decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+                cleaner = HtmlStreamCleaner(stop_early=stop_early)
+                received = 0
+                async for chunk in response.aiter_bytes():
+                    if received == 0 and not looks_like_html(response.headers.get("content-type"), chunk):
+                        stats.rejected_content += 1
+                        raise NotHtmlContent(f"{url} is not an HTML page ({response.headers.get('content-type', 'no content type')}).")
+                    if received + len(chunk) > self.max_bytes:
+                        chunk = chunk[:self.max_bytes - received]
+                        stats.truncated += 1
+                        print(f"Page {url} is larger than {self.max_bytes} bytes; keeping the first {self.max_bytes}.")
+                    received += len(chunk)
+                    cleaner.feed(decoder.decode(chunk))
+                    if received >= self.max_bytes:
+                        break
+                    if cleaner.done:
+                        stats.stopped_early += 1
+                        break
+                cleaner.feed(decoder.decode(b"", final=True))
+                stats.bytes_downloaded += response.num_bytes_downloaded
+            html = cleaner.close()
+            stats.html_chars_kept += len(html)
+            return html
+        except httpx.RequestError as exc:
+            # Handle network errors, DNS failures, etc.
+            print(f"An error occurred while requesting {url}: {exc}")
+            raise  # Re-raise the exception to be handled by the caller
+        except httpx.HTTPStatusError as exc:
+            # Handle HTTP error responses (4xx, 5xx); the body is not read, so it never reaches the logs
+            print(f"Error response {exc.response.status_code} while requesting {exc.request.url!r}")
+            raise # Re-raise the exception to be handled by the caller
+
+class CrawlCancellation:
+    """Lets the request's task cancel a crawl running on the converter thread's private event loop."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._task = None
+        self.cancelled = False
+
+    async def run(self, coro):
+        with self._lock:
+            if self.cancelled:
+                coro.close()
+                raise asyncio.CancelledError()
+            self._loop = asyncio.get_running_loop()
+            self._task = asyncio.current_task()
+        return await coro
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            if self._task is not None:
+                try:
+                    self._loop.call_soon_threadsafe(self._task.cancel)
+                except RuntimeError:
+                    pass  # the crawl's loop has already closed
 
 class MarkdownConverter:
     async def _perform_crawl_async(self, html_content: str, url: str) -> str:
@@ -30,6 +109,8 @@ class MarkdownConverter:
         print(f"MD_CONVERTER (_perform_crawl_async thread): Current event loop policy: {type(asyncio.get_event_loop_policy())}", flush=True)
         print(f"MD_CONVERTER (_perform_crawl_async thread): Current event loop: {type(asyncio.get_event_loop())}", flush=True)
         try:
+            from crawl4ai import AsyncWebCrawler  # imported on first use: crawl4ai pulls in Playwright
+
             async with AsyncWebCrawler() as crawler:
                 crawl_result = await crawler.arun(html_content=html_content, url=url)
                 if crawl_result and crawl_result.markdown:
@@ -39,13 +120,17 @@ class MarkdownConverter:
             print(f"MD_CONVERTER (_perform_crawl_async thread): Error during crawl4ai processing: {e_crawl}", flush=True)
             raise # Re-raise to be caught by the sync wrapper
 
-    def _sync_crawl_wrapper(self, html_content: str, url: str) -> str:
+    def _sync_crawl_wrapper(self, html_content: str, url: str, cancellation: CrawlCancellation | None = None) -> str:
         # This synchronous function is executed in a separate thread by asyncio.to_thread
         print(f"MD_CONVERTER (_sync_crawl_wrapper thread): Starting. Will call asyncio.run().", flush=True)
         try:
             # asyncio.run() will create and manage a new event loop for _perform_crawl_async
             # This new loop should be a ProactorEventLoop due to the globally set policy
-            return asyncio.run(self._perform_crawl_async(html_content, url))
+            crawl = self._perform_crawl_async(html_content, url)
+            return asyncio.run(cancellation.run(crawl) if cancellation else crawl)
+        except asyncio.CancelledError:
+            print(f"MD_CONVERTER (_sync_crawl_wrapper thread): Crawl cancelled for {url}.", flush=True)
+            return ""
         except Exception as e_run:
             print(f"MD_CONVERTER (_sync_crawl_wrapper thread): asyncio.run() failed: {e_run}", flush=True)
             # Consider how to propagate this error. For now, return empty string or re-raise.
@@ -60,11 +145,21 @@ class MarkdownConverter:
             print("MD_CONVERTER (to_markdown main thread): No HTML content provided.", flush=True)
             return ""
 
+        deadline = current_deadline()
+        if deadline is not None and deadline.short("convert", CONVERT_BROWSER_MIN_SECONDS):
+            print(f"MD_CONVERTER (to_markdown main thread): {deadline.remaining('convert'):.1f}s left for conversion; skipping the browser.", flush=True)
+            return await asyncio.to_thread(html_to_markdown, html_content, url)
+
+        cancellation = CrawlCancellation()
         try:
             # Run the synchronous wrapper (which internally uses asyncio.run) in a separate thread
-            output_markdown = await asyncio.to_thread(self._sync_crawl_wrapper, html_content, url)
+            output_markdown = await asyncio.to_thread(self._sync_crawl_wrapper, html_content, url, cancellation)
             print(f"MD_CONVERTER (to_markdown main thread): Conversion completed. Markdown length: {len(output_markdown)}", flush=True)
             return output_markdown
+        except asyncio.CancelledError:
+            # to_thread stops waiting but cannot stop the thread; cancel the crawl on the thread's own loop.
+            cancellation.cancel()
+            raise
         except Exception as e:
             print(f"MD_CONVERTER (to_markdown main thread): Error calling asyncio.to_thread or _sync_crawl_wrapper: {e}", flush=True)
             # Re-raise to be caught by the service layer, or handle as appropriate
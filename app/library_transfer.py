@@ -0,0 +1,242 @@
+"""Streaming export and import of a user's recipe library.
+
+Exports read rows from a server-side cursor and yield bytes as they are produced. Imports parse
+the upload one line at a time and write it in batched transactions. Memory use therefore does
+not grow with the size of the library.
+"""
+import hashlib
+import os
+import zipfile
+import zlib
+from typing import BinaryIO, Dict, Iterator, List, Optional
+
+import orjson
+from pydantic import ValidationError
+
+from .database import SessionLocal, import_recipes_for_user, iter_recipe_rows_for_user
+from .models.recipe import Recipe as RecipePydantic
+from .recipe_service import decode_legacy_lists
+from .utils.image_utils import IMAGE_MAX_BYTES, IMAGE_URL_PREFIX, image_path_for_key
+from .utils.logger_config import get_app_logger
+
+logger = get_app_logger(__name__)
+
+EXPORT_BATCH_SIZE = int(os.getenv("LIBRARY_EXPORT_BATCH_SIZE", "500"))
+IMPORT_BATCH_SIZE = int(os.getenv("LIBRARY_IMPORT_BATCH_SIZE", "200"))
+IMPORT_MAX_LINE_BYTES = int(os.getenv("LIBRARY_IMPORT_MAX_LINE_BYTES", str(1024 * 1024)))
+MAX_REPORTED_ERRORS = 20
+CHUNK_BYTES = 64 * 1024
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+ZIP_MEDIA_TYPE = "application/zip"
+ZIP_RECIPES_NAME = "recipes.ndjson"
+ZIP_IMAGES_DIR = "images/"
+EXPORTED_FIELDS = ("source_url", "name", "ingredients", "instructions", "image_url", "image_variants")
+
+
+def _library_rows(user_id: int) -> Iterator[dict]:
+    db = SessionLocal()
+    try:
+        for row in iter_recipe_rows_for_user(db, user_id, batch_size=EXPORT_BATCH_SIZE):
+            yield decode_legacy_lists(row)
+    finally:
+        db.close()
+
+
+def _export_line(row: dict) -> bytes:
+    return orjson.dumps({key: row[key] for key in EXPORTED_FIELDS}) + b"\n"
+
+
+def _variant_keys(variants: Optional[Dict[str, Dict[str, str]]]) -> Iterator[str]:
+    prefix = f"{IMAGE_URL_PREFIX}/"
+    for formats in (variants or {}).values():
+        for url in formats.values():
+            if url.startswith(prefix):
+                yield url[len(prefix):]
+
+
+def export_ndjson(user_id: int) -> Iterator[bytes]:
+    """The user's recipes as newline-delimited JSON, one recipe per line, in ~64 KB chunks."""
+    buffer = bytearray()
+    for row in _library_rows(user_id):
+        buffer += _export_line(row)
+        if len(buffer) >= CHUNK_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+class _ChunkSink:
+    """Write-only, unseekable file object; zipfile then streams entries with data descriptors."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self.buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def export_zip(user_id: int) -> Iterator[bytes]:
+    """A ZIP with `recipes.ndjson` plus the stored image variants it references under `images/`."""
+    sink = _ChunkSink()
+    image_keys = set()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(ZIP_RECIPES_NAME, "w", force_zip64=True) as entry:
+            for row in _library_rows(user_id):
+                entry.write(_export_line(row))
+                image_keys.update(_variant_keys(row["image_variants"]))
+                if len(sink.buffer) >= CHUNK_BYTES:
+                    yield sink.drain()
+        for key in sorted(image_keys):
+            path = image_path_for_key(key)
+            if path is not None and path.exists():
+                archive.write(path, ZIP_IMAGES_DIR + key, compress_type=zipfile.ZIP_STORED)  # already compressed
+                if len(sink.buffer) >= CHUNK_BYTES:
+                    yield sink.drain()
+    yield sink.drain()
+
+
+def _restore_images(archive: zipfile.ZipFile) -> int:
+    """Copies images from an export into storage. Only files whose content matches their SHA-256 key are kept."""
+    restored = 0
+    for info in archive.infolist():
+        if not info.filename.startswith(ZIP_IMAGES_DIR) or info.is_dir():
+            continue
+        key = info.filename[len(ZIP_IMAGES_DIR):]
+        path = image_path_for_key(key)
+        if path is None or path.exists() or info.file_size > IMAGE_MAX_BYTES:
+            continue
+        digest = hashlib.sha256()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with archive.open(info) as source, tmp_path.open("wb") as target:
+                for chunk in iter(lambda: source.read(CHUNK_BYTES), b""):
+                    digest.update(chunk)
+                    target.write(chunk)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        if digest.hexdigest() != os.path.basename(key).split(".")[0]:
+            logger.warning(f"Skipping imported image {key}: content does not match its name.")
+            tmp_path.unlink(missing_ok=True)
+            continue
+        os.replace(tmp_path, path)
+        restored += 1
+    return restored
+
+
+def _local_variants(variants) -> Optional[dict]:
+    """Keeps imported image variants only when every file they reference is in local storage."""
+    if not isinstance(variants, dict):
+        return None
+    try:
+        keys = list(_variant_keys(variants))
+    except AttributeError:
+        return None
+    paths = [image_path_for_key(key) for key in keys]
+    if not keys or any(path is None or not path.exists() for path in paths):
+        return None
+    return variants
+
+
+def _lines(stream: BinaryIO) -> Iterator[tuple]:
+    """Yields (line number, line or None if it exceeded IMPORT_MAX_LINE_BYTES) without reading overlong lines into memory."""
+    line_number = 0
+    while True:
+        line = stream.readline(IMPORT_MAX_LINE_BYTES + 1)
+        if not line:
+            return
+        line_number += 1
+        if len(line) > IMPORT_MAX_LINE_BYTES and not line.endswith(b"\n"):
+            while line and not line.endswith(b"\n"):
+                line = stream.readline(CHUNK_BYTES)
+            yield line_number, None
+            continue
+        yield line_number, line
+
+
+def _import_records(stream: BinaryIO, user_id: int) -> dict:
+    summary = {"imported": 0, "already_in_library": 0, "invalid": 0, "errors": []}
+    batch: List[dict] = []
+    db = SessionLocal()
+
+    def flush():
+        imported, present = import_recipes_for_user(db, batch, user_id)
+        summary["imported"] += imported
+        summary["already_in_library"] += present
+        batch.clear()
+
+    def reject(line_number: int, error: str):
+        summary["invalid"] += 1
+        if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+            summary["errors"].append({"line": line_number, "error": error})
+
+    try:
+        for line_number, line in _lines(stream):
+            if line is None:
+                reject(line_number, f"line longer than {IMPORT_MAX_LINE_BYTES} bytes")
+                continue
+            if not line.strip():
+                continue
+            try:
+                data = orjson.loads(line)
+                recipe = RecipePydantic.model_validate(data)
+            except (orjson.JSONDecodeError, ValidationError) as e:
+                reject(line_number, str(e).splitlines()[0])
+                continue
+            if recipe.source_url is None:
+                reject(line_number, "source_url is required")
+                continue
+            batch.append({
+                "source_url": data["source_url"],
+                "name": recipe.name,
+                "ingredients": recipe.ingredients,
+                "instructions": recipe.instructions,
+                "image_url": str(recipe.image_url) if recipe.image_url else None,
+                "image_variants": _local_variants(data.get("image_variants")),
+            })
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                flush()
+        if batch:
+            flush()
+    finally:
+        db.close()
+    return summary
+
+
+def import_library(upload: BinaryIO, user_id: int) -> dict:
+    """Imports an NDJSON export, or a ZIP export with its images, into the user's library.
+
+    Recipes already in the library (same source URL) are left unchanged. Invalid lines are
+    skipped and reported with their line numbers. Raises ValueError for a ZIP file that has no
+    recipes or is truncated or corrupted; batches read before the damage stay imported.
+    """
+    upload.seek(0)
+    if zipfile.is_zipfile(upload):
+        upload.seek(0)
+        try:
+            with zipfile.ZipFile(upload) as archive:
+                images_restored = _restore_images(archive)
+                try:
+                    with archive.open(ZIP_RECIPES_NAME) as entry:
+                        summary = _import_records(entry, user_id)
+                except KeyError:
+                    raise ValueError(f"The ZIP file has no {ZIP_RECIPES_NAME}.")
+        except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+            raise ValueError(f"The ZIP file is damaged and could not be read ({e}).")
+        summary["images_restored"] = images_restored
+    else:
+        upload.seek(0)
+        summary = _import_records(upload, user_id)
+    logger.info(f"Imported library for user {user_id}: {summary['imported']} new, {summary['already_in_library']} already present, {summary['invalid']} invalid.")
+    return summary
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, HttpUrl
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 class Recipe(BaseModel):
     id: Optional[int] = None # Add ID, make it optional for creation, but present for retrieval
@@ -8,13 +8,41 @@ class Recipe(BaseModel):
     instructions: List[str]
     image_url: Optional[HttpUrl] = None
     source_url: Optional[HttpUrl] = None # Added source URL
+    image_variants: Optional[Dict[str, Dict[str, str]]] = None # width -> {"webp": url, "jpeg": url}, filled in after extraction
     # You can add other fields later if needed, e.g.:
     # prep_time: Optional[str] = None
     # cook_time: Optional[str] = None
     # servings: Optional[str] = None
 
+class SimilarRecipe(Recipe):
+    """A result of GET /recipes/{id}/similar. `id` is set only for recipes in the user's library."""
+    score: float # cosine similarity of the ingredient and title term vectors, 0-1
+    in_library: bool
+
 class RecipeUpdate(BaseModel):
     name: Optional[str] = None
     ingredients: Optional[List[str]] = None
     instructions: Optional[List[str]] = None
     image_url: Optional[HttpUrl] = None
+
+class PartialRecipe(BaseModel):
+    """Lenient shape for streamed output and per-chunk fragments; every field may be missing or incomplete."""
+    name: Optional[str] = None
+    ingredients: List[str] = []
+    instructions: List[str] = []
+    image_url: Optional[str] = None
+
+class PartialRecipeCollection(BaseModel):
+    recipes: List[PartialRecipe] = []
+
+class NameRepair(BaseModel):
+    name: str
+
+class IngredientsRepair(BaseModel):
+    ingredients: List[str]
+
+class InstructionsRepair(BaseModel):
+    instructions: List[str]
+
+class ImageUrlRepair(BaseModel):
+    image_url: Optional[str] = None
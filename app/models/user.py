@@ -10,6 +10,7 @@ class UserCreate(UserBase):
 class UserDisplay(UserBase):
     id: int
     is_active: bool
+    tier: Optional[str] = None
 
     class Config:
         orm_mode = True # For Pydantic V1, or from_attributes = True for V2
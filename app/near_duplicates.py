@@ -0,0 +1,116 @@
+"""MinHash fingerprints of converted pages, to reuse extractions of syndicated and copied recipes.
+
+The same recipe is often republished on other sites with a different header, footer and
+sidebar, so the archive's exact content hashes differ. The fingerprint is a MinHash
+signature of the page's word shingles, taken over its ingredients and method sections when
+both are found (which leaves most of the copying site's chrome out) and over the whole page
+otherwise. The share of equal signature values estimates the Jaccard similarity of two pages.
+
+Each canonical recipe stores its page's signature and one key per band of four values, and
+the band keys are indexed: pages sharing a band are the only ones compared, so a lookup costs
+the same with a thousand recipes as with a million. A page at least `NEAR_DUPLICATE_MIN_SIMILARITY`
+similar to a stored one reuses its extraction, provided its recipe name appears on the new page.
+(SimHash was tried first; on recipe-sized pages a changed footer line moved it 10+ bits.)
+"""
+import hashlib
+import os
+import random
+import re
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+from .recipe_quality import normalize_text
+from .recipe_repair import SECTION_KEYWORDS
+from .utils.markdown_utils import find_section
+
+NEAR_DUPLICATE_ENABLED = os.getenv("NEAR_DUPLICATE_ENABLED", "true").lower() in ("1", "true", "yes")
+NEAR_DUPLICATE_MIN_SIMILARITY = float(os.getenv("NEAR_DUPLICATE_MIN_SIMILARITY", "0.8"))
+NEAR_DUPLICATE_MIN_WORDS = int(os.getenv("NEAR_DUPLICATE_MIN_WORDS", "40"))
+NEAR_DUPLICATE_EXTRACTION_MODEL = "near-duplicate"
+
+SIGNATURE_SIZE = 64
+BAND_ROWS = 4  # 16 bands: pages 80% similar share one with probability 0.9998, pages 30% similar with 0.12
+BAND_COUNT = SIGNATURE_SIZE // BAND_ROWS
+SHINGLE_WORDS = 3
+SECTION_CHARS = 20000
+_PRIME = (1 << 61) - 1
+_VALUE_MASK = (1 << 32) - 1
+_rng = random.Random(0x5eed)  # the permutations must never change: stored signatures depend on them
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(_PRIME)) for _ in range(SIGNATURE_SIZE)]
+_LINK_TARGET_RE = re.compile(r"\]\([^)]*\)|https?://\S+")  # link and image URLs carry the copying site's domain
+_WORD_RE = re.compile(r"\w+")
+
+
+@dataclass
+class NearDuplicateStats:
+    fingerprinted: int = 0
+    too_short: int = 0  # pages with too little text for a reliable fingerprint
+    candidates: int = 0  # stored pages sharing a band, compared value by value
+    rejected: int = 0  # similar enough, but the recipe name is not on the new page
+    extractions_avoided: int = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "enabled": NEAR_DUPLICATE_ENABLED,
+            "min_similarity": NEAR_DUPLICATE_MIN_SIMILARITY,
+            **vars(self),
+            "avoided_rate": round(self.extractions_avoided / self.fingerprinted, 3) if self.fingerprinted else None,
+        }
+
+
+near_duplicate_stats = NearDuplicateStats()
+
+
+def _hash64(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def fingerprinted_text(markdown_content: str) -> str:
+    """The page's ingredients and method sections, or the whole page when it lacks either."""
+    sections = [find_section(markdown_content, keywords, SECTION_CHARS) for keywords in SECTION_KEYWORDS.values()]
+    return "\n".join(sections) if all(sections) else markdown_content
+
+
+def content_signature(markdown_content: str) -> Optional[List[int]]:
+    """The page's MinHash signature, or None when it has fewer than NEAR_DUPLICATE_MIN_WORDS words."""
+    words = _WORD_RE.findall(normalize_text(_LINK_TARGET_RE.sub("]", fingerprinted_text(markdown_content or ""))))
+    if len(words) < max(NEAR_DUPLICATE_MIN_WORDS, SHINGLE_WORDS):
+        return None
+    shingles = {_hash64(" ".join(words[i:i + SHINGLE_WORDS])) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    return [min((a * shingle + b) % _PRIME for shingle in shingles) & _VALUE_MASK for a, b in _PERMUTATIONS]
+
+
+def format_signature(signature: List[int]) -> str:
+    return "".join(f"{value:08x}" for value in signature)
+
+
+def parse_signature(stored: str) -> List[int]:
+    return [int(stored[i:i + 8], 16) for i in range(0, len(stored), 8)]
+
+
+def signature_bands(signature: List[int]) -> List[int]:
+    """One key per band of BAND_ROWS values, tagged with the band's position; fits a signed 64-bit column."""
+    return [
+        band << 48 | _hash64(" ".join(map(str, signature[band * BAND_ROWS:(band + 1) * BAND_ROWS]))) >> 16
+        for band in range(BAND_COUNT)
+    ]
+
+
+def estimated_similarity(a: List[int], b: List[int]) -> float:
+    return sum(x == y for x, y in zip(a, b)) / SIGNATURE_SIZE
+
+
+def closest_duplicates(signature: List[int], candidates: Iterable, markdown_content: str) -> List:
+    """Canonical recipes from `candidates` similar enough to the page and named on it, most similar first."""
+    page_text = " ".join(normalize_text(markdown_content).split())
+    matches = []
+    for canonical in candidates:
+        near_duplicate_stats.candidates += 1
+        similarity = estimated_similarity(signature, parse_signature(canonical.content_signature))
+        if similarity < NEAR_DUPLICATE_MIN_SIMILARITY:
+            continue
+        if " ".join(normalize_text(canonical.name).split()) not in page_text:
+            near_duplicate_stats.rejected += 1
+            continue
+        matches.append((-similarity, canonical.id, canonical))
+    return [canonical for _, _, canonical in sorted(matches, key=lambda match: match[:2])]
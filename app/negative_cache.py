@@ -0,0 +1,100 @@
+import os
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import httpx
+from pydantic import ValidationError
+
+from .deadline import DeadlineExceeded
+from .fetch_scheduler import FetchDisallowed
+from .html_processor import NotHtmlContent
+from .recipe_repair import SECTION_KEYWORDS
+from .utils.markdown_utils import find_section
+
+NEGATIVE_CACHE_ENABLED = os.getenv("NEGATIVE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid")
+
+
+@dataclass(frozen=True)
+class FailurePolicy:
+    ttl_seconds: float
+    status_code: int  # 503 for failures worth retrying soon, 422 for the page itself
+    message: str
+
+
+def _ttl(failure_class: str, default: float) -> float:
+    return float(os.getenv(f"NEGATIVE_CACHE_TTL_{failure_class.upper()}", str(default)))
+
+
+FAILURE_POLICIES = {
+    "timeout": FailurePolicy(_ttl("timeout", 10 * 60), 503, "Fetching the page timed out."),
+    "network_error": FailurePolicy(_ttl("network_error", 15 * 60), 503, "The page could not be reached."),
+    "server_error": FailurePolicy(_ttl("server_error", 30 * 60), 503, "The site returned a server error or kept throttling us."),
+    "not_found": FailurePolicy(_ttl("not_found", 24 * 3600), 422, "The page does not exist."),
+    "http_error": FailurePolicy(_ttl("http_error", 6 * 3600), 422, "The site refused to serve the page."),
+    "robots_disallowed": FailurePolicy(_ttl("robots_disallowed", 24 * 3600), 422, "The site's robots.txt does not allow fetching this page."),
+    "not_html": FailurePolicy(_ttl("not_html", 24 * 3600), 422, "The URL is not an HTML page."),
+    "empty_page": FailurePolicy(_ttl("empty_page", 3600), 422, "The page has no readable content."),
+    "extraction_failed": FailurePolicy(_ttl("extraction_failed", 3600), 422, "No valid recipe could be extracted from the page."),
+    "not_a_recipe": FailurePolicy(_ttl("not_a_recipe", 7 * 24 * 3600), 422, "The page does not look like a recipe."),
+}
+
+
+class CachedUrlFailure(Exception):
+    """Raised instead of re-running the pipeline for a URL that failed recently."""
+
+    def __init__(self, url: str, failure_class: str, retry_after: int):
+        self.url = url
+        self.failure_class = failure_class
+        self.retry_after = retry_after
+        self.policy = FAILURE_POLICIES.get(failure_class, FAILURE_POLICIES["extraction_failed"])
+        super().__init__(f"{url} failed recently ({failure_class}); retry in {retry_after}s")
+
+    @property
+    def message(self) -> str:
+        return f"{self.policy.message} This page failed recently; it will be retried automatically later, or immediately with force=true."
+
+
+def canonical_url(url: str) -> str:
+    """The cache key for a page: lower-case scheme and host, no fragment, default port or tracking parameters."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    query = urlencode([(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not k.lower().startswith(TRACKING_PARAMS)])
+    return urlunsplit((scheme, host, parts.path or "/", query, ""))
+
+
+def classify_exception(exc: BaseException) -> Optional[str]:
+    """Failure class for an exception raised by the pipeline, or None for errors that should not be cached."""
+    if isinstance(exc, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        if status in (404, 410):
+            return "not_found"
+        if status >= 500 or status == 429:
+            return "server_error"
+        return "http_error"
+    if isinstance(exc, httpx.RequestError):
+        return "network_error"
+    if isinstance(exc, FetchDisallowed):
+        return "robots_disallowed"
+    if isinstance(exc, NotHtmlContent):
+        return "not_html"
+    if isinstance(exc, DeadlineExceeded):
+        # A slow site is the page's problem; a slow conversion or model is ours.
+        return "timeout" if exc.stage == "fetch" else None
+    if isinstance(exc, ValidationError):
+        return "extraction_failed"
+    return None
+
+
+def classify_empty_extraction(markdown_content: str) -> str:
+    """A page with neither an ingredients nor a method section is "not a recipe"; otherwise extraction failed."""
+    for keywords in SECTION_KEYWORDS.values():
+        if find_section(markdown_content, keywords, max_chars=1):
+            return "extraction_failed"
+    return "not_a_recipe"
@@ -0,0 +1,227 @@
+"""Offline extraction over saved HTML: a directory of pages, or a tarball of them.
+
+    python -m app.offline_extract saved-pages/ --workers 8 --output recipes.ndjson
+    python -m app.offline_extract pages.tar.gz --database --user-id 3 --url-base https://blog.example/
+
+Every `.html`/`.htm` file goes through the same conversion and extraction stack as the web server
+(RecipeService: Markdown conversion, domain templates, the model cascade), `--workers` pages at a
+time, without starting the server or fetching anything. Results are appended to an NDJSON file,
+or stored as canonical recipes (and linked into `--user-id`'s library) with `--database`.
+
+A page's source URL is taken from its `<link rel="canonical">` or `og:url`, or built from
+`--url-base` and the file's path. Progress is recorded in a checkpoint file keyed by the file's
+path, so an interrupted run resumes with the pages it has not finished.
+"""
+import argparse
+import asyncio
+import json
+import re
+import tarfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urljoin
+
+from .database import SessionLocal, add_canonical_recipes, create_db_and_tables, get_canonical_recipe_by_url, link_recipes_for_user
+from .near_duplicates import NEAR_DUPLICATE_ENABLED, content_signature
+from .page_archive import page_archive
+from .recipe_service import RecipeService
+from .utils.batch import Checkpoint
+from .utils.logger_config import get_app_logger
+from .utils.markdown_utils import html_to_markdown
+
+logger = get_app_logger(__name__)
+
+HTML_SUFFIXES = (".html", ".htm", ".xhtml")
+URL_SCAN_CHARS = 64 * 1024
+_HEAD_TAG_RE = re.compile(r"<(?:link|meta)\b[^>]*>", re.IGNORECASE)
+_ATTRIBUTE_RE = re.compile(r"([\w:-]+)\s*=\s*(?:\"([^\"]*)\"|'([^']*)'|([^\s>]+))")
+
+
+def iter_pages(source: Path) -> Iterator[Tuple[str, str]]:
+    """(relative path, HTML) for every page in a directory or a tarball, read one at a time."""
+    source = Path(source)
+    if source.is_dir():
+        for path in sorted(source.rglob("*")):
+            if path.is_file() and path.suffix.lower() in HTML_SUFFIXES:
+                yield path.relative_to(source).as_posix(), path.read_text(encoding="utf-8", errors="replace")
+        return
+    with tarfile.open(source) as archive:
+        for member in archive:
+            if member.isfile() and Path(member.name).suffix.lower() in HTML_SUFFIXES:
+                yield member.name, archive.extractfile(member).read().decode("utf-8", errors="replace")
+
+
+def page_url(html_content: str, path: str, url_base: Optional[str] = None) -> Optional[str]:
+    """The page's canonical URL, or `url_base` joined with its path, or None."""
+    for tag in _HEAD_TAG_RE.findall(html_content[:URL_SCAN_CHARS]):
+        attributes = {name.lower(): double or single or bare for name, double, single, bare in _ATTRIBUTE_RE.findall(tag)}
+        is_canonical = attributes.get("rel", "").lower() == "canonical" and attributes.get("href")
+        is_og_url = attributes.get("property", "").lower() == "og:url" and attributes.get("content")
+        url = attributes.get("href") if is_canonical else attributes.get("content") if is_og_url else None
+        if url and url.startswith(("http://", "https://")):
+            return url
+    if url_base:
+        return urljoin(url_base if url_base.endswith("/") else f"{url_base}/", path)
+    return None
+
+
+class QuickConverter:
+    """Stand-in for MarkdownConverter that converts without starting a browser (`--quick-convert`)."""
+
+    async def to_markdown(self, html_content: str, url: str) -> str:
+        return await asyncio.to_thread(html_to_markdown, html_content, url)
+
+
+class OfflineExtractor:
+    def __init__(self, args: argparse.Namespace, service: RecipeService):
+        self.args = args
+        self.service = service
+
+    def _store(self, db, url: str, html_content: str, markdown_content: str, recipe, extraction_model: str) -> int:
+        html_sha256, markdown_sha256 = page_archive.archive_page(html_content, markdown_content)
+        signature = content_signature(markdown_content) if NEAR_DUPLICATE_ENABLED else None
+        canonical = add_canonical_recipes(db, [(recipe, url)], html_sha256=html_sha256, markdown_sha256=markdown_sha256, extraction_model=extraction_model, content_signature=signature)[0]
+        if self.args.user_id is not None:
+            link_recipes_for_user(db, [canonical], self.args.user_id)
+        return canonical.id
+
+    async def process(self, db, path: str, html_content: str) -> dict:
+        """Extracts one saved page and returns its result line."""
+        started = time.perf_counter()
+        entry = await self._process(db, path, html_content)
+        entry["seconds"] = round(time.perf_counter() - started, 3)
+        return entry
+
+    async def _process(self, db, path: str, html_content: str) -> dict:
+        url = page_url(html_content, path, self.args.url_base)
+        entry: Dict[str, object] = {"id": path, "source_url": url}
+        try:
+            if self.args.database:
+                if not url:
+                    return dict(entry, status="failed", error="no source URL in the page; pass --url-base")
+                existing = get_canonical_recipe_by_url(db, url)
+                if existing is not None:
+                    if self.args.user_id is not None:
+                        link_recipes_for_user(db, [existing], self.args.user_id)
+                    return dict(entry, status="exists", recipe_id=existing.id)
+
+            recipe, markdown_content, extraction_model = await self.service.extract_from_html(db, url, html_content, use_templates=not self.args.no_templates)
+            entry["extraction_model"] = extraction_model
+            if recipe is None:
+                return dict(entry, status="no_recipe" if markdown_content else "empty_page")
+            entry["status"] = "extracted"
+            if self.args.database:
+                entry["recipe_id"] = self._store(db, url, html_content, markdown_content, recipe, extraction_model)
+            else:
+                entry["recipe"] = recipe.model_dump(mode="json", exclude={"id", "image_variants"})
+            return entry
+        except Exception as e:
+            logger.exception(f"Offline extraction of {path} failed: {e}")
+            db.rollback()
+            return dict(entry, status="failed", error=str(e)[:500])
+
+    async def run(self, pages: Iterator[Tuple[str, str]], checkpoint: Optional[Checkpoint], output: Optional[Path]) -> Counter:
+        """Feeds pages to `--workers` workers through a bounded queue, so only a few pages are in memory at once."""
+        workers = max(1, self.args.workers)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=workers * 2)
+        totals: Counter = Counter()
+        started = time.perf_counter()
+        report = output.open("a", encoding="utf-8") if output else None
+
+        async def worker():
+            db = SessionLocal()
+            try:
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        return
+                    entry = await self.process(db, *item)
+                    totals[entry["status"]] += 1
+                    if report is not None:
+                        report.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                        report.flush()
+                    if checkpoint is not None:
+                        checkpoint.record([{"id": entry["id"], "status": entry["status"]}])
+                    processed = sum(totals.values())
+                    if processed % 50 == 0:
+                        print(f"[{time.perf_counter() - started:7.1f}s] {processed} pages processed")
+            finally:
+                db.close()
+
+        tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+        try:
+            for path, html_content in pages:
+                await queue.put((path, html_content))
+            for _ in tasks:
+                await queue.put(None)
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            if report is not None:
+                report.close()
+        return totals
+
+
+def pending_pages(source: Path, checkpoint: Optional[Checkpoint], retry_failed: bool = False, limit: Optional[int] = None) -> Iterator[Tuple[str, str]]:
+    yielded = 0
+    for path, html_content in iter_pages(source):
+        if limit is not None and yielded >= limit:
+            return
+        if checkpoint is not None and path in checkpoint and not (retry_failed and checkpoint.done[path].get("status") == "failed"):
+            continue
+        yielded += 1
+        yield path, html_content
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.offline_extract", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", type=Path, help="A directory of saved .html files, or a .tar / .tar.gz of them.")
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument("--output", type=Path, default=Path("offline-recipes.ndjson"), help="NDJSON file results are appended to (default offline-recipes.ndjson).")
+    output.add_argument("--database", action="store_true", help="Store recipes in the database instead of writing NDJSON.")
+    parser.add_argument("--user-id", type=int, help="With --database, also add the recipes to this user's library.")
+    parser.add_argument("--url-base", help="Base URL a page's path is joined to when it has no canonical URL.")
+    parser.add_argument("--workers", type=int, default=4, help="Pages extracted at the same time (default 4).")
+    parser.add_argument("--limit", type=int, help="Process at most this many pages.")
+    parser.add_argument("--quick-convert", action="store_true", help="Convert pages to Markdown without the crawl4ai browser; much faster, slightly rougher Markdown.")
+    parser.add_argument("--no-templates", action="store_true", help="Always run the model, e.g. to evaluate a model or prompt.")
+    parser.add_argument("--checkpoint", type=Path, default=Path("offline-checkpoint.jsonl"), help="Progress file used to resume.")
+    parser.add_argument("--fresh", action="store_true", help="Ignore and replace an existing checkpoint.")
+    parser.add_argument("--retry-failed", action="store_true", help="Re-process pages the checkpoint records as failed.")
+    return parser
+
+
+async def main_async(args: argparse.Namespace) -> Counter:
+    if not args.source.exists():
+        raise SystemExit(f"{args.source} does not exist.")
+    if args.user_id is not None and not args.database:
+        raise SystemExit("--user-id needs --database.")
+    create_db_and_tables()
+    service = RecipeService()
+    if not service.recipe_agent.tiers:
+        raise SystemExit("The extraction agent is not configured; check AI_PROVIDER / AI_CASCADE.")
+    if args.quick_convert:
+        service.markdown_converter = QuickConverter()
+
+    checkpoint = Checkpoint(args.checkpoint, fresh=args.fresh)
+    started = time.perf_counter()
+    pages = pending_pages(args.source, checkpoint, args.retry_failed, args.limit)
+    totals = await OfflineExtractor(args, service).run(pages, checkpoint, None if args.database else args.output)
+
+    elapsed = time.perf_counter() - started
+    processed = sum(totals.values())
+    summary = ", ".join(f"{count} {status}" for status, count in sorted(totals.items())) or "nothing to do"
+    print(f"Done: {processed} pages in {elapsed:.1f}s ({processed / elapsed if elapsed else 0:.1f}/s): {summary}. "
+          f"{'Stored in the database' if args.database else f'Results: {args.output}'}.")
+    return totals
+
+
+def main(argv: Optional[List[str]] = None):
+    asyncio.run(main_async(build_parser().parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import gzip
+import hashlib
+import os
+from pathlib import Path
+from typing import Optional, Tuple
+
+from .utils.logger_config import get_app_logger
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional; gzip is always available
+    zstandard = None
+
+logger = get_app_logger(__name__)
+
+PAGE_ARCHIVE_DIR = Path(os.getenv("PAGE_ARCHIVE_DIR", Path(__file__).resolve().parent / "archive"))
+PAGE_ARCHIVE_MAX_DOCUMENT_BYTES = int(os.getenv("PAGE_ARCHIVE_MAX_DOCUMENT_BYTES", str(8 * 1024 * 1024)))
+PAGE_ARCHIVE_MAX_TOTAL_BYTES = int(os.getenv("PAGE_ARCHIVE_MAX_TOTAL_BYTES", str(2 * 1024 * 1024 * 1024)))
+ZSTD_LEVEL = 10
+
+
+class PageArchive:
+    """Content-addressed, compressed store for fetched HTML and converted Markdown.
+
+    Documents are keyed by the SHA-256 of their text, so a page fetched twice, or shared by several
+    recipes, is stored once. Documents over `max_document_bytes` are not archived, and once the
+    archive grows past `max_total_bytes` the least recently used files are pruned. A recipe whose
+    archived page was pruned is simply re-fetched.
+    """
+
+    def __init__(self, directory: Path = PAGE_ARCHIVE_DIR, max_document_bytes: int = PAGE_ARCHIVE_MAX_DOCUMENT_BYTES, max_total_bytes: int = PAGE_ARCHIVE_MAX_TOTAL_BYTES):
+        self.directory = Path(directory)
+        self.max_document_bytes = max_document_bytes
+        self.max_total_bytes = max_total_bytes
+        self._total_bytes: Optional[int] = None
+
+    def _path(self, digest: str, extension: str) -> Path:
+        return self.directory / digest[:2] / f"{digest}.{extension}"
+
+    def _existing_path(self, digest: str) -> Optional[Path]:
+        for extension in ("zst", "gz"):
+            path = self._path(digest, extension)
+            if path.exists():
+                return path
+        return None
+
+    def total_bytes(self) -> int:
+        if self._total_bytes is None:
+            self._total_bytes = sum(p.stat().st_size for p in self.directory.rglob("*.*") if p.is_file()) if self.directory.exists() else 0
+        return self._total_bytes
+
+    def put(self, text: str) -> Optional[str]:
+        """Stores a document and returns its SHA-256, or None when it is empty or over the size cap."""
+        if not text:
+            return None
+        data = text.encode("utf-8")
+        if len(data) > self.max_document_bytes:
+            logger.info(f"Not archiving a {len(data)}-byte document (cap {self.max_document_bytes}).")
+            return None
+
+        digest = hashlib.sha256(data).hexdigest()
+        existing = self._existing_path(digest)
+        if existing is not None:
+            os.utime(existing)
+            return digest
+
+        if zstandard is not None:
+            path, compressed = self._path(digest, "zst"), zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+        else:
+            path, compressed = self._path(digest, "gz"), gzip.compress(data, compresslevel=6, mtime=0)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(compressed)
+        os.replace(tmp_path, path)
+
+        self._total_bytes = self.total_bytes() + len(compressed)
+        if self._total_bytes > self.max_total_bytes:
+            self.prune()
+        return digest
+
+    def get(self, digest: Optional[str]) -> Optional[str]:
+        """Returns an archived document, or None if it was never stored or has been pruned."""
+        path = self._existing_path(digest) if digest else None
+        if path is None:
+            return None
+        data = path.read_bytes()
+        if path.suffix == ".zst":
+            if zstandard is None:
+                logger.warning(f"Archived document {digest} is zstd-compressed but zstandard is not installed.")
+                return None
+            data = zstandard.ZstdDecompressor().decompress(data)
+        else:
+            data = gzip.decompress(data)
+        os.utime(path)
+        return data.decode("utf-8")
+
+    def prune(self, target_ratio: float = 0.9):
+        """Deletes least recently used documents until the archive is below `target_ratio` of its cap."""
+        files = sorted((p for p in self.directory.rglob("*.*") if p.suffix in (".zst", ".gz")), key=lambda p: p.stat().st_mtime)
+        total = sum(p.stat().st_size for p in files)
+        target = self.max_total_bytes * target_ratio
+        removed = 0
+        for path in files:
+            if total <= target:
+                break
+            total -= path.stat().st_size
+            path.unlink(missing_ok=True)
+            removed += 1
+        self._total_bytes = total
+        if removed:
+            logger.info(f"Pruned {removed} documents from the page archive; {total} bytes remain.")
+
+    def archive_page(self, html_content: Optional[str], markdown_content: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        """Archives a fetched page and its Markdown. Failures are logged and never block extraction."""
+        try:
+            return self.put(html_content), self.put(markdown_content)
+        except OSError as e:
+            logger.warning(f"Could not archive page: {e}")
+            return None, None
+
+
+page_archive = PageArchive()
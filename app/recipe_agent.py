@@ -1,98 +1,298 @@
 import sys
 import os
-from typing import Optional, Type
+import re
+import time
+import asyncio
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Optional, Type, List, Dict, Tuple, AsyncIterator
 from dotenv import load_dotenv
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 
-# Imports for pydantic-ai 0.2.4 based on scrap_agent.py
-from pydantic_ai import Agent  # Main class
-from pydantic_ai.models.openai import OpenAIModel # OpenAI Model definition
-from pydantic_ai.models.gemini import GeminiModel   # Gemini Model definition
-from pydantic_ai.providers.openai import OpenAIProvider # OpenAI Provider definition
-# Note: Gemini provider for 0.2.4 might be implicit via GeminiModel or google-generativeai library
+# pydantic-ai and the provider SDKs take most of the import time of the app, so they are imported
+# on first use (or by the startup warm-up, app/startup.py) rather than at module import.
+if TYPE_CHECKING:
+    from pydantic_ai import Agent
 
-from .models.recipe import Recipe
+from .deadline import current_deadline, deadline_stats
+from .models.recipe import Recipe, PartialRecipe, PartialRecipeCollection
+from .recipe_quality import find_field_issues, find_quality_issues, is_valid_image_url, normalize_text
+from .recipe_repair import REPAIR_MODELS, build_repair_prompt
+from .utils.markdown_utils import split_markdown
 
 load_dotenv()
 
+STREAM_DEBOUNCE_SECONDS = float(os.getenv("AI_STREAM_DEBOUNCE_SECONDS", "0.1"))
+MAX_PROMPT_CHARS = int(os.getenv("AI_MAX_PROMPT_CHARS", "48000"))
+CHUNK_OVERLAP_CHARS = int(os.getenv("AI_CHUNK_OVERLAP_CHARS", "1500"))
+CHUNK_CONCURRENCY = int(os.getenv("AI_CHUNK_CONCURRENCY", "4"))
+# With less extraction budget than this left, the cascade keeps the answer it has instead of escalating.
+EXTRACT_ESCALATION_MIN_SECONDS = float(os.getenv("EXTRACT_ESCALATION_MIN_SECONDS", "20"))
+EXTRACT_DEADLINE_MARGIN_SECONDS = 1.0
+
+@dataclass
+class ModelTier:
+    identifier: str
+    agent: "Agent"
+    cost_per_1k_tokens: float = 0.0
+    model: object = None
+    output_agents: Dict[type, "Agent"] = field(default_factory=dict)
+
+    def agent_for(self, output_type: type) -> "Agent":
+        """Returns an agent on this tier's model that produces `output_type`, creating it on first use."""
+        if output_type not in self.output_agents:
+            from pydantic_ai import Agent
+            self.output_agents[output_type] = Agent(model=self.model or self.agent.model, output_type=output_type)
+        return self.output_agents[output_type]
+
+
+@dataclass
+class TierStats:
+    identifier: str
+    attempts: int = 0
+    accepted: int = 0
+    rejected: int = 0
+    errors: int = 0
+    repairs: int = 0
+    repaired: int = 0
+    total_latency: float = 0.0
+    total_tokens: int = 0
+    total_cost: float = 0.0
+
+
+@dataclass
+class CascadeStats:
+    """Process-wide counters describing how the extraction cascade resolves requests."""
+    tiers: Dict[str, TierStats] = field(default_factory=dict)
+    requests: int = 0
+    unresolved: int = 0
+    total_latency: float = 0.0
+    total_cost: float = 0.0
+    top_tier_cost_estimate: float = 0.0
+    resolved_below_top: int = 0
+    latency_below_top: float = 0.0
+
+    def tier(self, identifier: str) -> TierStats:
+        if identifier not in self.tiers:
+            self.tiers[identifier] = TierStats(identifier=identifier)
+        return self.tiers[identifier]
+
+    def record_request(self, latency: float, cost: float, top_tier_cost: float, resolved_by_top: bool, resolved: bool):
+        self.requests += 1
+        self.total_latency += latency
+        self.total_cost += cost
+        self.top_tier_cost_estimate += top_tier_cost
+        if not resolved:
+            self.unresolved += 1
+        elif not resolved_by_top:
+            self.resolved_below_top += 1
+            self.latency_below_top += latency
+
+    def snapshot(self) -> dict:
+        tiers = []
+        for stats in self.tiers.values():
+            tiers.append({
+                "model": stats.identifier,
+                "attempts": stats.attempts,
+                "accepted": stats.accepted,
+                "rejected": stats.rejected,
+                "errors": stats.errors,
+                "field_repairs": stats.repairs,
+                "fields_repaired": stats.repaired,
+                "share_of_requests": stats.accepted / self.requests if self.requests else 0.0,
+                "avg_latency_seconds": stats.total_latency / stats.attempts if stats.attempts else None,
+                "total_tokens": stats.total_tokens,
+                "total_cost": round(stats.total_cost, 6),
+            })
+
+        top = list(self.tiers.values())[-1] if self.tiers else None
+        avg_latency_saved = None
+        if top and top.attempts and self.resolved_below_top:
+            top_avg_latency = top.total_latency / top.attempts
+            avg_latency_saved = top_avg_latency - self.latency_below_top / self.resolved_below_top
+
+        return {
+            "requests": self.requests,
+            "unresolved": self.unresolved,
+            "avg_latency_seconds": self.total_latency / self.requests if self.requests else None,
+            "avg_latency_saved_seconds": avg_latency_saved,
+            "total_cost": round(self.total_cost, 6),
+            "estimated_top_tier_cost": round(self.top_tier_cost_estimate, 6),
+            "estimated_cost_saved": round(self.top_tier_cost_estimate - self.total_cost, 6),
+            "tiers": tiers,
+        }
+
+
+cascade_stats = CascadeStats()
+
+
+def _usage_tokens(result) -> int:
+    usage = result.usage()
+    return usage.total_tokens or (usage.request_tokens or 0) + (usage.response_tokens or 0)
+
+
+def _dedupe_key(line: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", normalize_text(line)).strip()
+
+
+def merge_recipe_fragments(fragments: List[PartialRecipe]) -> dict:
+    """Reduces per-chunk fragments into one recipe payload.
+
+    The name is the one most chunks agree on, list items keep page order with overlap
+    duplicates removed, and the first absolute image URL wins.
+    """
+    names = [f.name.strip() for f in fragments if f.name and f.name.strip()]
+    merged = {
+        "name": Counter(names).most_common(1)[0][0] if names else "",
+        "ingredients": [],
+        "instructions": [],
+        "image_url": next((f.image_url for f in fragments if f.image_url and f.image_url.startswith(("http://", "https://"))), None),
+    }
+    for field_name in ("ingredients", "instructions"):
+        seen = set()
+        for fragment in fragments:
+            for line in getattr(fragment, field_name):
+                key = _dedupe_key(line)
+                if key and key not in seen:
+                    seen.add(key)
+                    merged[field_name].append(line.strip())
+    return merged
+
+
+def group_fragments_by_recipe(fragments: List[PartialRecipe]) -> List[List[PartialRecipe]]:
+    """Groups fragments from several chunks by recipe name, in order of first appearance.
+
+    Unnamed fragments belong to the recipe seen just before them, since a chunk that starts
+    mid-recipe usually carries its remaining ingredients or steps without the title.
+    """
+    groups: Dict[str, List[PartialRecipe]] = {}
+    last_key = None
+    for fragment in fragments:
+        key = _dedupe_key(fragment.name or "") or last_key
+        if key is None:
+            key = ""
+        groups.setdefault(key, []).append(fragment)
+        last_key = key
+    return list(groups.values())
+
+
+def parse_cascade_spec(spec: str) -> List[Tuple[str, str, float]]:
+    """Parses AI_CASCADE entries of the form 'provider:model[@usd_per_1k_tokens]', cheapest first."""
+    tiers = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        cost = 0.0
+        if "@" in entry:
+            entry, cost_str = entry.rsplit("@", 1)
+            cost = float(cost_str)
+        provider, _, model_name = entry.partition(":")
+        if not model_name:
+            raise ValueError(f"Invalid AI_CASCADE entry '{entry}'. Expected 'provider:model'.")
+        tiers.append((provider.strip().lower(), model_name.strip(), cost))
+    return tiers
+
+
 class RecipeExtractorAgent:
     def __init__(self, output_model: Type[BaseModel] = Recipe):
-        self.agent: Optional[Agent] = None
+        self.agent: Optional["Agent"] = None
         self.output_model = output_model
         self.current_model_identifier = "N/A" # Store current model info
+        self.tiers: List[ModelTier] = []
         self._initialize_agent()
         if self.agent:
             print(f"RecipeExtractorAgent initialized using {self.current_model_identifier} with output model: {self.output_model.__name__}")
         else:
             print(f"RecipeExtractorAgent FAILED to initialize.")
 
+    def _build_model(self, ai_provider: str, model_name: Optional[str] = None):
+        """Returns a (model, identifier) pair for the given provider, reading defaults from the environment."""
+        if ai_provider in ("openai", "ollama"):
+            from pydantic_ai.models.openai import OpenAIModel # OpenAI Model definition
+            from pydantic_ai.providers.openai import OpenAIProvider # OpenAI Provider definition
+
+        if ai_provider == "openai":
+            openai_api_key = os.getenv("OPENAI_API_KEY")
+            openai_model_name = model_name or os.getenv("OPENAI_MODEL_NAME", "gpt-3.5-turbo")
+            if not openai_api_key:
+                raise ValueError("OPENAI_API_KEY not set for OpenAI provider.")
+            if not openai_model_name:
+                raise ValueError("OPENAI_MODEL_NAME not set for OpenAI provider.")
+
+            print(f"RecipeExtractorAgent: Configuring with OpenAI provider. Model: {openai_model_name}")
+            provider = OpenAIProvider(api_key=openai_api_key)
+            model_config = OpenAIModel(
+                model_name=openai_model_name,
+                provider=provider
+            )
+            return model_config, f"OpenAI model '{openai_model_name}'"
+
+        if ai_provider == "gemini":
+            gemini_api_key = os.getenv("GEMINI_API_KEY") # Used by google-generativeai library
+            gemini_model_name = model_name or os.getenv("GEMINI_MODEL_NAME", "gemini-1.5-flash")
+            if not gemini_model_name:
+                raise ValueError("GEMINI_MODEL_NAME not set for Gemini provider.")
+            # The google-generativeai library (a dependency for GeminiModel) typically looks for GOOGLE_API_KEY or GEMINI_API_KEY.
+            # Ensure your .env has GEMINI_API_KEY set if that's what you're using.
+            if not gemini_api_key:
+                print("RecipeExtractorAgent: GEMINI_API_KEY not found in environment variables. google-generativeai will try other auth methods.")
+
+            print(f"RecipeExtractorAgent: Configuring with Gemini provider. Model: {gemini_model_name}")
+            from pydantic_ai.models.gemini import GeminiModel # Gemini provider for 0.2.4 is implicit via GeminiModel
+            model_config = GeminiModel(
+                model_name=gemini_model_name
+                # For pydantic-ai 0.2.4, GeminiModel usually doesn't take api_key in constructor directly.
+                # It relies on the google-generativeai library's environment authentication (e.g., GOOGLE_API_KEY or GEMINI_API_KEY).
+            )
+            return model_config, f"Gemini model '{gemini_model_name}'"
+
+        if ai_provider == "ollama":
+            ollama_base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434/v1")
+            ollama_model_name = model_name or os.getenv("OLLAMA_MODEL_NAME", "llama3.1")
+            if not ollama_model_name:
+                raise ValueError("OLLAMA_MODEL_NAME not set for Ollama provider.")
+            print(f"RecipeExtractorAgent: Configuring with Ollama. Base URL: {ollama_base_url}, Model: {ollama_model_name}")
+            provider = OpenAIProvider(api_key="ollama", base_url=ollama_base_url)
+            model_config = OpenAIModel(model_name=ollama_model_name, provider=provider)
+            return model_config, f"Ollama model '{ollama_model_name}'"
+
+        raise ValueError(f"Unsupported AI_PROVIDER: '{ai_provider}'. Choose 'openai', 'gemini' or 'ollama'.")
+
     def _initialize_agent(self):
         ai_provider = os.getenv("AI_PROVIDER", "openai").lower()
-        model_config = None
+        cascade_spec = os.getenv("AI_CASCADE", "")
         self.current_model_identifier = "N/A"
+        self.tiers = []
 
         try:
-            if ai_provider == "openai":
-                openai_api_key = os.getenv("OPENAI_API_KEY")
-                openai_model_name = os.getenv("OPENAI_MODEL_NAME", "gpt-3.5-turbo")
-                if not openai_api_key:
-                    raise ValueError("OPENAI_API_KEY not set for OpenAI provider.")
-                if not openai_model_name:
-                    raise ValueError("OPENAI_MODEL_NAME not set for OpenAI provider.")
-                
-                print(f"RecipeExtractorAgent: Configuring with OpenAI provider. Model: {openai_model_name}")
-                provider = OpenAIProvider(api_key=openai_api_key)
-                model_config = OpenAIModel(
-                    model_name=openai_model_name,
-                    provider=provider
-                )
-                self.current_model_identifier = f"OpenAI model '{openai_model_name}'"
-
-            elif ai_provider == "gemini":
-                gemini_api_key = os.getenv("GEMINI_API_KEY") # Used by google-generativeai library
-                gemini_model_name = os.getenv("GEMINI_MODEL_NAME", "gemini-1.5-flash")
-                if not gemini_model_name:
-                    raise ValueError("GEMINI_MODEL_NAME not set for Gemini provider.")
-                # The google-generativeai library (a dependency for GeminiModel) typically looks for GOOGLE_API_KEY or GEMINI_API_KEY.
-                # Ensure your .env has GEMINI_API_KEY set if that's what you're using.
-                if not gemini_api_key:
-                    print("RecipeExtractorAgent: GEMINI_API_KEY not found in environment variables. google-generativeai will try other auth methods.")
-
-                print(f"RecipeExtractorAgent: Configuring with Gemini provider. Model: {gemini_model_name}")
-                model_config = GeminiModel(
-                    model_name=gemini_model_name
-                    # For pydantic-ai 0.2.4, GeminiModel usually doesn't take api_key in constructor directly.
-                    # It relies on the google-generativeai library's environment authentication (e.g., GOOGLE_API_KEY or GEMINI_API_KEY).
-                )
-                self.current_model_identifier = f"Gemini model '{gemini_model_name}'"
-            
-            # Example for OLLAMA (can be uncommented and adapted if needed)
-            # elif ai_provider == "ollama":
-            #     ollama_base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434/v1")
-            #     ollama_model_name = os.getenv("OLLAMA_MODEL_NAME", "llama3")
-            #     if not ollama_model_name:
-            #         raise ValueError("OLLAMA_MODEL_NAME not set for Ollama provider.")
-            #     print(f"RecipeExtractorAgent: Configuring with Ollama. Base URL: {ollama_base_url}, Model: {ollama_model_name}")
-            #     provider = OpenAIProvider(api_key="ollama", base_url=ollama_base_url)
-            #     model_config = OpenAIModel(model_name=ollama_model_name, provider=provider)
-            #     self.current_model_identifier = f"Ollama model '{ollama_model_name}'"
+            from pydantic_ai import Agent
 
+            if cascade_spec.strip():
+                tier_specs = parse_cascade_spec(cascade_spec)
             else:
-                raise ValueError(f"Unsupported AI_PROVIDER: '{ai_provider}'. Choose 'openai' or 'gemini'.")
+                tier_specs = [(ai_provider, None, float(os.getenv("AI_COST_PER_1K_TOKENS", "0")))]
 
-            if not model_config:
-                # This case should ideally be caught by the else for ai_provider, or if a provider block fails to set model_config
-                raise ValueError(f"Model configuration is None for provider: {ai_provider}. This should not happen if provider logic is correct.")
+            for provider_name, model_name, cost in tier_specs:
+                model_config, identifier = self._build_model(provider_name, model_name)
+                self.tiers.append(ModelTier(
+                    identifier=identifier,
+                    agent=Agent(model=model_config, output_type=self.output_model),
+                    cost_per_1k_tokens=cost,
+                    model=model_config,
+                ))
 
-            self.agent = Agent(
-                model=model_config, 
-                output_type=self.output_model
-            )
+            if not self.tiers:
+                raise ValueError("AI_CASCADE is set but does not define any model tier.")
+
+            self.agent = self.tiers[0].agent
+            self.current_model_identifier = " -> ".join(tier.identifier for tier in self.tiers)
             print(f"RecipeExtractorAgent: Agent successfully configured with {self.current_model_identifier}.")
 
         except ValueError as ve:
             print(f"RecipeExtractorAgent: Configuration ValueError: {ve}")
             self.agent = None
+            self.tiers = []
         except ImportError as ie:
             # Specific check for google-generativeai if Gemini is chosen
             if ai_provider == 'gemini' and 'google.generativeai' in str(ie).lower():
@@ -100,36 +300,276 @@ class RecipeExtractorAgent:
             else:
                 print(f"RecipeExtractorAgent: ImportError during PydanticAI setup: {ie}. Ensure pydantic-ai and provider libraries are installed.")
             self.agent = None
+            self.tiers = []
         except Exception as e:
             print(f"RecipeExtractorAgent: Error initializing Agent for provider '{ai_provider}': {e}")
             self.agent = None
+            self.tiers = []
+
+    def _build_prompt(self, markdown_content: str, multiple: bool = False) -> str:
+        if multiple:
+            instruction = (
+                "Extract every distinct recipe from the following markdown content, in page order. "
+                f"Each entry should conform to the {self.output_model.__name__} model."
+            )
+        else:
+            instruction = f"Extract the recipe details from the following markdown content. Output should conform to the {self.output_model.__name__} model."
+        return f"{instruction}\n\n--- MARKDOWN CONTENT STARTS ---{markdown_content}\n--- MARKDOWN CONTENT ENDS ---"
+
+    def _build_fragment_prompt(self, chunk: str, index: int, total: int, multiple: bool = False) -> str:
+        scope = "each recipe that appears in this part, as separate entries" if multiple else "the recipe"
+        instruction = (
+            f"The following markdown is part {index} of {total} of a recipe web page. "
+            f"Extract only the details of {scope} present in this part: the recipe name if it appears, "
+            "ingredient lines, instruction steps and the main image URL. Leave fields empty when this part does not contain them."
+        )
+        return f"{instruction}\n\n--- MARKDOWN CONTENT STARTS ---{chunk}\n--- MARKDOWN CONTENT ENDS ---"
+
+    async def _run_single(self, tier: ModelTier, markdown_content: str, multiple: bool = False):
+        expected_type = PartialRecipeCollection if multiple else PartialRecipe
+        result_container = await tier.agent_for(expected_type).run(self._build_prompt(markdown_content, multiple))
+        tokens = _usage_tokens(result_container)
+        if isinstance(result_container.output, expected_type):
+            return (result_container.output.recipes if multiple else result_container.output), tokens
+        print(f"RecipeExtractorAgent: Extraction using {tier.identifier} did not return expected model type. Got output type: {type(result_container.output)}")
+        return None, tokens
+
+    def _coerce_draft(self, draft: PartialRecipe) -> Optional[BaseModel]:
+        """Validates a draft into the output model, dropping a malformed image URL. None if still invalid."""
+        values = draft.model_dump()
+        if not is_valid_image_url(values.get("image_url")):
+            values["image_url"] = None
+        try:
+            return self.output_model.model_validate(values)
+        except ValidationError:
+            return None
+
+    async def _repair_draft(self, tier: ModelTier, draft: PartialRecipe, markdown_content: str):
+        """Re-requests only the fields that fail the quality checks, each from its own region of the page.
+
+        Every repair is a small prompt to the same tier, so a recipe with a good ingredient list but
+        no steps costs one short call instead of a full re-extraction. Returns (recipe or None, tokens).
+        """
+        issues = find_field_issues(draft, markdown_content)
+        values = draft.model_dump()
+        tokens = 0
+        if issues:
+            tier_stats = cascade_stats.tier(tier.identifier)
+            known_name = values.get("name") if "name" not in issues else None
+
+            async def repair_field(field_name: str):
+                prompt = build_repair_prompt(field_name, known_name, markdown_content)
+                if prompt is None:
+                    return field_name, None, 0
+                try:
+                    result = await tier.agent_for(REPAIR_MODELS[field_name]).run(prompt)
+                except Exception as e:
+                    print(f"RecipeExtractorAgent: Repair of '{field_name}' failed with {tier.identifier}: {e}")
+                    return field_name, None, 0
+                return field_name, getattr(result.output, field_name), _usage_tokens(result)
+
+            print(f"RecipeExtractorAgent: Repairing {', '.join(issues)} with {tier.identifier}.")
+            for field_name, value, field_tokens in await asyncio.gather(*(repair_field(f) for f in issues)):
+                tokens += field_tokens
+                tier_stats.repairs += 1
+                if value is None:
+                    continue
+                candidate = dict(values, **{field_name: value})
+                if field_name not in find_field_issues(PartialRecipe(**candidate), markdown_content):
+                    values = candidate
+                    tier_stats.repaired += 1
+        return self._coerce_draft(PartialRecipe(**values)), tokens
+
+    async def _run_chunked(self, tier: ModelTier, markdown_content: str, multiple: bool = False):
+        """Map-reduce extraction: fragments are extracted from overlapping chunks in parallel, then merged."""
+        chunks = split_markdown(markdown_content, MAX_PROMPT_CHARS, CHUNK_OVERLAP_CHARS)
+        print(f"RecipeExtractorAgent: Markdown has {len(markdown_content)} chars; extracting from {len(chunks)} chunks with {tier.identifier}.")
+        fragment_agent = tier.agent_for(PartialRecipeCollection if multiple else PartialRecipe)
+        semaphore = asyncio.Semaphore(CHUNK_CONCURRENCY)
+
+        async def extract_fragment(index: int, chunk: str):
+            async with semaphore:
+                try:
+                    result = await fragment_agent.run(self._build_fragment_prompt(chunk, index + 1, len(chunks), multiple))
+                except Exception as e:
+                    print(f"RecipeExtractorAgent: Chunk {index + 1}/{len(chunks)} failed with {tier.identifier}: {e}")
+                    return [], 0
+                fragments = result.output.recipes if multiple else [result.output]
+                return fragments, _usage_tokens(result)
+
+        results = await asyncio.gather(*(extract_fragment(i, chunk) for i, chunk in enumerate(chunks)))
+        tokens = sum(t for _, t in results)
+        fragments = [fragment for chunk_fragments, _ in results for fragment in chunk_fragments]
+        if not fragments:
+            return None, tokens
+
+        if multiple:
+            return [PartialRecipe(**merge_recipe_fragments(group)) for group in group_fragments_by_recipe(fragments)], tokens
+        return PartialRecipe(**merge_recipe_fragments(fragments)), tokens
+
+    async def _run_tier(self, tier: ModelTier, markdown_content: str, multiple: bool = False):
+        """Runs one tier and returns (output, tokens). Output is None when the run fails or returns the wrong type.
+
+        A single recipe gets its failing fields repaired in place; recipes on a multi-recipe page are
+        only coerced, and any that stay invalid are dropped.
+        """
+        tier_stats = cascade_stats.tier(tier.identifier)
+        tier_stats.attempts += 1
+        started = time.perf_counter()
+        tokens = 0
+        try:
+            if len(markdown_content) > MAX_PROMPT_CHARS:
+                output, tokens = await self._run_chunked(tier, markdown_content, multiple)
+            else:
+                output, tokens = await self._run_single(tier, markdown_content, multiple)
+            if output is not None and multiple:
+                output = [recipe for recipe in map(self._coerce_draft, output) if recipe is not None]
+            elif output is not None:
+                output, repair_tokens = await self._repair_draft(tier, output, markdown_content)
+                tokens += repair_tokens
+            if output is None:
+                tier_stats.errors += 1
+            return output, tokens
+        except Exception as e:
+            print(f"RecipeExtractorAgent: Error during recipe extraction with {tier.identifier}: {e}")
+            tier_stats.errors += 1
+            return None, tokens
+        finally:
+            tier_stats.total_latency += time.perf_counter() - started
+            tier_stats.total_tokens += tokens
+            tier_stats.total_cost += tokens / 1000 * tier.cost_per_1k_tokens
 
     async def extract_recipe_from_markdown(self, markdown_content: str) -> Optional[Recipe]:
         if not self.agent:
             print(f"PydanticAI Agent is not initialized (current expected provider: {os.getenv('AI_PROVIDER', 'N/A').lower()}). Cannot extract recipe.")
             return None
-        
+        return await self._run_cascade(markdown_content)
+
+    async def extract_recipes_from_markdown(self, markdown_content: str) -> List[Recipe]:
+        """Extracts every recipe on a page in one cascade run. Returns an empty list on failure."""
+        if not self.agent:
+            print(f"PydanticAI Agent is not initialized (current expected provider: {os.getenv('AI_PROVIDER', 'N/A').lower()}). Cannot extract recipes.")
+            return []
+        return await self._run_cascade(markdown_content, multiple=True) or []
+
+    async def stream_recipe_from_markdown(self, markdown_content: str) -> AsyncIterator[Tuple[BaseModel, bool]]:
+        """Yields (PartialRecipe, False) while the first tier streams, then (Recipe, True) once validated.
+
+        Failing fields of the streamed draft are repaired with targeted prompts first. If the recipe
+        still fails validation or the quality checks, the remaining tiers run
+        without streaming and their result is yielded as the final value. Pages too long for a
+        single prompt go through chunked extraction and only yield the final recipe.
+        """
+        if not self.agent:
+            print(f"PydanticAI Agent is not initialized (current expected provider: {os.getenv('AI_PROVIDER', 'N/A').lower()}). Cannot extract recipe.")
+            return
+
+        if len(markdown_content) > MAX_PROMPT_CHARS:
+            final_recipe = await self._run_cascade(markdown_content)
+            if final_recipe is not None:
+                yield final_recipe, True
+            return
+
+        tier = self.tiers[0]
+        tier_stats = cascade_stats.tier(tier.identifier)
+        tier_stats.attempts += 1
+        started = time.perf_counter()
+        draft = None
+        tokens = 0
+        print(f"RecipeExtractorAgent: Streaming recipe extraction using {tier.identifier}...")
         try:
-            instruction = f"Extract the recipe details from the following markdown content. Output should conform to the {self.output_model.__name__} model."
-            prompt = f"{instruction}\n\n--- MARKDOWN CONTENT STARTS ---{markdown_content}\n--- MARKDOWN CONTENT ENDS ---"
-            
-            print(f"RecipeExtractorAgent: Attempting to extract recipe using {self.current_model_identifier}...")
-            
-            result_container = await self.agent.run(prompt)
-            
-            if result_container and hasattr(result_container, 'output') and isinstance(result_container.output, self.output_model):
-                print(f"RecipeExtractorAgent: Extraction successful using {self.current_model_identifier}.")
-                return result_container.output
-            else:
-                error_message = f"RecipeExtractorAgent: Extraction using {self.current_model_identifier} did not return expected model type or structure."
-                if result_container and hasattr(result_container, 'output'):
-                    error_message += f" Got output type: {type(result_container.output)}"
-                elif result_container:
-                    error_message += f" Got result: {result_container}"
-                print(error_message)
-                return None
+            async with tier.agent_for(PartialRecipe).run_stream(self._build_prompt(markdown_content)) as result:
+                async for draft in result.stream(debounce_by=STREAM_DEBOUNCE_SECONDS or None):
+                    yield draft, False
+                tokens = _usage_tokens(result)
         except Exception as e:
-            print(f"RecipeExtractorAgent: Error during recipe extraction with {self.current_model_identifier}: {e}")
-            return None
+            print(f"RecipeExtractorAgent: Error during streamed extraction with {tier.identifier}: {e}")
+            tier_stats.errors += 1
+            draft = None
+        finally:
+            tier_stats.total_latency += time.perf_counter() - started
+            tier_stats.total_tokens += tokens
+            tier_stats.total_cost += tokens / 1000 * tier.cost_per_1k_tokens
+
+        streamed_recipe = None
+        if draft is not None:
+            streamed_recipe, repair_tokens = await self._repair_draft(tier, draft, markdown_content)
+            tokens += repair_tokens
+            tier_stats.total_tokens += repair_tokens
+            tier_stats.total_cost += repair_tokens / 1000 * tier.cost_per_1k_tokens
+            if streamed_recipe is None:
+                print(f"RecipeExtractorAgent: Streamed output from {tier.identifier} could not be repaired into a valid recipe.")
+                tier_stats.errors += 1
+
+        final_recipe = await self._run_cascade(markdown_content, first_attempt=(streamed_recipe, tokens), started=started)
+        if final_recipe is not None:
+            yield final_recipe, True
+
+    def _find_issues(self, output, markdown_content: str, multiple: bool) -> List[str]:
+        if not multiple:
+            return find_quality_issues(output, markdown_content)
+        if not output:
+            return ["no recipes"]
+        return [f"{recipe.name!r}: {issue}" for recipe in output for issue in find_quality_issues(recipe, markdown_content)]
+
+    async def _run_cascade(self, markdown_content: str, first_attempt: Optional[Tuple[Optional[BaseModel], int]] = None, started: Optional[float] = None, multiple: bool = False):
+        """Walks the tiers cheapest first. `first_attempt` carries an output already obtained from tier 1.
+
+        Returns a Recipe, or a list of them when `multiple` is set. Under a request deadline, the
+        cascade stops escalating when the extraction budget runs short, and an escalation that
+        would overrun it is abandoned so the best answer so far is still returned.
+        """
+        started = started if started is not None else time.perf_counter()
+        spent = 0.0
+        top_tier_cost = 0.0
+        best_effort = None
+        accepted_tier_index = None
+
+        for index, tier in enumerate(self.tiers):
+            deadline = current_deadline()
+            if index == 0 and first_attempt is not None:
+                output, tokens = first_attempt
+            elif index > 0 and deadline is not None:
+                if deadline.short("extract", EXTRACT_ESCALATION_MIN_SECONDS):
+                    print(f"RecipeExtractorAgent: {deadline.remaining('extract'):.1f}s of extraction budget left; not escalating to {tier.identifier}.")
+                    break
+                print(f"RecipeExtractorAgent: Attempting to extract recipe using {tier.identifier} (tier {index + 1}/{len(self.tiers)})...")
+                try:
+                    async with asyncio.timeout(deadline.remaining("extract") - EXTRACT_DEADLINE_MARGIN_SECONDS):
+                        output, tokens = await self._run_tier(tier, markdown_content, multiple)
+                except TimeoutError:
+                    print(f"RecipeExtractorAgent: {tier.identifier} did not finish within the extraction budget.")
+                    deadline_stats.stage("extract").degraded += 1
+                    break
+            else:
+                print(f"RecipeExtractorAgent: Attempting to extract recipe using {tier.identifier} (tier {index + 1}/{len(self.tiers)})...")
+                output, tokens = await self._run_tier(tier, markdown_content, multiple)
+            spent += tokens / 1000 * tier.cost_per_1k_tokens
+            top_tier_cost = max(top_tier_cost, tokens / 1000 * self.tiers[-1].cost_per_1k_tokens)
+            if output is None:
+                continue
+
+            best_effort = output
+            issues = self._find_issues(output, markdown_content, multiple)
+            if not issues:
+                cascade_stats.tier(tier.identifier).accepted += 1
+                accepted_tier_index = index
+                print(f"RecipeExtractorAgent: Extraction successful using {tier.identifier}.")
+                break
+
+            cascade_stats.tier(tier.identifier).rejected += 1
+            print(f"RecipeExtractorAgent: Output from {tier.identifier} failed quality checks: {'; '.join(issues)}")
+
+        if accepted_tier_index is None and best_effort is not None:
+            print("RecipeExtractorAgent: No tier passed the quality checks. Returning the last successful extraction.")
+
+        cascade_stats.record_request(
+            latency=time.perf_counter() - started,
+            cost=spent,
+            top_tier_cost=top_tier_cost,
+            resolved_by_top=accepted_tier_index == len(self.tiers) - 1,
+            resolved=accepted_tier_index is not None,
+        )
+        return best_effort
 
-# print(f"--- [recipe_agent.py LOADED (reached end of file)] --- Name: {__name__} ---")
\ No newline at end of file
+# print(f"--- [recipe_agent.py LOADED (reached end of file)] --- Name: {__name__} ---")
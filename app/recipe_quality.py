@@ -0,0 +1,87 @@
+import re
+import unicodedata
+from typing import Dict, List, Optional, Set
+
+from pydantic import HttpUrl, TypeAdapter, ValidationError
+
+MIN_NAME_LENGTH = 3
+MAX_NAME_LENGTH = 200
+MIN_GROUNDED_INGREDIENT_RATIO = 0.6
+GENERIC_NAMES = {"recipe", "receta", "untitled", "n/a", "none", "null", "unknown", "main recipe"}
+
+_WORD_RE = re.compile(r"[a-z]{3,}")
+_HTTP_URL_ADAPTER = TypeAdapter(HttpUrl)
+
+
+def normalize_text(text: str) -> str:
+    """Lowercases and strips accents so Spanish and English sources compare the same way."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def content_words(text: str) -> List[str]:
+    return _WORD_RE.findall(normalize_text(text))
+
+
+def is_plausible_name(name: str) -> bool:
+    stripped = (name or "").strip()
+    if not MIN_NAME_LENGTH <= len(stripped) <= MAX_NAME_LENGTH:
+        return False
+    if stripped.lower() in GENERIC_NAMES:
+        return False
+    return any(c.isalpha() for c in stripped)
+
+
+def is_grounded_line(line: str, source_words: Set[str]) -> bool:
+    """A line is grounded when at least half of its content words occur in the source."""
+    words = content_words(line)
+    if not words:
+        return True
+    found = sum(1 for word in words if word in source_words)
+    return found * 2 >= len(words)
+
+
+def grounded_ratio(lines: List[str], markdown_content: str) -> float:
+    if not lines:
+        return 0.0
+    source_words = set(content_words(markdown_content))
+    grounded = sum(1 for line in lines if is_grounded_line(line, source_words))
+    return grounded / len(lines)
+
+
+def is_valid_image_url(url: Optional[str]) -> bool:
+    if not url or not str(url).startswith(("http://", "https://")):
+        return False
+    try:
+        _HTTP_URL_ADAPTER.validate_python(str(url))
+        return True
+    except ValidationError:
+        return False
+
+
+def find_field_issues(recipe, markdown_content: str) -> Dict[str, str]:
+    """Maps each invalid or missing field to the reason it failed, so it can be repaired on its own."""
+    issues: Dict[str, str] = {}
+    name = getattr(recipe, "name", None)
+    ingredients = [i for i in (getattr(recipe, "ingredients", None) or []) if i and i.strip()]
+    instructions = [i for i in (getattr(recipe, "instructions", None) or []) if i and i.strip()]
+    image_url = getattr(recipe, "image_url", None)
+
+    if not is_plausible_name(name):
+        issues["name"] = f"implausible name: {name!r}"
+    if not ingredients:
+        issues["ingredients"] = "no ingredients"
+    elif markdown_content:
+        ratio = grounded_ratio(ingredients, markdown_content)
+        if ratio < MIN_GROUNDED_INGREDIENT_RATIO:
+            issues["ingredients"] = f"only {ratio:.0%} of ingredient lines appear in the source"
+    if not instructions:
+        issues["instructions"] = "no instructions"
+    if image_url and not is_valid_image_url(image_url):
+        issues["image_url"] = f"malformed image URL: {image_url!r}"
+    return issues
+
+
+def find_quality_issues(recipe, markdown_content: str) -> List[str]:
+    """Runs the deterministic checks used to decide whether an extraction can be accepted."""
+    return list(find_field_issues(recipe, markdown_content).values())
@@ -0,0 +1,59 @@
+import os
+from typing import Dict, Optional, Type
+
+from pydantic import BaseModel
+
+from .models.recipe import NameRepair, IngredientsRepair, InstructionsRepair, ImageUrlRepair
+from .utils.markdown_utils import find_section, find_image_urls
+
+REPAIR_REGION_CHARS = int(os.getenv("AI_REPAIR_REGION_CHARS", "6000"))
+MAX_IMAGE_CANDIDATES = 20
+
+REPAIR_MODELS: Dict[str, Type[BaseModel]] = {
+    "name": NameRepair,
+    "ingredients": IngredientsRepair,
+    "instructions": InstructionsRepair,
+    "image_url": ImageUrlRepair,
+}
+
+SECTION_KEYWORDS = {
+    "ingredients": ["ingredient"],
+    "instructions": ["instruc", "preparaci", "elaboraci", "paso", "method", "direction", "step", "modo de"],
+}
+
+
+def repair_region(field_name: str, markdown_content: str) -> str:
+    """The part of the page most likely to hold `field_name`, falling back to the top of the page."""
+    keywords = SECTION_KEYWORDS.get(field_name)
+    if keywords:
+        section = find_section(markdown_content, keywords, REPAIR_REGION_CHARS)
+        if section:
+            return section
+    if field_name == "name":
+        ingredients_section = find_section(markdown_content, SECTION_KEYWORDS["ingredients"], REPAIR_REGION_CHARS)
+        cut = markdown_content.find(ingredients_section) if ingredients_section else -1
+        if cut > 0:
+            return markdown_content[:min(cut, REPAIR_REGION_CHARS)]
+    return markdown_content[:REPAIR_REGION_CHARS]
+
+
+def build_repair_prompt(field_name: str, recipe_name: Optional[str], markdown_content: str) -> Optional[str]:
+    """Builds a small prompt that re-requests one field. Returns None when the page offers nothing to repair from."""
+    about = f" of the recipe '{recipe_name}'" if recipe_name else ""
+    if field_name == "image_url":
+        candidates = find_image_urls(markdown_content)[:MAX_IMAGE_CANDIDATES]
+        if not candidates:
+            return None
+        listed = "\n".join(f"- {url}" for url in candidates)
+        return (
+            f"Which of these image URLs is the main photo{about}? "
+            f"Answer with one of them exactly, or null if none is.\n\n{listed}"
+        )
+
+    instructions = {
+        "name": "What is the name of the recipe in the following markdown? Answer with the recipe title only.",
+        "ingredients": f"List the ingredients{about} in the following markdown, one ingredient line per entry, as written in the text.",
+        "instructions": f"List the step-by-step cooking instructions{about} in the following markdown, one step per entry.",
+    }
+    region = repair_region(field_name, markdown_content)
+    return f"{instructions[field_name]}\n\n--- MARKDOWN CONTENT STARTS ---{region}\n--- MARKDOWN CONTENT ENDS ---"
@@ -1,17 +1,115 @@
 import sys
-from typing import Optional, Type, List
+import asyncio
+import math
+import os
+import threading
+from contextlib import AsyncExitStack
+from datetime import datetime, timezone
+from typing import Optional, Type, List, AsyncIterator, Tuple
 from pydantic import ValidationError # HttpUrl not directly used here, but RecipePydantic might use it.
 import httpx # For catching specific exceptions
 import json
+import re
+from urllib.parse import urldefrag
 
 from .utils.logger_config import get_app_logger # Added logger import
 from .html_processor import HtmlFetcher, MarkdownConverter
+from .fetch_scheduler import FetchDisallowed
+from .coordination import get_coordination
+from .cancellation import KEEP_PARTIAL_ON_CANCEL, PARTIAL_PAGE_TTL_SECONDS, cancellation_stats
+from .deadline import DEADLINE_TIER_FACTORS, ENDPOINT_DEADLINES, DeadlineExceeded, current_deadline, stage_budget
+from .negative_cache import NEGATIVE_CACHE_ENABLED, FAILURE_POLICIES, CachedUrlFailure, canonical_url, classify_exception, classify_empty_extraction
 from .recipe_agent import RecipeExtractorAgent
-from .database import get_db, add_recipe_to_db, get_recipe_by_url, get_all_recipes_from_db, delete_recipe_from_db, RecipeDB, get_recipe_by_id_from_db, update_recipe_in_db # Added get_recipe_by_id_from_db, update_recipe_in_db
-from .models.recipe import Recipe as RecipePydantic, RecipeUpdate # Added RecipeUpdate
+from .domain_templates import DOMAIN_TEMPLATES_ENABLED, TEMPLATE_EXTRACTION_MODEL, extract_with_template, learn_template, template_domain, template_stats
+from .near_duplicates import NEAR_DUPLICATE_ENABLED, NEAR_DUPLICATE_EXTRACTION_MODEL, closest_duplicates, content_signature, near_duplicate_stats, signature_bands
+from .database import SessionLocal, get_image_variants_for_url, set_canonical_image_variants, set_recipe_image_variants
+from .database import get_canonical_recipe_by_url, get_canonical_recipes_by_url_prefix, link_recipes_for_user
+from .database import get_active_url_failure, record_url_failure, clear_url_failure
+from .database import get_domain_template, save_domain_template
+from .database import CanonicalRecipeDB, get_canonical_recipes_sharing_bands
+from .database import get_canonical_ids_for_user, get_canonical_recipes_by_ids, get_user_recipes_by_canonical_ids, sync_similar_index
+from .similar_recipes import similar_index
+from .database import get_db, add_recipe_to_db, add_recipes_to_db, get_recipe_by_url, get_recipe_rows_for_user, delete_recipe_from_db, RecipeDB, get_recipe_by_id_from_db, update_recipe_in_db # Added get_recipe_by_id_from_db, update_recipe_in_db
+from .models.recipe import Recipe as RecipePydantic, RecipeUpdate, SimilarRecipe # Added RecipeUpdate
+from .recipe_quality import normalize_text
+from .utils.image_utils import generate_image_variants
+from .page_archive import page_archive
 
 logger = get_app_logger(__name__) # Initialize logger
 
+IMAGE_PIPELINE_ENABLED = os.getenv("IMAGE_PIPELINE_ENABLED", "true").lower() in ("1", "true", "yes")
+# An extraction lock outlives its holder's request deadline, so no other worker starts the same
+# page while the holder is still within budget. Without a deadline (CLI tools) the longest applies.
+EXTRACTION_LOCK_TTL_MARGIN_SECONDS = 30.0
+EXTRACTION_LOCK_TTL_SECONDS = float(os.getenv(
+    "EXTRACTION_LOCK_TTL_SECONDS",
+    max(ENDPOINT_DEADLINES.values()) * max(DEADLINE_TIER_FACTORS.values(), default=1.0) + EXTRACTION_LOCK_TTL_MARGIN_SECONDS,
+))
+EXTRACTION_LOCK_WAIT_SECONDS = float(os.getenv("EXTRACTION_LOCK_WAIT_SECONDS", "120"))
+_image_tasks: set = set()
+
+async def _store_image_variants(row_id: int, image_url: str, personal: bool):
+    db = SessionLocal()
+    try:
+        variants = get_image_variants_for_url(db, image_url) or await generate_image_variants(image_url)
+        store = set_recipe_image_variants if personal else set_canonical_image_variants
+        if variants and store(db, row_id, image_url, variants):
+            logger.info(f"Stored {len(variants)} image variants for {'recipe' if personal else 'canonical recipe'} ID {row_id}.")
+    except Exception as e:
+        logger.warning(f"Image stage failed for {'recipe' if personal else 'canonical recipe'} ID {row_id}: {e}")
+    finally:
+        db.close()
+
+async def build_canonical_image_variants(canonical_id: int, image_url: str):
+    """Builds and stores variants of a canonical recipe's new image; for the CLIs, which store no links to schedule."""
+    if IMAGE_PIPELINE_ENABLED:
+        await _store_image_variants(canonical_id, image_url, personal=False)
+
+def schedule_image_variants(db_recipes: List[RecipeDB]):
+    """Starts the background image stage for stored recipes that have an image but no variants yet.
+
+    Variants of the shared image are stored on the canonical recipe; a user's own image gets its
+    variants on their library entry.
+    """
+    if not IMAGE_PIPELINE_ENABLED:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        logger.warning("No running event loop; skipping the image stage.")
+        return
+    for db_recipe in db_recipes:
+        if not db_recipe.image_url or db_recipe.image_variants:
+            continue
+        personal = db_recipe.image_url_override is not None or db_recipe.canonical is None
+        row_id = db_recipe.id if personal else db_recipe.canonical_id
+        task = loop.create_task(_store_image_variants(row_id, db_recipe.image_url, personal))
+        _image_tasks.add(task)
+        task.add_done_callback(_image_tasks.discard)
+
+def decode_legacy_lists(row: dict) -> dict:
+    """Decodes ingredients/instructions that legacy rows stored as JSON strings, in place."""
+    for key in ("ingredients", "instructions"):
+        value = row[key]
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except json.JSONDecodeError:
+                logger.warning(f"JSONDecodeError for {key} in recipe ID {row['id']}. Value: '{value[:100]}...'")
+                value = [value]
+        row[key] = value if isinstance(value, list) else []
+    return row
+
+def recipe_anchor(name: str, index: int, used: set) -> str:
+    """Builds a unique, URL-safe fragment for one recipe of a multi-recipe page."""
+    anchor = re.sub(r"[^a-z0-9]+", "-", normalize_text(name)).strip("-")[:80] or f"recipe-{index + 1}"
+    candidate, suffix = anchor, 2
+    while candidate in used:
+        candidate = f"{anchor}-{suffix}"
+        suffix += 1
+    used.add(candidate)
+    return candidate
+
 class RecipeService:
     def __init__(self, agent_output_model: Type[RecipePydantic] = RecipePydantic):
         self.html_fetcher = HtmlFetcher()
@@ -19,11 +117,253 @@ class RecipeService:
         self.recipe_agent = RecipeExtractorAgent(output_model=agent_output_model)
         self.pydantic_model_for_validation = agent_output_model
 
-    async def process_url_and_store_recipe(self, url: str, user_id: int, db_session_generator = get_db) -> Optional[RecipePydantic]:
+    def _db_recipe_to_pydantic(self, db_recipe: RecipeDB) -> RecipePydantic:
+        ingredients_list = json.loads(db_recipe.ingredients) if isinstance(db_recipe.ingredients, str) else db_recipe.ingredients
+        instructions_list = json.loads(db_recipe.instructions) if isinstance(db_recipe.instructions, str) else db_recipe.instructions
+        return RecipePydantic(
+            id=db_recipe.id,
+            name=db_recipe.name,
+            ingredients=ingredients_list if ingredients_list else [],
+            instructions=instructions_list if instructions_list else [],
+            image_url=str(db_recipe.image_url) if db_recipe.image_url else None,
+            source_url=db_recipe.source_url,
+            image_variants=db_recipe.image_variants
+        )
+
+    def _check_failure_cache(self, db, url: str, force: bool = False):
+        """Raises CachedUrlFailure when the page failed recently, unless `force` asks for a fresh attempt."""
+        if not NEGATIVE_CACHE_ENABLED or force:
+            return
+        failure = get_active_url_failure(db, canonical_url(url))
+        if failure is not None:
+            remaining = (failure.expires_at - datetime.now(timezone.utc).replace(tzinfo=None)).total_seconds()
+            logger.info(f"URL '{url}' failed recently ({failure.failure_class}, {failure.failures}x). Failing fast.")
+            raise CachedUrlFailure(canonical_url(url), failure.failure_class, retry_after=max(1, math.ceil(remaining)))
+
+    def _remember_failure(self, db, url: str, failure_class: Optional[str], detail: Optional[str] = None):
+        if not NEGATIVE_CACHE_ENABLED or failure_class is None:
+            return
+        try:
+            db.rollback()
+            record_url_failure(db, canonical_url(url), failure_class, detail, FAILURE_POLICIES[failure_class].ttl_seconds)
+        except Exception as e:
+            logger.warning(f"Could not record failure for {url}: {e}")
+
+    def _forget_failure(self, db, url: str):
+        if NEGATIVE_CACHE_ENABLED:
+            clear_url_failure(db, canonical_url(url))
+
+    async def _claim_extraction(self, locks: AsyncExitStack, url: str):
+        """Takes the cross-worker lock for extracting a page, so concurrent imports of a URL run the pipeline once.
+
+        Returns the lease; when `lease.waited` is set another worker extracted the page meanwhile,
+        and the caller should look for its result before extracting again.
+        """
+        deadline = current_deadline()
+        ttl = deadline.remaining() + EXTRACTION_LOCK_TTL_MARGIN_SECONDS if deadline is not None else EXTRACTION_LOCK_TTL_SECONDS
+        return await locks.enter_async_context(get_coordination().single_flight(
+            f"extract:{canonical_url(url)}", ttl=ttl, wait=EXTRACTION_LOCK_WAIT_SECONDS,
+        ))
+
+    def _keep_partial(self, url: str, html_content: Optional[str], markdown_content: Optional[str]):
+        """Archives what a cancelled run already fetched or converted, so a retry of the page resumes from there.
+
+        Runs synchronously: the task is being cancelled and must not await again.
+        """
+        if not KEEP_PARTIAL_ON_CANCEL or not (html_content or markdown_content):
+            return
+        try:
+            html_sha256, markdown_sha256 = page_archive.archive_page(html_content, markdown_content)
+            get_coordination().set(f"partial:{canonical_url(url)}", {"html_sha256": html_sha256, "markdown_sha256": markdown_sha256}, PARTIAL_PAGE_TTL_SECONDS)
+            cancellation_stats.partial_pages_kept += 1
+            logger.info(f"Kept the {'Markdown' if markdown_content else 'HTML'} of cancelled extraction of '{url}' for a retry.")
+        except Exception as e:
+            logger.warning(f"Could not keep partial results for {url}: {e}")
+
+    async def _resume_partial(self, url: str) -> Optional[Tuple[str, Optional[str], Optional[str]]]:
+        """(markdown, html_sha256, markdown_sha256) from a cancelled run of this page, or None to start afresh."""
+        if not KEEP_PARTIAL_ON_CANCEL:
+            return None
+        key = f"partial:{canonical_url(url)}"
+        partial = await asyncio.to_thread(get_coordination().get, key)
+        if partial is None:
+            return None
+        await asyncio.to_thread(get_coordination().delete, key)
+        markdown_content, html_sha256, markdown_sha256 = await self.load_page_markdown(url, partial["markdown_sha256"], partial["html_sha256"])
+        if not markdown_content:
+            return None
+        cancellation_stats.partial_pages_resumed += 1
+        logger.info(f"Resuming '{url}' from the page kept by a cancelled run.")
+        return markdown_content, html_sha256, markdown_sha256
+
+    async def _find_near_duplicate(self, db, url: Optional[str], markdown_content: str, multi_recipe: bool = False) -> Tuple[Optional[List[int]], List[CanonicalRecipeDB]]:
+        """Fingerprints a page and looks for a stored near-duplicate of it, whose extraction can be reused.
+
+        Returns (signature, canonical recipes of the matching page). The list is empty when no
+        stored page matches, and the signature None when the page is too short to fingerprint.
+        """
+        if not NEAR_DUPLICATE_ENABLED:
+            return None, []
+        signature = await asyncio.to_thread(content_signature, markdown_content)
+        if signature is None:
+            near_duplicate_stats.too_short += 1
+            return None, []
+        near_duplicate_stats.fingerprinted += 1
+        page_url = urldefrag(url or "")[0]
+        candidates = [
+            canonical for canonical in get_canonical_recipes_sharing_bands(db, signature_bands(signature))
+            if ("#" in canonical.source_url) == multi_recipe and urldefrag(canonical.source_url)[0] != page_url
+        ]
+        matches = closest_duplicates(signature, candidates, markdown_content)
+        if not matches:
+            return signature, []
+        duplicates = get_canonical_recipes_by_url_prefix(db, f"{urldefrag(matches[0].source_url)[0]}#") if multi_recipe else matches[:1]
+        near_duplicate_stats.extractions_avoided += 1
+        logger.info(f"{url} is a near-duplicate of {matches[0].source_url}; reusing its {len(duplicates)} recipe(s) instead of extracting.")
+        return signature, duplicates
+
+    @staticmethod
+    def _reused_recipe(canonical: CanonicalRecipeDB) -> RecipePydantic:
+        return RecipePydantic(
+            name=canonical.name,
+            ingredients=canonical.ingredients or [],
+            instructions=canonical.instructions or [],
+            image_url=canonical.image_url,
+        )
+
+    async def _extract_with_template(self, db, url: str, html_content: Optional[str], markdown_content: str) -> Tuple[Optional[RecipePydantic], bool]:
+        """Extracts a page with the template learned for its domain, skipping the model.
+
+        Returns (recipe, had_template); the recipe is None when there is no template or its result
+        fails the quality checks, and the caller should fall back to the model.
+        """
+        if not DOMAIN_TEMPLATES_ENABLED or not html_content:
+            return None, False
+        domain = template_domain(url)
+        template = get_domain_template(db, domain)
+        if template is None:
+            return None, False
+        stats = template_stats.domain(domain)
+        stats.attempts += 1
+        try:
+            recipe = await asyncio.to_thread(extract_with_template, template.selectors, html_content, url, markdown_content, RecipePydantic)
+        except Exception as e:
+            logger.warning(f"Template for {domain} failed on {url}: {e}")
+            recipe = None
+        if recipe is None:
+            stats.misses += 1
+            logger.info(f"Template for {domain} did not fit {url}; falling back to the model.")
+        else:
+            stats.hits += 1
+            logger.info(f"Extracted '{recipe.name}' from {url} with the {domain} template.")
+        return recipe, True
+
+    async def _learn_template(self, db, url: str, html_content: Optional[str], recipe: RecipePydantic, relearn: bool):
+        """Learns (or, after a miss, relearns) the domain's template from a model extraction. Never fails the request."""
+        if not DOMAIN_TEMPLATES_ENABLED or not html_content:
+            return
+        domain = template_domain(url)
+        stats = template_stats.domain(domain)
+        try:
+            selectors = await asyncio.to_thread(learn_template, html_content, url, recipe)
+            if selectors is None:
+                stats.learn_failures += 1
+                return
+            save_domain_template(db, domain, selectors, url)
+        except Exception as e:
+            logger.warning(f"Could not learn a template for {domain} from {url}: {e}")
+            stats.learn_failures += 1
+            return
+        if relearn:
+            stats.relearned += 1
+        else:
+            stats.learned += 1
+        logger.info(f"{'Relearned' if relearn else 'Learned'} the extraction template for {domain} from {url}.")
+
+    async def extract_from_html(self, db, url: Optional[str], html_content: str, use_templates: bool = True) -> Tuple[Optional[RecipePydantic], Optional[str], Optional[str]]:
+        """Converts and extracts a page whose HTML is already in hand (saved pages, offline backfills).
+
+        Uses the domain template when one fits and the model otherwise, learning templates from the
+        model's answers like the request flows do, and reuses the extraction of a stored
+        near-duplicate page. Returns (recipe, markdown, extraction_model); the recipe is None when
+        the page has no Markdown or no recipe could be extracted.
+        """
+        markdown_content = await self.markdown_converter.to_markdown(html_content, url=url or "")
+        if not markdown_content:
+            return None, None, None
+        _, duplicates = await self._find_near_duplicate(db, url, markdown_content)
+        if duplicates:
+            return self._reused_recipe(duplicates[0]), markdown_content, NEAR_DUPLICATE_EXTRACTION_MODEL
+        had_template = False
+        if use_templates and url:
+            recipe, had_template = await self._extract_with_template(db, url, html_content, markdown_content)
+            if recipe is not None:
+                return recipe, markdown_content, TEMPLATE_EXTRACTION_MODEL
+        recipe = await self.recipe_agent.extract_recipe_from_markdown(markdown_content)
+        if recipe is not None and use_templates and url:
+            await self._learn_template(db, url, html_content, recipe, relearn=had_template)
+        return recipe, markdown_content, self.recipe_agent.current_model_identifier
+
+    async def load_page_markdown(self, url: str, markdown_sha256: Optional[str] = None, html_sha256: Optional[str] = None, refetch: bool = False) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """Returns (markdown, html_sha256, markdown_sha256) for a page, preferring the local page archive.
+
+        Archived Markdown is used as-is and archived HTML is converted again; only when neither is
+        available (or `refetch` is set) is the page fetched and archived anew.
+        """
+        html_content = None
+        if not refetch:
+            markdown_content = await asyncio.to_thread(page_archive.get, markdown_sha256)
+            if markdown_content:
+                return markdown_content, html_sha256, markdown_sha256
+            html_content = await asyncio.to_thread(page_archive.get, html_sha256)
+        if not html_content:
+            html_content = await self.html_fetcher.fetch_html(url)
+        if not html_content:
+            return None, None, None
+        markdown_content = await self.markdown_converter.to_markdown(html_content, url=url)
+        if not markdown_content:
+            return None, None, None
+        new_html_sha256, new_markdown_sha256 = await asyncio.to_thread(page_archive.archive_page, html_content, markdown_content)
+        return markdown_content, new_html_sha256, new_markdown_sha256
+
+    def stored_recipes(self, url: str, user_id: int, all_recipes: bool = False, db_session_generator = get_db, force: bool = False) -> Optional[List[RecipePydantic]]:
+        """The user's recipes for `url` when the page needs no extraction, or None when it does.
+
+        A recipe already in the user's library is returned as-is; one extracted for another user
+        is linked into the library first. With `all_recipes`, every recipe stored for the page is
+        returned. Raises CachedUrlFailure if the page failed recently and `force` is not set.
+        Only database lookups, so the endpoints run it before admission control.
+        """
+        db = next(db_session_generator())
+        if all_recipes:
+            page_url, _ = urldefrag(url)
+            canonical_recipes = get_canonical_recipes_by_url_prefix(db=db, prefix=f"{page_url}#")
+            if canonical_recipes:
+                return [self._db_recipe_to_pydantic(db_recipe) for db_recipe in link_recipes_for_user(db=db, canonicals=canonical_recipes, user_id=user_id)]
+            self._check_failure_cache(db, page_url, force)
+            return None
+        existing_db_recipe = get_recipe_by_url(db=db, url=url, user_id=user_id)
+        if existing_db_recipe is None:
+            canonical_recipe = get_canonical_recipe_by_url(db=db, url=url)
+            if canonical_recipe:
+                existing_db_recipe = link_recipes_for_user(db=db, canonicals=[canonical_recipe], user_id=user_id)[0]
+        if existing_db_recipe:
+            return [self._db_recipe_to_pydantic(existing_db_recipe)]
+        self._check_failure_cache(db, url, force)
+        return None
+
+    async def process_url_and_store_recipe(self, url: str, user_id: int, db_session_generator = get_db, force: bool = False) -> Optional[RecipePydantic]:
+        """Returns the user's recipe for `url`, extracting it only when no one has stored it yet.
+
+        Raises CachedUrlFailure if the page failed recently and `force` is not set, and
+        FetchDisallowed if robots.txt does not allow fetching it.
+        """
         logger.critical("--- MODIFIED process_url_and_store_recipe IS RUNNING ---") # VERY OBVIOUS LOG
         logger.info(f"Starting recipe processing for URL: {url} by user_id: {user_id}")
         
         db = next(db_session_generator())
+        extraction_lock = AsyncExitStack()
+        html_content = markdown_content = None
         try:
             logger.info(f"Attempting to process URL: '{url}' (length: {len(url)}). Represented: {repr(url)}")
             try:
@@ -34,7 +374,7 @@ class RecipeService:
                 logger.error(f"Error querying all recipes for logging: {e_log_query}")
 
             logger.info(f"Checking cache for URL: {url}")
-            existing_db_recipe: Optional[RecipeDB] = get_recipe_by_url(db=db, url=url)
+            existing_db_recipe: Optional[RecipeDB] = get_recipe_by_url(db=db, url=url, user_id=user_id)
 
             if existing_db_recipe:
                 logger.info(f"FOUND existing recipe for URL '{url}'. DB record ID: {existing_db_recipe.id}, DB source_url: '{existing_db_recipe.source_url}' (length: {len(existing_db_recipe.source_url)}). Represented: {repr(existing_db_recipe.source_url)}")
@@ -43,36 +383,55 @@ class RecipeService:
             
             if existing_db_recipe:
                 logger.info(f"Recipe for URL '{url}' found in DB (ID: {existing_db_recipe.id}). Returning cached.")
-                ingredients_list = json.loads(existing_db_recipe.ingredients) if isinstance(existing_db_recipe.ingredients, str) else existing_db_recipe.ingredients
-                instructions_list = json.loads(existing_db_recipe.instructions) if isinstance(existing_db_recipe.instructions, str) else existing_db_recipe.instructions
-                return RecipePydantic(
-                    id=existing_db_recipe.id,
-                    name=existing_db_recipe.name,
-                    ingredients=ingredients_list if ingredients_list else [],
-                    instructions=instructions_list if instructions_list else [],
-                    image_url=str(existing_db_recipe.image_url) if existing_db_recipe.image_url else None,
-                    source_url=existing_db_recipe.source_url
-                )
+                return self._db_recipe_to_pydantic(existing_db_recipe)
 
+            canonical_recipe = get_canonical_recipe_by_url(db=db, url=url)
+            if canonical_recipe:
+                logger.info(f"URL '{url}' was already extracted (canonical ID: {canonical_recipe.id}). Adding it to user {user_id}'s library.")
+                return self._db_recipe_to_pydantic(link_recipes_for_user(db=db, canonicals=[canonical_recipe], user_id=user_id)[0])
+
+            self._check_failure_cache(db, url, force)
+            if (await self._claim_extraction(extraction_lock, url)).waited:
+                canonical_recipe = get_canonical_recipe_by_url(db=db, url=url)
+                if canonical_recipe:
+                    logger.info(f"URL '{url}' was extracted by another request while waiting. Adding it to user {user_id}'s library.")
+                    return self._db_recipe_to_pydantic(link_recipes_for_user(db=db, canonicals=[canonical_recipe], user_id=user_id)[0])
+                self._check_failure_cache(db, url, force)
             logger.info(f"Recipe for URL '{url}' not in cache for user {user_id}. Processing...")
-            logger.info("Fetching HTML...")
-            html_content = await self.html_fetcher.fetch_html(url)
-            if not html_content: 
-                logger.warning(f"Failed to fetch HTML for {url}. No content.")
-                return None
-            logger.info("HTML fetched successfully.")
+            resumed = await self._resume_partial(url)
+            if resumed:
+                markdown_content, html_sha256, markdown_sha256 = resumed
+            else:
+                logger.info("Fetching HTML...")
+                async with stage_budget("fetch"):
+                    html_content = await self.html_fetcher.fetch_html(url)
+                if not html_content: 
+                    logger.warning(f"Failed to fetch HTML for {url}. No content.")
+                    self._remember_failure(db, url, "empty_page")
+                    return None
+                logger.info("HTML fetched successfully.")
 
-            logger.info("Converting HTML to Markdown...")
-            markdown_content = await self.markdown_converter.to_markdown(html_content, url=url)
-            if not markdown_content:
-                logger.warning(f"Failed to convert HTML to Markdown for {url}.")
-                return None
-            logger.info("HTML converted to Markdown successfully.")
+                logger.info("Converting HTML to Markdown...")
+                async with stage_budget("convert"):
+                    markdown_content = await self.markdown_converter.to_markdown(html_content, url=url)
+                if not markdown_content:
+                    logger.warning(f"Failed to convert HTML to Markdown for {url}.")
+                    self._remember_failure(db, url, "empty_page")
+                    return None
+                logger.info("HTML converted to Markdown successfully.")
+                html_sha256, markdown_sha256 = await asyncio.to_thread(page_archive.archive_page, html_content, markdown_content)
 
-            logger.info("Extracting recipe using AI agent...")
-            extracted_recipe_data = await self.recipe_agent.extract_recipe_from_markdown(markdown_content)
+            async with stage_budget("extract"):
+                signature, duplicates = await self._find_near_duplicate(db, url, markdown_content)
+                extracted_recipe_data, had_template = (self._reused_recipe(duplicates[0]), False) if duplicates else await self._extract_with_template(db, url, html_content, markdown_content)
+                extraction_model = NEAR_DUPLICATE_EXTRACTION_MODEL if duplicates else TEMPLATE_EXTRACTION_MODEL
+                if extracted_recipe_data is None:
+                    logger.info("Extracting recipe using AI agent...")
+                    extracted_recipe_data = await self.recipe_agent.extract_recipe_from_markdown(markdown_content)
+                    extraction_model = self.recipe_agent.current_model_identifier
             if not extracted_recipe_data: 
                 logger.warning(f"Failed to extract recipe data using AI agent for {url}.")
+                self._remember_failure(db, url, classify_empty_extraction(markdown_content))
                 return None
             logger.info(f"Recipe data extracted by agent: {extracted_recipe_data.name}")
 
@@ -80,8 +439,12 @@ class RecipeService:
             logger.info(f"Recipe '{validated_recipe.name}' validated (by PydanticAI)." )
 
             logger.info(f"Storing recipe '{validated_recipe.name}' to database with source URL '{url}' for user_id {user_id}...")
-            db_recipe_obj: RecipeDB = add_recipe_to_db(db=db, recipe_data=validated_recipe, source_url=url, user_id=user_id) # Pass user_id
+            db_recipe_obj: RecipeDB = add_recipe_to_db(db=db, recipe_data=validated_recipe, source_url=url, user_id=user_id, html_sha256=html_sha256, markdown_sha256=markdown_sha256, extraction_model=extraction_model, content_signature=signature) # Pass user_id
             logger.info(f"Recipe '{db_recipe_obj.name}' (ID: {db_recipe_obj.id}, UserID: {db_recipe_obj.user_id}) stored successfully.")
+            self._forget_failure(db, url)
+            schedule_image_variants([db_recipe_obj])
+            if extraction_model not in (TEMPLATE_EXTRACTION_MODEL, NEAR_DUPLICATE_EXTRACTION_MODEL):
+                await self._learn_template(db, url, html_content, validated_recipe, relearn=had_template)
             return RecipePydantic(
                 id=db_recipe_obj.id, # Crucial: use the ID from the database object
                 name=validated_recipe.name, # Or db_recipe_obj.name, should be same
@@ -91,71 +454,286 @@ class RecipeService:
                 source_url=db_recipe_obj.source_url # Added source_url for new recipe
             )
 
+        except asyncio.CancelledError:
+            logger.info(f"Extraction of '{url}' for user {user_id} was cancelled.")
+            self._keep_partial(url, html_content, markdown_content)
+            raise
+        except DeadlineExceeded as e_deadline:
+            logger.warning(f"Extraction of '{url}' ran out of time: {e_deadline}")
+            self._remember_failure(db, url, classify_exception(e_deadline), str(e_deadline))
+            self._keep_partial(url, html_content, markdown_content)
+            raise
+        except CachedUrlFailure:
+            raise
         except httpx.HTTPStatusError as e_http_status:
             logger.error(f"HTTP Status error for {url}: {e_http_status.response.status_code} - {e_http_status.response.text if e_http_status.response else 'No response body'}", exc_info=True)
+            self._remember_failure(db, url, classify_exception(e_http_status), f"HTTP {e_http_status.response.status_code}")
             return None
+        except FetchDisallowed as e_disallowed:
+            logger.warning(f"Not fetching {url}: {e_disallowed}")
+            self._remember_failure(db, url, "robots_disallowed", str(e_disallowed))
+            raise
         except ValidationError as e_validation:
             logger.error(f"Validation error processing recipe from {url}: {e_validation}", exc_info=True)
+            self._remember_failure(db, url, "extraction_failed", str(e_validation)[:500])
             return None
         except Exception as e_general:
             logger.exception(f"An unexpected error occurred during recipe processing for {url}: {e_general}")
+            self._remember_failure(db, url, classify_exception(e_general), str(e_general)[:500])
             return None
         finally:
+            await extraction_lock.aclose()
             logger.info(f"Database session for URL: {url}, user_id: {user_id} will be closed by FastAPI dependency manager.")
 
-    async def get_all_recipes(self, user_id: int, db_session_generator = get_db) -> List[RecipePydantic]:
-        """Fetches all recipes for a specific user from the database."""
+    async def process_url_and_store_recipes(self, url: str, user_id: int, db_session_generator = get_db, force: bool = False) -> Optional[List[RecipePydantic]]:
+        """Extracts every recipe on a page with one fetch and one extraction call.
+
+        Each recipe is stored under the page URL plus a per-recipe anchor (`<url>#<recipe-slug>`),
+        so later requests for the same page are served from the database. Raises CachedUrlFailure
+        if the page failed recently and `force` is not set, and FetchDisallowed if robots.txt
+        does not allow fetching it.
+        """
+        page_url, _ = urldefrag(url)
+        logger.info(f"Starting multi-recipe processing for URL: {page_url} by user_id: {user_id}")
+        db = next(db_session_generator())
+        extraction_lock = AsyncExitStack()
+        html_content = markdown_content = None
+        try:
+            canonical_recipes = get_canonical_recipes_by_url_prefix(db=db, prefix=f"{page_url}#")
+            if canonical_recipes:
+                logger.info(f"Found {len(canonical_recipes)} stored recipes for page '{page_url}'. Returning cached.")
+                db_recipes = link_recipes_for_user(db=db, canonicals=canonical_recipes, user_id=user_id)
+                return [self._db_recipe_to_pydantic(db_recipe) for db_recipe in db_recipes]
+
+            self._check_failure_cache(db, page_url, force)
+            if (await self._claim_extraction(extraction_lock, page_url)).waited:
+                canonical_recipes = get_canonical_recipes_by_url_prefix(db=db, prefix=f"{page_url}#")
+                if canonical_recipes:
+                    db_recipes = link_recipes_for_user(db=db, canonicals=canonical_recipes, user_id=user_id)
+                    return [self._db_recipe_to_pydantic(db_recipe) for db_recipe in db_recipes]
+                self._check_failure_cache(db, page_url, force)
+            resumed = await self._resume_partial(page_url)
+            if resumed:
+                markdown_content, html_sha256, markdown_sha256 = resumed
+            else:
+                async with stage_budget("fetch"):
+                    html_content = await self.html_fetcher.fetch_html(page_url)
+                if not html_content:
+                    logger.warning(f"Failed to fetch HTML for {page_url}. No content.")
+                    self._remember_failure(db, page_url, "empty_page")
+                    return None
+
+                async with stage_budget("convert"):
+                    markdown_content = await self.markdown_converter.to_markdown(html_content, url=page_url)
+                if not markdown_content:
+                    logger.warning(f"Failed to convert HTML to Markdown for {page_url}.")
+                    self._remember_failure(db, page_url, "empty_page")
+                    return None
+                html_sha256, markdown_sha256 = await asyncio.to_thread(page_archive.archive_page, html_content, markdown_content)
+
+            async with stage_budget("extract"):
+                signature, duplicates = await self._find_near_duplicate(db, page_url, markdown_content, multi_recipe=True)
+                extraction_model = NEAR_DUPLICATE_EXTRACTION_MODEL if duplicates else self.recipe_agent.current_model_identifier
+                extracted_recipes = [self._reused_recipe(duplicate) for duplicate in duplicates] or await self.recipe_agent.extract_recipes_from_markdown(markdown_content)
+            if not extracted_recipes:
+                logger.warning(f"AI agent found no recipes on {page_url}.")
+                self._remember_failure(db, page_url, classify_empty_extraction(markdown_content))
+                return None
+
+            used_anchors: set = set()
+            recipes_with_urls = [
+                (recipe, f"{page_url}#{recipe_anchor(recipe.name, index, used_anchors)}")
+                for index, recipe in enumerate(extracted_recipes)
+            ]
+            db_recipes = add_recipes_to_db(db=db, recipes_with_urls=recipes_with_urls, user_id=user_id, html_sha256=html_sha256, markdown_sha256=markdown_sha256, extraction_model=extraction_model, content_signature=signature)
+            logger.info(f"Stored {len(db_recipes)} recipes from '{page_url}' for user_id {user_id}.")
+            self._forget_failure(db, page_url)
+            schedule_image_variants(db_recipes)
+            return [self._db_recipe_to_pydantic(db_recipe) for db_recipe in db_recipes]
+
+        except asyncio.CancelledError:
+            logger.info(f"Multi-recipe extraction of '{page_url}' for user {user_id} was cancelled.")
+            self._keep_partial(page_url, html_content, markdown_content)
+            raise
+        except DeadlineExceeded as e_deadline:
+            logger.warning(f"Multi-recipe extraction of '{page_url}' ran out of time: {e_deadline}")
+            self._remember_failure(db, page_url, classify_exception(e_deadline), str(e_deadline))
+            self._keep_partial(page_url, html_content, markdown_content)
+            raise
+        except CachedUrlFailure:
+            raise
+        except httpx.HTTPStatusError as e_http_status:
+            logger.error(f"HTTP Status error for {page_url}: {e_http_status.response.status_code}", exc_info=True)
+            self._remember_failure(db, page_url, classify_exception(e_http_status), f"HTTP {e_http_status.response.status_code}")
+            return None
+        except FetchDisallowed as e_disallowed:
+            logger.warning(f"Not fetching {page_url}: {e_disallowed}")
+            self._remember_failure(db, page_url, "robots_disallowed", str(e_disallowed))
+            raise
+        except Exception as e_general:
+            logger.exception(f"An unexpected error occurred during multi-recipe processing for {page_url}: {e_general}")
+            self._remember_failure(db, page_url, classify_exception(e_general), str(e_general)[:500])
+            return None
+        finally:
+            await extraction_lock.aclose()
+
+    async def stream_url_and_store_recipe(self, url: str, user_id: int, db_session_generator = get_db, force: bool = False) -> AsyncIterator[Tuple[str, dict]]:
+        """Same pipeline as process_url_and_store_recipe, yielding (event, data) pairs as each stage progresses.
+
+        Events are 'status' (pipeline stage), 'partial' (incomplete recipe), 'complete' (stored recipe)
+        and 'error'. The stream always ends with exactly one 'complete' or 'error' event.
+        """
+        logger.info(f"Starting streamed recipe processing for URL: {url} by user_id: {user_id}")
+        db = next(db_session_generator())
+        extraction_lock = AsyncExitStack()
+        html_content = markdown_content = None
+        try:
+            existing_db_recipe: Optional[RecipeDB] = get_recipe_by_url(db=db, url=url, user_id=user_id)
+            if existing_db_recipe is None:
+                canonical_recipe = get_canonical_recipe_by_url(db=db, url=url)
+                if canonical_recipe:
+                    existing_db_recipe = link_recipes_for_user(db=db, canonicals=[canonical_recipe], user_id=user_id)[0]
+            if existing_db_recipe:
+                logger.info(f"Recipe for URL '{url}' found in DB (ID: {existing_db_recipe.id}). Streaming cached.")
+                yield "complete", self._db_recipe_to_pydantic(existing_db_recipe).model_dump(mode="json")
+                return
+
+            self._check_failure_cache(db, url, force)
+            if (await self._claim_extraction(extraction_lock, url)).waited:
+                canonical_recipe = get_canonical_recipe_by_url(db=db, url=url)
+                if canonical_recipe:
+                    db_recipe_obj = link_recipes_for_user(db=db, canonicals=[canonical_recipe], user_id=user_id)[0]
+                    yield "complete", self._db_recipe_to_pydantic(db_recipe_obj).model_dump(mode="json")
+                    return
+                self._check_failure_cache(db, url, force)
+            resumed = await self._resume_partial(url)
+            if resumed:
+                markdown_content, html_sha256, markdown_sha256 = resumed
+            else:
+                yield "status", {"stage": "fetching"}
+                async with stage_budget("fetch"):
+                    html_content = await self.html_fetcher.fetch_html(url)
+                if not html_content:
+                    logger.warning(f"Failed to fetch HTML for {url}. No content.")
+                    self._remember_failure(db, url, "empty_page")
+                    yield "error", {"detail": "The page returned no content."}
+                    return
+
+                yield "status", {"stage": "converting"}
+                async with stage_budget("convert"):
+                    markdown_content = await self.markdown_converter.to_markdown(html_content, url=url)
+                if not markdown_content:
+                    logger.warning(f"Failed to convert HTML to Markdown for {url}.")
+                    self._remember_failure(db, url, "empty_page")
+                    yield "error", {"detail": "The page could not be converted to Markdown."}
+                    return
+                html_sha256, markdown_sha256 = await asyncio.to_thread(page_archive.archive_page, html_content, markdown_content)
+
+            yield "status", {"stage": "extracting"}
+            async with stage_budget("extract"):
+                signature, duplicates = await self._find_near_duplicate(db, url, markdown_content)
+                validated_recipe, had_template = (self._reused_recipe(duplicates[0]), False) if duplicates else await self._extract_with_template(db, url, html_content, markdown_content)
+                extraction_model = NEAR_DUPLICATE_EXTRACTION_MODEL if duplicates else TEMPLATE_EXTRACTION_MODEL
+                if validated_recipe is None:
+                    extraction_model = self.recipe_agent.current_model_identifier
+                    async for recipe, is_final in self.recipe_agent.stream_recipe_from_markdown(markdown_content):
+                        if is_final:
+                            validated_recipe = recipe
+                        else:
+                            yield "partial", recipe.model_dump(mode="json")
+
+            if not validated_recipe:
+                logger.warning(f"Failed to extract recipe data using AI agent for {url}.")
+                failure_class = classify_empty_extraction(markdown_content)
+                self._remember_failure(db, url, failure_class)
+                yield "error", {"detail": FAILURE_POLICIES[failure_class].message, "failure_class": failure_class}
+                return
+
+            db_recipe_obj: RecipeDB = add_recipe_to_db(db=db, recipe_data=validated_recipe, source_url=url, user_id=user_id, html_sha256=html_sha256, markdown_sha256=markdown_sha256, extraction_model=extraction_model, content_signature=signature)
+            logger.info(f"Recipe '{db_recipe_obj.name}' (ID: {db_recipe_obj.id}, UserID: {db_recipe_obj.user_id}) stored successfully.")
+            self._forget_failure(db, url)
+            schedule_image_variants([db_recipe_obj])
+            if extraction_model not in (TEMPLATE_EXTRACTION_MODEL, NEAR_DUPLICATE_EXTRACTION_MODEL):
+                await self._learn_template(db, url, html_content, validated_recipe, relearn=had_template)
+            yield "complete", self._db_recipe_to_pydantic(db_recipe_obj).model_dump(mode="json")
+
+        except asyncio.CancelledError:
+            logger.info(f"Streamed extraction of '{url}' for user {user_id} was cancelled.")
+            self._keep_partial(url, html_content, markdown_content)
+            raise
+        except DeadlineExceeded as e_deadline:
+            logger.warning(f"Streamed extraction of '{url}' ran out of time: {e_deadline}")
+            self._remember_failure(db, url, classify_exception(e_deadline), str(e_deadline))
+            self._keep_partial(url, html_content, markdown_content)
+            yield "error", {"detail": f"The request ran out of time in the {e_deadline.stage} stage. Try again later.", "stage": e_deadline.stage}
+        except CachedUrlFailure as e_cached:
+            yield "error", {"detail": e_cached.message, "failure_class": e_cached.failure_class, "retry_after": e_cached.retry_after}
+        except httpx.HTTPStatusError as e_http_status:
+            logger.error(f"HTTP Status error for {url}: {e_http_status.response.status_code}", exc_info=True)
+            self._remember_failure(db, url, classify_exception(e_http_status), f"HTTP {e_http_status.response.status_code}")
+            yield "error", {"detail": f"The page returned HTTP {e_http_status.response.status_code}."}
+        except FetchDisallowed as e_disallowed:
+            logger.warning(f"Not fetching {url}: {e_disallowed}")
+            self._remember_failure(db, url, "robots_disallowed", str(e_disallowed))
+            yield "error", {"detail": FAILURE_POLICIES["robots_disallowed"].message, "failure_class": "robots_disallowed"}
+        except Exception as e_general:
+            logger.exception(f"An unexpected error occurred during streamed recipe processing for {url}: {e_general}")
+            self._remember_failure(db, url, classify_exception(e_general), str(e_general)[:500])
+            yield "error", {"detail": "Failed to process and store recipe. Check server logs for details."}
+        finally:
+            await extraction_lock.aclose()
+
+    async def get_all_recipes(self, user_id: int, db_session_generator = get_db) -> List[dict]:
+        """Fetches all recipes for a specific user as response-ready dicts.
+
+        Rows were validated when they were stored, so they are not rebuilt into RecipePydantic
+        models; only legacy rows whose lists were saved as JSON strings are decoded here.
+        """
         db: Session = next(db_session_generator())
         logger.info(f"Fetching all recipes from database for user_id: {user_id}...")
         try:
-            db_recipes: List[RecipeDB] = get_all_recipes_from_db(db=db, user_id=user_id)
-            pydantic_recipes: List[RecipePydantic] = []
-            for db_recipe in db_recipes:
-                ingredients_list = []
-                if isinstance(db_recipe.ingredients, str):
-                    try:
-                        parsed_ingredients = json.loads(db_recipe.ingredients)
-                        if isinstance(parsed_ingredients, list):
-                            ingredients_list = parsed_ingredients
-                        else:
-                            logger.warning(f"Parsed ingredients for recipe ID {db_recipe.id} is not a list: {type(parsed_ingredients)}")
-                    except json.JSONDecodeError:
-                        logger.warning(f"JSONDecodeError for ingredients in recipe ID {db_recipe.id}. Value: '{db_recipe.ingredients[:100]}...' ", exc_info=True)
-                        ingredients_list = [db_recipe.ingredients] # Example: treat as single item list
-                elif isinstance(db_recipe.ingredients, list):
-                    ingredients_list = db_recipe.ingredients
-
-                instructions_list = []
-                if isinstance(db_recipe.instructions, str):
-                    try:
-                        parsed_instructions = json.loads(db_recipe.instructions)
-                        if isinstance(parsed_instructions, list):
-                            instructions_list = parsed_instructions
-                        else:
-                            logger.warning(f"Parsed instructions for recipe ID {db_recipe.id} is not a list: {type(parsed_instructions)}")
-                    except json.JSONDecodeError:
-                        logger.warning(f"JSONDecodeError for instructions in recipe ID {db_recipe.id}. Value: '{db_recipe.instructions[:100]}...'", exc_info=True)
-                elif isinstance(db_recipe.instructions, list):
-                    instructions_list = db_recipe.instructions
-                
-                pydantic_recipes.append(
-                    RecipePydantic(
-                        id=db_recipe.id,
-                        name=db_recipe.name,
-                        ingredients=ingredients_list,
-                        instructions=instructions_list,
-                        image_url=db_recipe.image_url if db_recipe.image_url else None,
-                        source_url=db_recipe.source_url # Added source_url
-                    )
-                )
-            logger.info(f"Found {len(pydantic_recipes)} recipes for user_id: {user_id}.")
-            return pydantic_recipes
+            rows = [decode_legacy_lists(row) for row in get_recipe_rows_for_user(db=db, user_id=user_id)]
+            logger.info(f"Found {len(rows)} recipes for user_id: {user_id}.")
+            return rows
         except Exception as e_general:
             logger.exception(f"An unexpected error occurred while fetching recipes for user_id {user_id}: {e_general}")
             return [] # Return empty list on error
         finally:
             logger.info(f"Database session for get_all_recipes (user_id: {user_id}) will be closed by FastAPI dependency manager.")
 
+    def similar_recipes(self, recipe_id: int, user_id: int, k: int = 10, scope: str = "library", db_session_generator=get_db) -> Optional[List[SimilarRecipe]]:
+        """The `k` recipes most similar to one of the user's, by ingredient and title terms.
+
+        `scope` "library" searches the user's other recipes, "catalogue" every shared recipe.
+        Returns None if the recipe is not the user's, and an empty list if the index is disabled.
+        """
+        db = next(db_session_generator())
+        db_recipe = get_recipe_by_id_from_db(db=db, recipe_id=recipe_id)
+        if db_recipe is None or db_recipe.user_id != user_id:
+            return None
+        if similar_index is None or db_recipe.canonical_id is None:
+            return []
+        sync_similar_index(db)
+        among = get_canonical_ids_for_user(db, user_id) if scope == "library" else None
+        matches = similar_index.similar(db_recipe.canonical_id, k, among=among)
+        if not matches:
+            return []
+        ids = [canonical_id for canonical_id, _ in matches]
+        links = {link.canonical_id: link for link in get_user_recipes_by_canonical_ids(db, user_id, ids)}
+        canonicals = {} if scope == "library" else {canonical.id: canonical for canonical in get_canonical_recipes_by_ids(db, ids)}
+        results = []
+        for canonical_id, score in matches:
+            link = links.get(canonical_id)
+            if link is not None:
+                recipe = self._db_recipe_to_pydantic(link)
+            elif canonical_id in canonicals:
+                canonical = canonicals[canonical_id]
+                recipe = RecipePydantic(**dict(self._reused_recipe(canonical).model_dump(), source_url=canonical.source_url))
+            else:
+                continue
+            results.append(SimilarRecipe(**recipe.model_dump(), score=score, in_library=link is not None))
+        return results
+
     def delete_recipe(self, recipe_id: int, user_id: int, db_session_generator=get_db) -> bool:
         """Deletes a recipe by its ID, ensuring ownership."""
         logger.info(f"Attempting to delete recipe ID: {recipe_id} by user_id: {user_id}")
@@ -205,21 +783,28 @@ class RecipeService:
                     ingredients=json.loads(db_recipe.ingredients) if isinstance(db_recipe.ingredients, str) else db_recipe.ingredients,
                     instructions=json.loads(db_recipe.instructions) if isinstance(db_recipe.instructions, str) else db_recipe.instructions,
                     image_url=str(db_recipe.image_url) if db_recipe.image_url else None,
-                    source_url=db_recipe.source_url
+                    source_url=db_recipe.source_url,
+                    image_variants=db_recipe.image_variants
                 )
 
+            if "image_url" in update_data:
+                update_data["image_url"] = str(update_data["image_url"]) if update_data["image_url"] else None
+                update_data["image_variants"] = None
+
             logger.info(f"Applying updates to recipe ID {recipe_id} for user {user_id}: {update_data}")
             updated_db_recipe: Optional[RecipeDB] = update_recipe_in_db(db=db, recipe_id=recipe_id, update_data=update_data)
 
             if updated_db_recipe:
                 logger.info(f"Successfully updated recipe ID {updated_db_recipe.id} for user {user_id}.")
+                schedule_image_variants([updated_db_recipe])
                 return RecipePydantic(
                     id=updated_db_recipe.id,
                     name=updated_db_recipe.name,
                     ingredients=json.loads(updated_db_recipe.ingredients) if isinstance(updated_db_recipe.ingredients, str) else updated_db_recipe.ingredients, 
                     instructions=json.loads(updated_db_recipe.instructions) if isinstance(updated_db_recipe.instructions, str) else updated_db_recipe.instructions, 
                     image_url=str(updated_db_recipe.image_url) if updated_db_recipe.image_url else None,
-                    source_url=updated_db_recipe.source_url
+                    source_url=updated_db_recipe.source_url,
+                    image_variants=updated_db_recipe.image_variants
                 )
             else:
                 logger.warning(f"Failed to update recipe ID {recipe_id} in DB for user {user_id}, or recipe became unavailable.")
@@ -262,6 +847,18 @@ async def main_service_test():
     # else:
     #     print(f"Failed to delete recipe ID {test_delete_id} or not found.")
 
+_recipe_service: Optional[RecipeService] = None
+_recipe_service_lock = threading.Lock()
+
+def get_recipe_service() -> RecipeService:
+    """FastAPI dependency: one RecipeService (and its model agents) per process, built by the warm-up or on first use."""
+    global _recipe_service
+    if _recipe_service is None:
+        with _recipe_service_lock:
+            if _recipe_service is None:
+                _recipe_service = RecipeService()
+    return _recipe_service
+
 if __name__ == '__main__':
     # To run the async test function:
     # import asyncio
@@ -0,0 +1,264 @@
+"""Bulk re-extraction of stored recipes, e.g. after changing the model cascade or the prompt.
+
+    python -m app.reextract --domain directoalpaladar.com --model gpt-3.5 --concurrency 8
+
+Re-extraction updates the shared canonical recipes, so every library linking to a page sees the
+new result except for fields its user edited. Pages are read from the page archive when possible
+and fetched otherwise. The page's near-duplicate signature is recomputed, a changed image gets
+new variants, and changed recipes are re-indexed for similar recipes. Progress is recorded in
+a checkpoint file, so an interrupted run resumes with the recipes it has not finished. Each
+processed recipe is appended to a JSON-lines report listing the fields that changed.
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urldefrag
+
+from .database import SessionLocal, CanonicalRecipeDB, create_db_and_tables, get_recipes_for_reextraction, replace_signature_bands
+from .near_duplicates import NEAR_DUPLICATE_ENABLED, content_signature, format_signature, signature_bands
+from .recipe_quality import normalize_text
+from .recipe_service import RecipeService, build_canonical_image_variants, recipe_anchor
+from .utils.batch import AsyncRateLimiter, Checkpoint
+from .utils.logger_config import get_app_logger
+
+logger = get_app_logger(__name__)
+
+COMPARED_FIELDS = ("name", "ingredients", "instructions", "image_url")
+
+
+def recipe_diff(before: dict, after: dict) -> Dict[str, dict]:
+    """Per-field changes between two recipes: before/after for scalars, added/removed lines for lists."""
+    changes: Dict[str, dict] = {}
+    for field_name in COMPARED_FIELDS:
+        old, new = before.get(field_name), after.get(field_name)
+        if isinstance(old, list) or isinstance(new, list):
+            old, new = old or [], new or []
+            if old != new:
+                changes[field_name] = {
+                    "added": [line for line in new if line not in old],
+                    "removed": [line for line in old if line not in new],
+                    "reordered": sorted(old) == sorted(new),
+                }
+        elif (old or None) != (new or None):
+            changes[field_name] = {"before": old, "after": new}
+    return changes
+
+
+def match_recipe(source_url: str, name: str, candidates: List[dict]) -> Optional[dict]:
+    """Finds the re-extracted recipe for a stored row: by its `#anchor` on multi-recipe pages, then by name."""
+    _, fragment = urldefrag(source_url)
+    if len(candidates) == 1 and not fragment:
+        return candidates[0]
+    used: set = set()
+    anchors = {recipe_anchor(c["name"], i, used): c for i, c in enumerate(candidates)}
+    if fragment and fragment in anchors:
+        return anchors[fragment]
+    by_name = {normalize_text(c["name"]).strip(): c for c in candidates}
+    return by_name.get(normalize_text(name).strip())
+
+
+def _snapshot(db_recipe: CanonicalRecipeDB) -> dict:
+    return {
+        "id": db_recipe.id,
+        "source_url": db_recipe.source_url,
+        "name": db_recipe.name,
+        "ingredients": db_recipe.ingredients or [],
+        "instructions": db_recipe.instructions or [],
+        "image_url": db_recipe.image_url,
+        "html_sha256": db_recipe.html_sha256,
+        "markdown_sha256": db_recipe.markdown_sha256,
+    }
+
+
+class Reextractor:
+    def __init__(self, args: argparse.Namespace, service: RecipeService):
+        self.args = args
+        self.service = service
+        self.semaphore = asyncio.Semaphore(args.concurrency)
+        self.limiter = AsyncRateLimiter(args.requests_per_minute, burst=args.concurrency)
+        self.model_identifier = service.recipe_agent.current_model_identifier
+
+    async def extract_page(self, page_url: str, rows: List[dict]) -> Tuple[List[dict], List[dict], Optional[str], Optional[str], Optional[List[int]], Optional[str]]:
+        """Re-extracts one page. Returns (its stored rows, recipes as dicts, html sha, markdown sha, page signature, error)."""
+        recipes, html_sha256, markdown_sha256, signature, error = await self._extract_page(page_url, rows)
+        return rows, recipes, html_sha256, markdown_sha256, signature, error
+
+    async def _extract_page(self, page_url: str, rows: List[dict]):
+        async with self.semaphore:
+            try:
+                markdown_content, html_sha256, markdown_sha256 = await self.service.load_page_markdown(
+                    page_url, markdown_sha256=rows[0]["markdown_sha256"], html_sha256=rows[0]["html_sha256"], refetch=self.args.refetch,
+                )
+                if not markdown_content:
+                    return [], None, None, None, "page could not be loaded"
+                signature = await asyncio.to_thread(content_signature, markdown_content) if NEAR_DUPLICATE_ENABLED else None
+                await self.limiter.acquire()
+                if any(urldefrag(row["source_url"])[1] for row in rows):
+                    recipes = await self.service.recipe_agent.extract_recipes_from_markdown(markdown_content)
+                else:
+                    recipe = await self.service.recipe_agent.extract_recipe_from_markdown(markdown_content)
+                    recipes = [recipe] if recipe else []
+                if not recipes:
+                    return [], html_sha256, markdown_sha256, None, "extraction failed"
+                return [r.model_dump(mode="json") for r in recipes], html_sha256, markdown_sha256, signature, None
+            except Exception as e:
+                logger.exception(f"Re-extraction of {page_url} failed: {e}")
+                return [], None, None, None, str(e)
+
+    def results_for_page(self, rows: List[dict], recipes: List[dict], html_sha256, markdown_sha256, error, signature: Optional[List[int]] = None) -> List[Tuple[dict, Optional[dict]]]:
+        """Pairs each stored row with its report entry and, when it should be written, a DB update mapping."""
+        results = []
+        for row in rows:
+            entry = {"id": row["id"], "source_url": row["source_url"]}
+            if error:
+                results.append((dict(entry, status="failed", error=error), None))
+                continue
+            recipe = match_recipe(row["source_url"], row["name"], recipes)
+            if recipe is None:
+                results.append((dict(entry, status="unmatched"), None))
+                continue
+            changes = recipe_diff(row, recipe)
+            mapping = {
+                "id": row["id"],
+                "html_sha256": html_sha256,
+                "markdown_sha256": markdown_sha256,
+                "extraction_model": self.model_identifier,
+                "content_signature": format_signature(signature) if signature else None,
+            }
+            for field_name in changes:
+                mapping[field_name] = recipe[field_name]
+            if "image_url" in changes:
+                mapping["image_variants"] = None
+            if changes:
+                mapping["updated_at"] = datetime.now(timezone.utc)  # the similar-recipes index re-reads these rows
+            results.append((dict(entry, status="changed" if changes else "unchanged", changes=changes), mapping))
+        return results
+
+    async def run(self, rows: List[dict], checkpoint: Optional[Checkpoint], report_path: Path) -> Counter:
+        pages: Dict[str, List[dict]] = defaultdict(list)
+        for row in rows:
+            pages[urldefrag(row["source_url"])[0]].append(row)
+
+        totals: Counter = Counter()
+        pending_mappings: List[dict] = []
+        pending_entries: List[dict] = []
+        pending_bands: Dict[int, List[int]] = {}
+        new_images: List[Tuple[int, str]] = []  # (canonical id, image URL) needing variants
+        db = SessionLocal()
+
+        def flush():
+            if pending_mappings and not self.args.dry_run:
+                db.bulk_update_mappings(CanonicalRecipeDB, pending_mappings)
+                replace_signature_bands(db, pending_bands)
+                db.commit()
+                new_images.extend((m["id"], m["image_url"]) for m in pending_mappings if m.get("image_url"))
+            if checkpoint is not None:
+                checkpoint.record({"id": e["id"], "status": e["status"]} for e in pending_entries)
+            pending_mappings.clear()
+            pending_entries.clear()
+            pending_bands.clear()
+
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(self.extract_page(page_url, page_rows)) for page_url, page_rows in pages.items()]
+        try:
+            with report_path.open("a", encoding="utf-8") as report:
+                for done in asyncio.as_completed(tasks):
+                    page_rows, recipes, html_sha256, markdown_sha256, signature, error = await done
+                    for entry, mapping in self.results_for_page(page_rows, recipes, html_sha256, markdown_sha256, error, signature):
+                        report.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                        totals[entry["status"]] += 1
+                        totals.update(f"field:{name}" for name in entry.get("changes", {}))
+                        pending_entries.append(entry)
+                        if mapping is not None:
+                            pending_mappings.append(mapping)
+                            pending_bands[mapping["id"]] = signature_bands(signature) if signature else []
+                    if len(pending_entries) >= self.args.batch_size:
+                        flush()
+                        report.flush()
+                        processed = sum(totals[s] for s in ("changed", "unchanged", "failed", "unmatched"))
+                        print(f"[{time.perf_counter() - started:7.1f}s] {processed}/{len(rows)} recipes processed")
+                flush()
+            await self.build_image_variants(new_images)
+        finally:
+            for task in tasks:
+                task.cancel()
+            db.close()
+        return totals
+
+    async def build_image_variants(self, images: List[Tuple[int, str]]):
+        """Builds variants for images that re-extraction changed; their old variants were dropped with the old image."""
+        async def build(canonical_id: int, image_url: str):
+            async with self.semaphore:
+                await build_canonical_image_variants(canonical_id, image_url)
+
+        if images:
+            print(f"Building image variants for {len(images)} changed images.")
+            await asyncio.gather(*(build(canonical_id, image_url) for canonical_id, image_url in images))
+
+
+def _parse_date(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.reextract", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user-id", type=int, help="Only recipes in this user's library.")
+    parser.add_argument("--domain", help="Only recipes from this domain or its subdomains.")
+    parser.add_argument("--since", type=_parse_date, help="Only recipes created on or after this ISO date.")
+    parser.add_argument("--until", type=_parse_date, help="Only recipes created before this ISO date.")
+    parser.add_argument("--model", help="Only recipes whose extraction model contains this text; 'unknown' for rows without one.")
+    parser.add_argument("--limit", type=int, help="Process at most this many recipes.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Pages processed at the same time (default 4).")
+    parser.add_argument("--requests-per-minute", type=float, default=60, help="Extraction runs started per minute (default 60; 0 disables).")
+    parser.add_argument("--batch-size", type=int, default=50, help="Recipes per database commit and checkpoint write (default 50).")
+    parser.add_argument("--checkpoint", type=Path, default=Path("reextract-checkpoint.jsonl"), help="Progress file used to resume.")
+    parser.add_argument("--fresh", action="store_true", help="Ignore and replace an existing checkpoint.")
+    parser.add_argument("--retry-failed", action="store_true", help="Re-process recipes the checkpoint records as failed.")
+    parser.add_argument("--report", type=Path, default=Path("reextract-report.jsonl"), help="JSON-lines diff report (appended to).")
+    parser.add_argument("--refetch", action="store_true", help="Fetch pages again instead of reading the page archive.")
+    parser.add_argument("--dry-run", action="store_true", help="Report changes without writing them or the checkpoint.")
+    return parser
+
+
+async def main_async(args: argparse.Namespace) -> Counter:
+    create_db_and_tables()
+    db = SessionLocal()
+    try:
+        rows = [_snapshot(r) for r in get_recipes_for_reextraction(
+            db, user_id=args.user_id, domain=args.domain, since=args.since, until=args.until, model=args.model, limit=args.limit,
+        )]
+    finally:
+        db.close()
+
+    checkpoint = None if args.dry_run else Checkpoint(args.checkpoint, fresh=args.fresh)
+    if checkpoint is not None:
+        skipped = {key for key, entry in checkpoint.done.items() if not (args.retry_failed and entry.get("status") == "failed")}
+        rows = [row for row in rows if str(row["id"]) not in skipped]
+    print(f"{len(rows)} recipes to re-extract.")
+    if not rows:
+        return Counter()
+
+    service = RecipeService()
+    if not service.recipe_agent.tiers:
+        raise SystemExit("The extraction agent is not configured; check AI_PROVIDER / AI_CASCADE.")
+    totals = await Reextractor(args, service).run(rows, checkpoint, args.report)
+
+    field_counts = ", ".join(f"{key[6:]}={count}" for key, count in sorted(totals.items()) if key.startswith("field:"))
+    print(
+        f"Done: {totals['changed']} changed, {totals['unchanged']} unchanged, {totals['unmatched']} unmatched, "
+        f"{totals['failed']} failed. Changed fields: {field_counts or 'none'}. Report: {args.report}"
+    )
+    return totals
+
+
+def main(argv: Optional[List[str]] = None):
+    asyncio.run(main_async(build_parser().parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+from typing import Any
+
+import orjson
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional; JSON is always available
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered by orjson, which serialises lists of dicts several times faster than json."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def wants_msgpack(request: Request) -> bool:
+    accept = request.headers.get("accept", "")
+    return msgpack is not None and (MSGPACK_MEDIA_TYPE in accept or "application/x-msgpack" in accept)
+
+
+def negotiated_response(content: Any, request: Request) -> Response:
+    """Serialises already-validated content as msgpack when the client asks for it, else with orjson.
+
+    Returning a Response directly skips FastAPI's response_model validation, so callers must only
+    pass data that was validated when it was stored.
+    """
+    if wants_msgpack(request):
+        return Response(msgpack.packb(content, use_bin_type=True), media_type=MSGPACK_MEDIA_TYPE, headers={"Vary": "Accept"})
+    return ORJSONResponse(content, headers={"Vary": "Accept"})
@@ -0,0 +1,329 @@
+"""Similar recipes by ingredient and title terms: sparse TF-IDF vectors and cosine similarity.
+
+Every canonical recipe is a row of a sparse matrix over the terms of its name and ingredient
+lines (quantities, units and filler words dropped). A query multiplies only the columns of the
+recipe's own terms by its weights, so it costs about the postings of those terms rather than a
+pass over every recipe, a couple of milliseconds at 100k recipes.
+
+Request handlers queue recipes as they are stored, without waiting for the index; the next query
+indexes them. New rows wait in a small pending block, scored separately, until
+`SIMILAR_INDEX_MERGE_ROWS` of them are merged into the main matrix by a background thread. The
+merge recomputes IDF weights and row norms and writes the index to `SIMILAR_INDEX_PATH`, so it is
+not rebuilt at startup. Rows stored or re-extracted by other processes are picked up from the
+database by id and `updated_at` (`database.sync_similar_index`).
+
+numpy and scipy are imported by `load()`, which the server runs in the background at startup,
+so they do not slow down importing the app.
+"""
+import importlib.util
+import io
+import math
+import os
+import re
+import threading
+from collections import Counter, deque
+from datetime import datetime
+from pathlib import Path
+from typing import Collection, Deque, Dict, Iterable, List, Optional, Tuple
+
+from .recipe_quality import normalize_text
+from .utils.logger_config import get_app_logger
+
+np = sparse = None  # numpy and scipy.sparse, once _import_numpy() has run
+
+logger = get_app_logger(__name__)
+
+# Without numpy/scipy there are no similar-recipe results.
+SIMILAR_RECIPES_ENABLED = (
+    os.getenv("SIMILAR_RECIPES_ENABLED", "true").lower() in ("1", "true", "yes")
+    and all(importlib.util.find_spec(module) is not None for module in ("numpy", "scipy"))
+)
+SIMILAR_INDEX_PATH = Path(os.getenv("SIMILAR_INDEX_PATH", Path(__file__).resolve().parent / "database" / "similar_recipes.npz"))
+SIMILAR_INDEX_MERGE_ROWS = int(os.getenv("SIMILAR_INDEX_MERGE_ROWS", "1000"))
+TITLE_WEIGHT = 2  # a title term counts as much as two ingredient mentions
+
+_TERM_RE = re.compile(r"[a-z]{3,}")
+_STOPWORDS = frozenset("""
+    del las los una uno unos unas con sin para por que muy mas al gusto cada poco
+    the and for with without into some about
+    gramos gramo litro litros cucharada cucharadas cucharadita cucharaditas taza tazas vaso vasos pizca
+    chorrito diente dientes unidad unidades lata latas paquete sobre hoja hojas rama ramas trozo trozos
+    cup cups tablespoon tablespoons teaspoon teaspoons tbsp tsp ounce ounces pound pounds pinch can cans clove cloves
+    grande grandes pequeno pequena mediano mediana large small medium fresh fresco fresca picado picada
+""".split())
+
+
+def recipe_terms(name: Optional[str], ingredients: Optional[Iterable[str]]) -> Counter:
+    """Term counts for a recipe: words of its ingredient lines, and of its name counted TITLE_WEIGHT times."""
+    terms: Counter = Counter()
+    if isinstance(ingredients, str):  # legacy rows hold the list as a JSON string
+        ingredients = [ingredients]
+    for line in ingredients or []:
+        terms.update(term for term in _TERM_RE.findall(normalize_text(str(line))) if term not in _STOPWORDS)
+    for term in _TERM_RE.findall(normalize_text(name or "")):
+        if term not in _STOPWORDS:
+            terms[term] += TITLE_WEIGHT
+    return terms
+
+
+def _import_numpy():
+    global np, sparse
+    if sparse is None:
+        import numpy as np
+        from scipy import sparse
+
+
+class SimilarRecipeIndex:
+    """TF-IDF rows of canonical recipes, keyed by canonical id. Thread-safe; `loaded` is False until `load()`."""
+
+    def __init__(self, path: Path = SIMILAR_INDEX_PATH, merge_rows: int = SIMILAR_INDEX_MERGE_ROWS):
+        self.path = Path(path)
+        self.merge_rows = merge_rows
+        self.loaded = False
+        self.rows: Dict[int, int] = {}
+        self._lock = threading.RLock()
+        self._merging = threading.Lock()
+        self._queued: Deque[Tuple[int, Optional[str], object]] = deque()  # (id, name, ingredients) from enqueue()
+
+    def _reset(self):
+        self.synced_through = 0  # highest canonical id read back from the database
+        self.updated_through: Optional[datetime] = None  # latest canonical updated_at read back from the database
+        self.vocabulary: Dict[str, int] = {}
+        self.df: List[int] = []
+        self.ids: List[int] = []  # row -> canonical id
+        self.rows: Dict[int, int] = {}  # canonical id -> row, live rows only
+        self.removed: set = set()
+        self.base_tf = sparse.csr_matrix((0, 0), dtype=np.float32)  # 1 + log(tf), merged rows
+        self.base = sparse.csc_matrix((0, 0), dtype=np.float32)  # base_tf with IDF applied, rows L2-normalised
+        self.pending: List[Dict[int, float]] = []
+        self._pending_matrix = None
+        self._df_array = None
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _idf(self, columns) -> "np.ndarray":
+        if self._df_array is None:
+            self._df_array = np.asarray(self.df, dtype=np.float32)
+        df = self._df_array[columns]
+        return np.log((1 + len(self.rows)) / (1 + df)) + 1
+
+    def _normalised(self, tf) -> "sparse.csr_matrix":
+        weighted = tf @ sparse.diags(self._idf(np.arange(tf.shape[1])) if tf.shape[1] else np.zeros(0, np.float32))
+        norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+        return (sparse.diags(np.divide(1, norms, out=np.zeros_like(norms), where=norms > 0)) @ weighted).astype(np.float32)
+
+    def _row_weights(self, row: int) -> Tuple["np.ndarray", "np.ndarray"]:
+        if row < self.base_tf.shape[0]:
+            start, end = self.base_tf.indptr[row], self.base_tf.indptr[row + 1]
+            return self.base_tf.indices[start:end], self.base_tf.data[start:end]
+        weights = self.pending[row - self.base_tf.shape[0]]
+        return np.fromiter(weights.keys(), dtype=np.int32, count=len(weights)), np.fromiter(weights.values(), dtype=np.float32, count=len(weights))
+
+    def _add_one(self, canonical_id: int, name: Optional[str], ingredients) -> bool:
+        if canonical_id in self.rows:
+            return False
+        weights = {}
+        for term, count in recipe_terms(name, ingredients).items():
+            column = self.vocabulary.get(term)
+            if column is None:
+                column = self.vocabulary[term] = len(self.df)
+                self.df.append(0)
+            self.df[column] += 1
+            weights[column] = 1 + math.log(count)
+        self._df_array = None
+        self.rows[canonical_id] = len(self.ids)
+        self.ids.append(canonical_id)
+        self.pending.append(weights)
+        return True
+
+    def enqueue(self, recipes: Iterable):
+        """Queues stored canonical recipes for indexing without taking the index lock; for request handlers."""
+        if not self.loaded:
+            return
+        self._queued.extend((recipe.id, recipe.name, recipe.ingredients) for recipe in recipes if recipe.id is not None)
+        self._schedule_merge()
+
+    def add(self, recipes: Iterable, synced: bool = False):
+        """Indexes canonical recipes (anything with id, name and ingredients) not indexed yet.
+
+        With `synced`, the recipes are the database's rows after `synced_through`, in id order.
+        """
+        if not self.loaded:
+            return
+        with self._lock:
+            for recipe in recipes:
+                if recipe.id is None:
+                    continue
+                if self._add_one(recipe.id, recipe.name, recipe.ingredients):
+                    self._pending_matrix = None
+                if synced:
+                    self.synced_through = max(self.synced_through, recipe.id)
+        self._schedule_merge()
+
+    def replace(self, recipes: Iterable, synced: bool = False):
+        """Re-indexes canonical recipes whose name or ingredients changed (re-extraction).
+
+        With `synced`, the recipes are the database's rows updated after `updated_through`.
+        """
+        if not self.loaded:
+            return
+        with self._lock:
+            for recipe in recipes:
+                self.remove(recipe.id)
+                self._add_one(recipe.id, recipe.name, recipe.ingredients)
+                self._pending_matrix = None
+                if synced and recipe.updated_at is not None:
+                    self.updated_through = max(self.updated_through or recipe.updated_at, recipe.updated_at)
+        self._schedule_merge()
+
+    def _drain_queue(self):
+        while self._queued:
+            if self._add_one(*self._queued.popleft()):
+                self._pending_matrix = None
+
+    def _schedule_merge(self):
+        """Merges and saves in a background thread once SIMILAR_INDEX_MERGE_ROWS rows are waiting."""
+        if len(self.pending) + len(self._queued) >= self.merge_rows and not self._merging.locked():
+            threading.Thread(target=self._merge_and_save, name="similar-index-merge", daemon=True).start()
+
+    def _merge_and_save(self):
+        if not self._merging.acquire(blocking=False):
+            return
+        try:
+            self.save()
+        except Exception as e:
+            logger.warning(f"Could not merge and save the similar-recipes index: {e}")
+        finally:
+            self._merging.release()
+
+    def remove(self, canonical_id: int):
+        """Drops a recipe from the results; its row is purged at the next merge."""
+        if not self.loaded:
+            return
+        with self._lock:
+            row = self.rows.pop(canonical_id, None)
+            if row is None:
+                return
+            columns, _ = self._row_weights(row)
+            for column in columns:
+                self.df[column] -= 1
+            self._df_array = None
+            self.removed.add(row)
+
+    def merge(self):
+        """Moves pending rows into the main matrix, purges removed rows and refreshes IDF weights and norms."""
+        with self._lock:
+            self._drain_queue()
+            width = len(self.df)
+            tf = sparse.vstack([self._resized(self.base_tf, width), self._pending_tf(width)], format="csr")
+            if self.removed:
+                keep = np.array([row not in self.removed for row in range(tf.shape[0])], dtype=bool)
+                tf = tf[keep]
+                self.ids = [canonical_id for row, canonical_id in enumerate(self.ids) if keep[row]]
+                self.rows = {canonical_id: row for row, canonical_id in enumerate(self.ids)}
+                self.removed = set()
+            self.base_tf = tf.astype(np.float32)
+            self.base = self._normalised(self.base_tf).tocsc()
+            self.pending = []
+            self._pending_matrix = None
+
+    @staticmethod
+    def _resized(matrix, width: int):
+        matrix = matrix.tocsr(copy=True)
+        matrix.resize((matrix.shape[0], width))
+        return matrix
+
+    def _pending_tf(self, width: int) -> "sparse.csr_matrix":
+        indptr, indices, data = [0], [], []
+        for weights in self.pending:
+            indices.extend(weights.keys())
+            data.extend(weights.values())
+            indptr.append(len(indices))
+        return sparse.csr_matrix((np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr)), shape=(len(self.pending), width))
+
+    def similar(self, canonical_id: int, k: int = 10, among: Optional[Collection[int]] = None) -> List[Tuple[int, float]]:
+        """The `k` recipes most similar to `canonical_id` as (canonical id, cosine similarity), optionally only from `among`."""
+        if not self.loaded:
+            return []
+        with self._lock:
+            self._drain_queue()
+            row = self.rows.get(canonical_id)
+            if row is None:
+                return []
+            columns, weights = self._row_weights(row)
+            query = weights * self._idf(columns)
+            norm = float(np.linalg.norm(query))
+            if not norm:
+                return []
+            query /= norm
+            in_base = columns < self.base.shape[1]
+            scores = np.zeros(len(self.ids), dtype=np.float32)
+            if self.base.shape[0]:
+                scores[:self.base.shape[0]] = self.base[:, columns[in_base]] @ query[in_base]
+            if self.pending:
+                if self._pending_matrix is None or self._pending_matrix.shape[1] != len(self.df):
+                    self._pending_matrix = self._normalised(self._pending_tf(len(self.df))).tocsc()
+                scores[self.base.shape[0]:] = self._pending_matrix[:, columns] @ query
+            scores[row] = 0
+            if self.removed:
+                scores[list(self.removed)] = 0
+            if among is not None:
+                mask = np.zeros(len(scores), dtype=bool)
+                mask[[self.rows[i] for i in among if i in self.rows]] = True
+                scores[~mask] = 0
+            candidates = np.flatnonzero(scores)  # rows sharing a term; usually a small share of the index
+            k = min(k, len(candidates))
+            if k <= 0:
+                return []
+            top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            top = top[np.lexsort((top, -scores[top]))]
+            return [(self.ids[i], round(float(scores[i]), 4)) for i in top]
+
+    def save(self):
+        """Writes the merged index atomically; queued and pending rows are merged first."""
+        if not self.loaded:
+            return
+        with self._lock:
+            if self._queued or self.pending or self.removed:
+                self.merge()
+            buffer = io.BytesIO()
+            terms = sorted(self.vocabulary, key=self.vocabulary.get)
+            np.savez(
+                buffer, data=self.base_tf.data, indices=self.base_tf.indices, indptr=self.base_tf.indptr,
+                shape=np.asarray(self.base_tf.shape), ids=np.asarray(self.ids, dtype=np.int64), df=np.asarray(self.df, dtype=np.int64),
+                terms=np.asarray(terms, dtype=str), synced_through=np.asarray(self.synced_through),
+                updated_through=np.asarray(self.updated_through.isoformat() if self.updated_through else ""),
+            )
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Per process and thread: workers and the background merge may save at the same time.
+        temporary = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        temporary.write_bytes(buffer.getvalue())
+        os.replace(temporary, self.path)
+
+    def load(self):
+        """Reads the saved index, or starts empty (the database sync then rebuilds it) if there is none."""
+        _import_numpy()
+        with self._lock:
+            self._reset()
+            self.loaded = True
+            if not self.path.exists():
+                return
+            try:
+                with np.load(self.path, allow_pickle=False) as saved:
+                    self.base_tf = sparse.csr_matrix((saved["data"], saved["indices"], saved["indptr"]), shape=tuple(saved["shape"]))
+                    self.ids = saved["ids"].tolist()
+                    self.df = saved["df"].tolist()
+                    self.vocabulary = {term: column for column, term in enumerate(saved["terms"].tolist())}
+                    self.synced_through = int(saved["synced_through"])
+                    updated_through = str(saved["updated_through"]) if "updated_through" in saved else ""
+                    self.updated_through = datetime.fromisoformat(updated_through) if updated_through else None
+                self.rows = {canonical_id: row for row, canonical_id in enumerate(self.ids)}
+                self.base = self._normalised(self.base_tf).tocsc()
+                logger.info(f"Loaded the similar-recipes index: {len(self.rows)} recipes, {len(self.vocabulary)} terms.")
+            except Exception as e:
+                logger.warning(f"Could not read the similar-recipes index at {self.path} ({e}); rebuilding it from the database.")
+                self._reset()
+
+
+similar_index = SimilarRecipeIndex() if SIMILAR_RECIPES_ENABLED else None
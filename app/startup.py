@@ -0,0 +1,109 @@
+import asyncio
+import importlib
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional
+
+from .utils.logger_config import get_app_logger
+
+logger = get_app_logger(__name__)
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+WARMUP_BROWSER = os.getenv("WARMUP_BROWSER", "false").lower() in ("1", "true", "yes")
+WARMUP_HTML = "<html><body><h1>Warm-up</h1><p>Tortilla de patatas.</p></body></html>"
+
+
+@dataclass
+class ComponentTiming:
+    status: str = "pending"  # pending, ready, failed or skipped
+    import_seconds: Optional[float] = None
+    init_seconds: Optional[float] = None
+    error: Optional[str] = None
+
+
+class StartupReport:
+    """Where startup time goes: import and initialisation cost per component, and when the app became ready."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.components: Dict[str, ComponentTiming] = {}
+        self.database_ready = False
+        self.warmup_done = False
+        self.ready_after: Optional[float] = None
+
+    def component(self, name: str) -> ComponentTiming:
+        return self.components.setdefault(name, ComponentTiming())
+
+    @contextmanager
+    def measure(self, name: str, phase: str):
+        """Times one phase ('import' or 'init') of a component; an exception marks the component failed."""
+        component = self.component(name)
+        started = time.perf_counter()
+        try:
+            yield component
+        except Exception as e:
+            component.status = "failed"
+            component.error = str(e)
+            raise
+        finally:
+            setattr(component, f"{phase}_seconds", round(time.perf_counter() - started, 3))
+
+    @property
+    def ready(self) -> bool:
+        return self.database_ready and self.warmup_done
+
+    def finish_warmup(self):
+        self.warmup_done = True
+        if self.ready and self.ready_after is None:
+            self.ready_after = round(time.perf_counter() - self.started, 3)
+
+    def snapshot(self) -> dict:
+        return {
+            "ready": self.ready,
+            "ready_after_seconds": self.ready_after,
+            "uptime_seconds": round(time.perf_counter() - self.started, 3),
+            "database_ready": self.database_ready,
+            "warmup_done": self.warmup_done,
+            "components": {name: asdict(component) for name, component in self.components.items()},
+        }
+
+
+startup_report = StartupReport()
+
+
+async def _warm_component(name: str, modules: List[str], init: Optional[Callable[[], object]] = None):
+    try:
+        with startup_report.measure(name, "import"):
+            for module in modules:
+                await asyncio.to_thread(importlib.import_module, module)
+        if init is not None:
+            with startup_report.measure(name, "init"):
+                result = init()
+                if asyncio.iscoroutine(result):
+                    await result
+        startup_report.component(name).status = "ready"
+    except Exception as e:
+        logger.warning(f"Warm-up of {name} failed: {e}")
+
+
+async def _launch_browser():
+    from .html_processor import MarkdownConverter
+
+    await MarkdownConverter().to_markdown(WARMUP_HTML, url="https://localhost/warm-up")
+
+
+async def warm_up(service_factory: Callable[[], object]):
+    """Imports the model providers and the crawler, then builds the extraction service.
+
+    Runs in the background from the lifespan hook so the server accepts requests (and answers
+    liveness probes) immediately; readiness turns on once this finishes. Launching the crawler's
+    browser is opt-in (WARMUP_BROWSER) since each conversion starts its own browser anyway.
+    """
+    try:
+        await _warm_component("agent", ["pydantic_ai"], init=lambda: asyncio.to_thread(service_factory))
+        await _warm_component("crawler", ["crawl4ai"], init=_launch_browser if WARMUP_BROWSER else None)
+    finally:
+        startup_report.finish_warmup()
+        logger.info(f"Warm-up finished: {startup_report.snapshot()['components']}")
@@ -0,0 +1,133 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict
+
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Receive, Scope, Send
+
+from .utils.logger_config import get_app_logger
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+logger = get_app_logger(__name__)
+
+COMPRESSIBLE_SUFFIXES = {".html", ".js", ".css", ".svg", ".json", ".txt", ".map"}
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+@dataclass
+class StaticAsset:
+    content_type: str
+    digest: str
+    cache_control: str
+    encodings: Dict[str, bytes]  # "identity", and "gzip"/"br" when they are smaller
+
+
+def _compress(data: bytes) -> Dict[str, bytes]:
+    encodings = {"identity": data}
+    compressed = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressed["br"] = brotli.compress(data, quality=11)
+    for encoding, body in compressed.items():
+        if len(body) < len(data):
+            encodings[encoding] = body
+    return encodings
+
+
+def _fingerprinted_name(rel_path: str, digest: str) -> str:
+    stem, suffix = os.path.splitext(rel_path)
+    return f"{stem}.{digest}{suffix}"
+
+
+def _accepted_encodings(accept_encoding: str) -> set:
+    accepted = set()
+    for token in accept_encoding.split(","):
+        name, _, params = token.strip().partition(";")
+        if name and not re.search(r"q=0(\.0*)?\s*$", params.strip()):
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+class PrecompressedStaticFiles:
+    """Serves a build-free client directory from memory, precompressed and fingerprinted at startup.
+
+    Every text asset gets a content-hashed alias (`app.3f9c1a2b7d4e.js`) served with an immutable
+    Cache-Control, and HTML pages are rewritten to reference those aliases. HTML and the plain
+    asset names are revalidated through their ETag. Each response uses the smallest encoding the
+    client accepts (br, then gzip). Anything else in the directory is handed to StaticFiles.
+    """
+
+    def __init__(self, directory: str, index: str = "index.html"):
+        self.directory = Path(directory)
+        self.index = index
+        self.fallback = StaticFiles(directory=directory, html=True)
+        self.assets: Dict[str, StaticAsset] = {}
+        self.fingerprints: Dict[str, str] = {}
+        self.build()
+
+    def build(self):
+        files = [p for p in sorted(self.directory.rglob("*")) if p.is_file() and p.suffix in COMPRESSIBLE_SUFFIXES]
+        pages = []
+        for path in files:
+            rel_path = path.relative_to(self.directory).as_posix()
+            if path.suffix == ".html":
+                pages.append((rel_path, path))
+                continue
+            data = path.read_bytes()
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            encodings = _compress(data)
+            content_type = mimetypes.guess_type(rel_path)[0] or "application/octet-stream"
+            fingerprinted = _fingerprinted_name(rel_path, digest)
+            self.fingerprints[rel_path] = fingerprinted
+            self.assets[fingerprinted] = StaticAsset(content_type, digest, IMMUTABLE_CACHE_CONTROL, encodings)
+            self.assets[rel_path] = StaticAsset(content_type, digest, REVALIDATE_CACHE_CONTROL, encodings)
+
+        for rel_path, path in pages:
+            html = path.read_text(encoding="utf-8")
+            page_dir = os.path.dirname(rel_path)
+            for asset_path, fingerprinted in self.fingerprints.items():
+                reference = os.path.relpath(asset_path, page_dir or ".").replace(os.sep, "/")
+                replacement = os.path.relpath(fingerprinted, page_dir or ".").replace(os.sep, "/")
+                html = re.sub(rf'((?:src|href)=["\']){re.escape(reference)}(["\'])', rf"\g<1>{replacement}\g<2>", html)
+            data = html.encode("utf-8")
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            asset = StaticAsset("text/html; charset=utf-8", digest, REVALIDATE_CACHE_CONTROL, _compress(data))
+            self.assets[rel_path] = asset
+            if os.path.basename(rel_path) == self.index:
+                self.assets[page_dir] = asset
+
+        logger.info(f"Prepared {len(self.assets)} precompressed client assets from {self.directory} (brotli {'enabled' if brotli else 'unavailable'}).")
+
+    def response_for(self, asset: StaticAsset, request_headers: Headers) -> Response:
+        accepted = _accepted_encodings(request_headers.get("accept-encoding", ""))
+        encoding = next((e for e in ("br", "gzip") if e in accepted and e in asset.encodings), "identity")
+        etag = f'"{asset.digest}-{encoding}"'
+        headers = {"Cache-Control": asset.cache_control, "ETag": etag, "Vary": "Accept-Encoding"}
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+
+        if_none_match = request_headers.get("if-none-match", "")
+        if etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+            return Response(status_code=304, headers=headers)
+        return Response(asset.encodings[encoding], media_type=asset.content_type, headers=headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http" and scope["method"] in ("GET", "HEAD"):
+            root_path = scope.get("root_path", "")
+            path = scope["path"][len(root_path):] if scope["path"].startswith(root_path) else scope["path"]
+            asset = self.assets.get(path.strip("/"))
+            if asset is not None:
+                await self.response_for(asset, Headers(scope=scope))(scope, receive, send)
+                return
+        await self.fallback(scope, receive, send)
@@ -0,0 +1,72 @@
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable
+
+
+class AsyncRateLimiter:
+    """Token bucket that lets at most `rate_per_minute` calls through, with bursts of up to `burst`."""
+
+    def __init__(self, rate_per_minute: float, burst: int = 1):
+        self.interval = 60.0 / rate_per_minute if rate_per_minute > 0 else 0.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) / self.interval)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) * self.interval)
+
+
+class Checkpoint:
+    """Append-only JSON-lines record of finished items, so an interrupted batch job resumes where it stopped.
+
+    Each line is an object with an "id" key. Entries are flushed and fsynced as they are recorded;
+    a torn last line from a crash is ignored on load.
+    """
+
+    def __init__(self, path: Path, fresh: bool = False):
+        self.path = Path(path)
+        if fresh and self.path.exists():
+            self.path.unlink()
+        self.done: Dict[str, dict] = self._load()
+
+    def _load(self) -> Dict[str, dict]:
+        done: Dict[str, dict] = {}
+        if not self.path.exists():
+            return done
+        with self.path.open(encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                done[str(entry["id"])] = entry
+        return done
+
+    def __contains__(self, item_id) -> bool:
+        return str(item_id) in self.done
+
+    def record(self, entries: Iterable[dict]):
+        entries = list(entries)
+        if not entries:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, default=str) + "\n")
+                self.done[str(entry["id"])] = entry
+            f.flush()
+            os.fsync(f.fileno())
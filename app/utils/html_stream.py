@@ -0,0 +1,181 @@
+import re
+from typing import Dict, List, Optional
+
+SNIFF_BYTES = 1024
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain", "application/xml", "text/xml")
+BINARY_SIGNATURES = (b"%PDF", b"\x89PNG", b"\xff\xd8\xff", b"GIF8", b"PK\x03\x04", b"RIFF", b"\x1f\x8b")
+HTML_MARKERS = (b"<!doctype html", b"<html", b"<head", b"<body", b"<meta", b"<title", b"<div", b"<p")
+
+# Openings of regions that are dropped (or, for JSON-LD, kept verbatim) while streaming.
+_REGION_RE = re.compile(r"<(script|style)\b|<!--|([\"'(])data:[\w.+-]+/[\w.+-]+[;,]", re.IGNORECASE)
+_LD_JSON_RE = re.compile(r"type\s*=\s*[\"']?application/ld\+json", re.IGNORECASE)
+_LD_RECIPE_RE = re.compile(r"\"@type\"\s*:\s*(\[[^\]]*)?\"Recipe\"")
+_RECIPE_MARKUP_RE = re.compile(
+    r"itemtype=[\"'][^\"']*schema\.org/Recipe[\"']|itemprop=[\"']recipeIngredient"
+    r"|class=[\"'][^\"']*\b(wprm-recipe-container|tasty-recipes|mv-create-card)\b",  # recipe plugins' containers
+    re.IGNORECASE,
+)
+_MICRODATA_RECIPE_RE = re.compile(r"itemtype=[\"'][^\"']*schema\.org/Recipe[\"']", re.IGNORECASE)
+_PLUGIN_CONTAINER_RE = re.compile(r"class=[\"'](?:[^\"']*\s)?(wprm-recipe-container|tasty-recipes|mv-create-card)(?=[\s\"'])", re.IGNORECASE)
+_SECTION_TAG_RE = re.compile(r"<(/?)(article|main)\b[^>]*>", re.IGNORECASE)
+_TOKEN_TAIL = 48  # longest opening we must not split: `"data:application/vnd.something+xml;`
+_TAG_HOLD_BACK = 2000  # a tag split across chunks is scanned once complete, unless it is longer than this
+
+
+def looks_like_html(content_type: Optional[str], head: bytes) -> bool:
+    """Content-type sniffing: rejects binary bodies, and non-HTML declared types unless the bytes look like HTML."""
+    if head.startswith(BINARY_SIGNATURES):
+        return False
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    if media_type in HTML_CONTENT_TYPES:
+        return True
+    lowered = head[:SNIFF_BYTES].lstrip().lower()
+    return any(marker in lowered for marker in HTML_MARKERS)
+
+
+def recipe_markup_counts(html: str) -> Dict[str, int]:
+    """How many recipes each kind of structured markup declares: "json-ld", "microdata", "recipe-card".
+
+    A recipe page declares one; a listing page whose cards carry markup declares one per card.
+    """
+    counts = {"json-ld": 0, "microdata": 0, "recipe-card": 0}
+    for script in re.finditer(r"<script\b[^>]*>(.*?)</script>", html, re.IGNORECASE | re.DOTALL):
+        if _LD_JSON_RE.search(script.group(0)[:200]):
+            counts["json-ld"] += len(_LD_RECIPE_RE.findall(script.group(1)))
+    counts["microdata"] = len(_MICRODATA_RECIPE_RE.findall(html)) or int(bool(re.search(r"itemprop=[\"']recipeIngredient", html, re.IGNORECASE)))
+    counts["recipe-card"] = len(_PLUGIN_CONTAINER_RE.findall(html))
+    return {kind: count for kind, count in counts.items() if count}
+
+
+class HtmlStreamCleaner:
+    """Strips page regions the pipeline never uses while the HTML streams in, chunk by chunk.
+
+    Drops `<script>` (except JSON-LD, which carries structured recipe data), `<style>`, comments
+    and the payload of inline `data:` URIs. `done` turns true once the `<article>`/`<main>` that
+    encloses the recipe markup has closed (or, for a JSON-LD recipe, once the page's `<main>` has
+    closed): the rest is comments, related posts and footers, so the fetch can stop. Markup
+    outside any `<article>`/`<main>` never stops the fetch, nor do cards closing before it.
+    With `stop_early` False the whole page is kept.
+    """
+
+    def __init__(self, stop_early: bool = True):
+        self.stop_early = stop_early
+        self.parts: List[str] = []
+        self.pending = ""
+        self.terminator: Optional[str] = None  # set while inside a region
+        self.keeping = False  # True inside a JSON-LD script, whose content is kept
+        self.recipe_markup_seen = False
+        self.ld_recipe_seen = False
+        self.done = False
+        self._emitted = 0
+        self._scan_tail = ""  # emitted text not scanned yet: an incomplete tag
+        self._open_sections: List[str] = []  # <article>/<main> elements open at the scan position
+        self._stop_depth: Optional[int] = None  # stop when the enclosing section at this depth closes
+        self._region: List[str] = []
+
+    def _emit(self, text: str):
+        if not text:
+            return
+        self.parts.append(text)
+        window = self._scan_tail + text
+        window_start = self._emitted - len(self._scan_tail)
+        self._emitted += len(text)
+        tag_start = window.rfind("<")
+        end = len(window)
+        if tag_start >= 0 and ">" not in window[tag_start:] and end - tag_start < _TAG_HOLD_BACK:
+            end = tag_start
+        self._scan_tail = window[end:]
+        stop = self._scan(window[:end]) if self.stop_early else None
+        if stop is not None:
+            self.done = True
+            self.parts = ["".join(self.parts)[:window_start + stop]]
+
+    def _markup_seen(self, depth: int):
+        self.recipe_markup_seen = True
+        self._stop_depth = depth or None
+
+    def _scan(self, text: str) -> Optional[int]:
+        """Tracks open sections through `text`; returns the end of the closing tag to stop at, if any."""
+        position = 0
+        for tag in _SECTION_TAG_RE.finditer(text):
+            if not self.recipe_markup_seen and _RECIPE_MARKUP_RE.search(text, position, tag.start()):
+                self._markup_seen(len(self._open_sections))
+            position = tag.end()
+            name = tag.group(2).lower()
+            if not tag.group(1):
+                self._open_sections.append(name)
+                if not self.recipe_markup_seen and _RECIPE_MARKUP_RE.search(tag.group(0)):
+                    self._markup_seen(len(self._open_sections))
+                continue
+            if name not in self._open_sections:
+                continue
+            while self._open_sections.pop() != name:
+                pass
+            depth = len(self._open_sections)
+            if self._stop_depth is not None and depth < self._stop_depth:
+                return tag.end()
+            if self.ld_recipe_seen and not self.recipe_markup_seen and name == "main" and "main" not in self._open_sections:
+                return tag.end()
+        if not self.recipe_markup_seen and _RECIPE_MARKUP_RE.search(text, position):
+            self._markup_seen(len(self._open_sections))
+        return None
+
+    def feed(self, text: str):
+        self.pending += text
+        while self.pending and not self.done:
+            if self.terminator is not None:
+                end = self.pending.lower().find(self.terminator)
+                if end < 0:
+                    keep = len(self.pending) - len(self.terminator) + 1
+                    if keep > 0:
+                        if self.keeping:
+                            self._region.append(self.pending[:keep])
+                        self.pending = self.pending[keep:]
+                    return
+                if self.keeping:
+                    content = "".join(self._region) + self.pending[:end]
+                    self._region = []
+                    self.ld_recipe_seen = self.ld_recipe_seen or bool(_LD_RECIPE_RE.search(content))
+                    self._emit(content + self.pending[end:end + len(self.terminator)])
+                elif self.terminator in ("\"", "'", ")"):
+                    self._emit(self.terminator)  # closes the emptied data URI
+                self.pending = self.pending[end + len(self.terminator):]
+                self.terminator, self.keeping = None, False
+                continue
+
+            match = _REGION_RE.search(self.pending)
+            if match is None:
+                safe = max(0, len(self.pending) - _TOKEN_TAIL)
+                self._emit(self.pending[:safe])
+                self.pending = self.pending[safe:]
+                return
+            self._emit(self.pending[:match.start()])
+            tag = (match.group(1) or "").lower()
+            if tag:
+                tag_end = self.pending.find(">", match.end())
+                if tag_end < 0:
+                    self.pending = self.pending[match.start():]
+                    return
+                opening = self.pending[match.start():tag_end + 1]
+                self.keeping = tag == "script" and bool(_LD_JSON_RE.search(opening))
+                if self.keeping:
+                    self._emit(opening)
+                self.terminator = f"</{tag}>"
+                self.pending = self.pending[tag_end + 1:]
+            elif match.group(0) == "<!--":
+                self.terminator = "-->"
+                self.pending = self.pending[match.end():]
+            else:
+                quote = match.group(2)
+                self._emit(f"{quote}data:,")
+                self.terminator = ")" if quote == "(" else quote
+                self.pending = self.pending[match.end():]
+
+    def close(self) -> str:
+        """Returns the cleaned document. Text pending outside a region is kept; an unterminated region is dropped."""
+        if self.terminator is None and not self.done:
+            self._emit(self.pending)
+        self.pending = ""
+        if self.done:
+            self.parts.append("</body></html>")
+        return "".join(self.parts)
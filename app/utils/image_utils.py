@@ -1,11 +1,115 @@
-# Placeholder for image utility functions
+import asyncio
+import hashlib
+import io
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional
 
-def upload_image_to_cloudinary(image_data, recipe_name: str):
-    print(f"[image_utils.py (Placeholder)] Would upload image for {recipe_name} to Cloudinary.")
-    # In a real implementation, you would return the Cloudinary URL or an ID.
-    return f"https://placeholder.cloudinary.com/images/{recipe_name.replace(' ', '_').lower()}.jpg"
+import httpx
+from PIL import Image, ImageOps
 
-def delete_image_from_cloudinary(image_url: str):
-    print(f"[image_utils.py (Placeholder)] Would delete image {image_url} from Cloudinary.")
-    # Return True if deletion was successful, False otherwise.
-    return True
+from .logger_config import get_app_logger
+
+logger = get_app_logger(__name__)
+
+IMAGE_STORAGE_DIR = Path(os.getenv("IMAGE_STORAGE_DIR", Path(__file__).resolve().parent.parent / "images"))
+IMAGE_VARIANT_WIDTHS = [int(w) for w in os.getenv("IMAGE_VARIANT_WIDTHS", "160,320,640,1280").split(",") if w.strip()]
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(15 * 1024 * 1024)))
+IMAGE_DOWNLOAD_TIMEOUT_SECONDS = float(os.getenv("IMAGE_DOWNLOAD_TIMEOUT_SECONDS", "20"))
+IMAGE_URL_PREFIX = "/images"
+
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+FORMAT_EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+IMAGE_KEY_RE = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{64}\.(webp|jpg)$")
+
+
+def image_path_for_key(key: str) -> Optional[Path]:
+    """Maps a stored image key (`ab/<sha256>.webp`) to its file, or None if the key is not one we issue."""
+    if not IMAGE_KEY_RE.match(key):
+        return None
+    return IMAGE_STORAGE_DIR / key
+
+
+def _store_content_addressed(data: bytes, extension: str) -> str:
+    digest = hashlib.sha256(data).hexdigest()
+    key = f"{digest[:2]}/{digest}.{extension}"
+    path = IMAGE_STORAGE_DIR / key
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+    return key
+
+
+def _encode(image: Image.Image, image_format: str) -> bytes:
+    buffer = io.BytesIO()
+    if image_format == "webp":
+        image.save(buffer, format="WEBP", quality=WEBP_QUALITY, method=4)
+    else:
+        if image.mode != "RGB":
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A") if "A" in image.getbands() else None)
+            image = background
+        image.save(buffer, format="JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def build_image_variants(image_bytes: bytes, widths: Optional[List[int]] = None) -> Dict[str, Dict[str, str]]:
+    """Resizes an image to each width and stores WebP and JPEG copies under their SHA-256.
+
+    Returns `{"<width>": {"webp": url, "jpeg": url}}`. Widths larger than the source are skipped,
+    except that a source narrower than every width still gets one variant at its own size.
+    Identical outputs map to the same file, so re-processing an image never duplicates storage.
+    """
+    with Image.open(io.BytesIO(image_bytes)) as source:
+        source = ImageOps.exif_transpose(source)
+        has_alpha = "A" in source.getbands() or "transparency" in source.info
+        source = source.convert("RGBA" if has_alpha else "RGB")
+
+        requested = sorted(set(widths or IMAGE_VARIANT_WIDTHS))
+        targets = [w for w in requested if w <= source.width] or [source.width]
+
+        variants: Dict[str, Dict[str, str]] = {}
+        for width in targets:
+            height = max(1, round(source.height * width / source.width))
+            resized = source if width == source.width else source.resize((width, height), Image.LANCZOS)
+            variants[str(width)] = {
+                image_format: f"{IMAGE_URL_PREFIX}/{_store_content_addressed(_encode(resized, image_format), extension)}"
+                for image_format, extension in FORMAT_EXTENSIONS.items()
+            }
+        return variants
+
+
+async def download_image(image_url: str) -> Optional[bytes]:
+    """Downloads an image, giving up on non-image responses and bodies over IMAGE_MAX_BYTES."""
+    async with httpx.AsyncClient(follow_redirects=True, timeout=IMAGE_DOWNLOAD_TIMEOUT_SECONDS) as client:
+        async with client.stream("GET", image_url) as response:
+            response.raise_for_status()
+            content_type = response.headers.get("content-type", "")
+            if content_type and not content_type.startswith("image/"):
+                logger.warning(f"Image URL {image_url} returned non-image content type '{content_type}'.")
+                return None
+            chunks = []
+            size = 0
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+                if size > IMAGE_MAX_BYTES:
+                    logger.warning(f"Image at {image_url} exceeds {IMAGE_MAX_BYTES} bytes. Skipping.")
+                    return None
+                chunks.append(chunk)
+            return b"".join(chunks)
+
+
+async def generate_image_variants(image_url: str) -> Optional[Dict[str, Dict[str, str]]]:
+    """Downloads the recipe's main image once and returns its stored variants, or None on failure."""
+    try:
+        image_bytes = await download_image(image_url)
+        if not image_bytes:
+            return None
+        return await asyncio.to_thread(build_image_variants, image_bytes)
+    except Exception as e:
+        logger.warning(f"Could not build image variants for {image_url}: {e}")
+        return None
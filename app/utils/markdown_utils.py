@@ -0,0 +1,185 @@
+import re
+from html.parser import HTMLParser
+from typing import List, Optional
+from urllib.parse import urljoin
+
+_HEADING_RE = re.compile(r"^#{1,6}\s")
+_HEADING_LEVEL_RE = re.compile(r"^(#{1,6})\s+(.*)$")
+_IMAGE_RE = re.compile(r"!\[[^\]]*\]\(\s*<?(https?://[^\s)>]+)>?(?:\s+\"[^\"]*\")?\s*\)")
+
+
+def split_markdown_blocks(markdown: str) -> List[str]:
+    """Splits Markdown into headings and paragraphs, keeping each heading as its own block."""
+    blocks: List[str] = []
+    current: List[str] = []
+    for line in markdown.splitlines():
+        if _HEADING_RE.match(line) or not line.strip():
+            if current:
+                blocks.append("\n".join(current))
+                current = []
+            if line.strip():
+                blocks.append(line)
+            continue
+        current.append(line)
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+
+def _split_oversized_block(block: str, max_chars: int) -> List[str]:
+    pieces: List[str] = []
+    current = ""
+    for line in block.splitlines():
+        while len(line) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        if current and len(current) + 1 + len(line) > max_chars:
+            pieces.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_markdown(markdown: str, max_chars: int, overlap_chars: int = 0) -> List[str]:
+    """Packs heading/paragraph blocks into chunks of at most `max_chars`.
+
+    Each chunk after the first starts with the trailing blocks of the previous chunk, up to
+    `overlap_chars`, so an ingredient list or step sequence cut at a boundary is seen whole at
+    least once. A heading starts a new chunk when the current one is already half full.
+    """
+    if len(markdown) <= max_chars:
+        return [markdown] if markdown else []
+
+    blocks: List[str] = []
+    for block in split_markdown_blocks(markdown):
+        blocks.extend(_split_oversized_block(block, max_chars) if len(block) > max_chars else [block])
+
+    chunks: List[str] = []
+    current: List[str] = []
+    current_size = 0
+    for block in blocks:
+        starts_section = bool(_HEADING_RE.match(block))
+        too_big = current_size + len(block) + 2 > max_chars
+        if current and (too_big or (starts_section and current_size * 2 > max_chars)):
+            chunks.append("\n\n".join(current))
+            overlap: List[str] = []
+            overlap_size = 0
+            for previous in reversed(current):
+                if overlap_size + len(previous) + 2 > overlap_chars:
+                    break
+                overlap.insert(0, previous)
+                overlap_size += len(previous) + 2
+            if overlap_size + len(block) + 2 > max_chars:
+                overlap, overlap_size = [], 0
+            current, current_size = overlap, overlap_size
+        current.append(block)
+        current_size += len(block) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def _heading_level(line: str, keywords: List[str]) -> int:
+    """Returns the level of a heading that mentions one of `keywords`, or 0.
+
+    Short bold or colon-terminated lines ("**Ingredientes**", "Preparación:") count as
+    level-7 headings because many recipe sites do not use real Markdown headings.
+    """
+    stripped = line.strip()
+    match = _HEADING_LEVEL_RE.match(stripped)
+    if match:
+        level, text = len(match.group(1)), match.group(2)
+    elif len(stripped) <= 40 and (stripped.startswith("**") or stripped.endswith(":")):
+        level, text = 7, stripped
+    else:
+        return 0
+    lowered = text.lower()
+    return level if any(keyword in lowered for keyword in keywords) else 0
+
+
+def find_section(markdown: str, keywords: List[str], max_chars: int) -> Optional[str]:
+    """Returns the section under the first heading mentioning any of `keywords`, capped at `max_chars`."""
+    lines = markdown.splitlines()
+    for start, line in enumerate(lines):
+        level = _heading_level(line, keywords)
+        if not level:
+            continue
+        section = [line]
+        for following in lines[start + 1:]:
+            match = _HEADING_LEVEL_RE.match(following.strip())
+            if match and len(match.group(1)) <= level:
+                break
+            section.append(following)
+        return "\n".join(section)[:max_chars]
+    return None
+
+
+def find_image_urls(markdown: str) -> List[str]:
+    """Absolute image URLs referenced in the Markdown, in page order and without duplicates."""
+    return list(dict.fromkeys(_IMAGE_RE.findall(markdown)))
+
+
+class _MarkdownWriter(HTMLParser):
+    SKIPPED_TAGS = {"script", "style", "noscript", "template", "svg", "head", "nav", "footer", "form", "iframe"}
+    BLOCK_TAGS = {"p", "div", "section", "article", "main", "header", "ul", "ol", "table", "tr", "br", "blockquote", "figure"}
+
+    def __init__(self, base_url: Optional[str]):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.lines: List[str] = []
+        self.current: List[str] = []
+        self.skipping = 0
+
+    def _end_line(self):
+        line = re.sub(r"\s+", " ", "".join(self.current)).strip()
+        if line and line not in ("#", "-"):
+            self.lines.append(line)
+        self.current = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED_TAGS:
+            self.skipping += 1
+        elif self.skipping:
+            return
+        elif re.fullmatch(r"h[1-6]", tag):
+            self._end_line()
+            self.current.append("#" * int(tag[1]) + " ")
+        elif tag == "li":
+            self._end_line()
+            self.current.append("- ")
+        elif tag == "img":
+            src = dict(attrs).get("src")
+            if src:
+                alt = (dict(attrs).get("alt") or "").replace("]", "")
+                self.current.append(f" ![{alt}]({urljoin(self.base_url or '', src)}) ")
+        elif tag in self.BLOCK_TAGS:
+            self._end_line()
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED_TAGS:
+            self.skipping = max(0, self.skipping - 1)
+        elif not self.skipping and (tag in self.BLOCK_TAGS or tag == "li" or re.fullmatch(r"h[1-6]", tag)):
+            self._end_line()
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.current.append(data)
+
+
+def html_to_markdown(html: str, base_url: Optional[str] = None) -> str:
+    """A quick HTML-to-Markdown conversion without a browser: headings, list items, paragraphs and images.
+
+    Cruder than crawl4ai, but it takes milliseconds; used when the conversion budget is too short
+    to start a browser.
+    """
+    writer = _MarkdownWriter(base_url)
+    writer.feed(html)
+    writer.close()
+    writer._end_line()
+    return "\n\n".join(writer.lines)
@@ -0,0 +1,91 @@
+"""Compares the /getallrecipes read paths on a synthetic library.
+
+    python -m benchmarks.bench_recipe_serialization --recipes 10000
+
+"model path" is the previous implementation: ORM rows -> RecipePydantic per row -> response_model
+validation and serialisation. "row path" selects the response columns into dicts and serialises
+them with orjson (and msgpack when installed).
+"""
+import argparse
+import json
+import time
+from typing import List
+
+import orjson
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base, CanonicalRecipeDB, RecipeDB, UserDB, get_all_recipes_from_db, get_recipe_rows_for_user
+from app.models.recipe import Recipe as RecipePydantic
+from app.serialization import msgpack
+
+
+def build_library(session, count: int):
+    session.add(UserDB(id=1, email="bench@example.com", hashed_password="x"))
+    canonicals = [
+        CanonicalRecipeDB(
+            name=f"Recipe {i}",
+            source_url=f"https://example.com/recipes/{i}",
+            ingredients=[f"{n} g ingredient {n}" for n in range(12)],
+            instructions=[f"Step {n}: mix, stir and cook for {n} minutes." for n in range(8)],
+            image_url=f"https://images.example.com/{i}.jpg",
+            image_variants={"320": {"webp": f"/images/aa/{i:064x}.webp", "jpeg": f"/images/aa/{i:064x}.jpg"}},
+        )
+        for i in range(count)
+    ]
+    session.add_all(canonicals)
+    session.add_all(RecipeDB(source_url=c.source_url, canonical=c, user_id=1) for c in canonicals)
+    session.commit()
+
+
+def model_path(session) -> bytes:
+    recipes = []
+    for db_recipe in get_all_recipes_from_db(session, user_id=1):
+        ingredients = json.loads(db_recipe.ingredients) if isinstance(db_recipe.ingredients, str) else db_recipe.ingredients
+        instructions = json.loads(db_recipe.instructions) if isinstance(db_recipe.instructions, str) else db_recipe.instructions
+        recipes.append(RecipePydantic(
+            id=db_recipe.id, name=db_recipe.name, ingredients=ingredients, instructions=instructions,
+            image_url=db_recipe.image_url, source_url=db_recipe.source_url, image_variants=db_recipe.image_variants,
+        ))
+    adapter = TypeAdapter(List[RecipePydantic])
+    return adapter.dump_json(adapter.validate_python(recipes))
+
+
+def row_path(session, encode) -> bytes:
+    return encode(get_recipe_rows_for_user(session, user_id=1))
+
+
+def timed(label: str, fn, repeat: int):
+    best = float("inf")
+    size = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        size = len(fn())
+        best = min(best, time.perf_counter() - started)
+    print(f"{label:<22} {best * 1000:9.1f} ms  {size / 1024:9.0f} KiB")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recipes", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    build_library(session, args.recipes)
+
+    print(f"{args.recipes} recipes, best of {args.repeat}")
+    baseline = timed("model path", lambda: model_path(session), args.repeat)
+    fast = timed("row path (orjson)", lambda: row_path(session, orjson.dumps), args.repeat)
+    if msgpack is not None:
+        timed("row path (msgpack)", lambda: row_path(session, msgpack.packb), args.repeat)
+    print(f"speed-up (orjson): {baseline / fast:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -61,7 +61,7 @@ elif AI_PROVIDER == "gemini":
     if GEMINI_MODEL_NAME:
         print(f"  GEMINI_MODEL_NAME: {GEMINI_MODEL_NAME}")
     else:
-        print("  GEMINI_MODEL_NAME: Not set (will use default 'gemini-pro' or as set in scrap_agent.py, e.g., 'gemini-2.0-flash')")
+        print("  GEMINI_MODEL_NAME: Not set (will use default 'gemini-1.5-flash')")
 else:
     print(f"\nAI_PROVIDER ('{AI_PROVIDER}') is not recognized. Must be 'ollama', 'openai', or 'gemini'.")
 
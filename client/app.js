@@ -26,6 +26,8 @@ document.addEventListener('DOMContentLoaded', () => {
     const newRecipeUrlInput = document.getElementById('newRecipeUrlInput');
     const addRecipeFromUrlBtn = document.getElementById('addRecipeFromUrlBtn'); // Though submit is handled by form, might be useful
     const addRecipeStatus = document.getElementById('addRecipeStatus');
+    const recipePreview = document.getElementById('recipePreview');
+    const allRecipesCheckbox = document.getElementById('allRecipesCheckbox');
 
     // Edit Modal Elements
     const editRecipeModal = document.getElementById('editRecipeModal');
@@ -229,6 +231,19 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // Builds a <picture> from the locally stored variants so each card downloads a thumbnail
+    // sized to the view instead of the full-size original.
+    function recipeImageHtml(recipe) {
+        const widths = Object.keys(recipe.image_variants).map(Number).sort((a, b) => a - b);
+        const srcset = format => widths.map(w => `${recipe.image_variants[w][format]} ${w}w`).join(', ');
+        const fallback = recipe.image_variants[widths.find(w => w >= 320) || widths[widths.length - 1]].jpeg;
+        const sizes = '(max-width: 600px) 100vw, 320px';
+        return `<picture>
+            <source type="image/webp" srcset="${srcset('webp')}" sizes="${sizes}">
+            <img src="${fallback}" srcset="${srcset('jpeg')}" sizes="${sizes}" alt="${recipe.name}" loading="lazy" onerror="this.style.display='none'; this.parentElement.nextElementSibling.style.display='flex';">
+        </picture>`;
+    }
+
     function displayRecipes(recipes) {
         if (!recipes || recipes.length === 0) {
             recipesContainer.innerHTML = '<p class="loading-spinner">No recipes found.</p>';
@@ -243,8 +258,11 @@ document.addEventListener('DOMContentLoaded', () => {
             card.dataset.recipeId = recipe.id;
 
             let imageHtml = '';
-            if (recipe.image_url && recipe.image_url !== 'None' && recipe.image_url.toLowerCase() !== 'null') { 
-                imageHtml = `<img src="${recipe.image_url}" alt="${recipe.name}" onerror="this.style.display='none'; this.nextElementSibling.style.display='flex';">`;
+            if (recipe.image_variants && Object.keys(recipe.image_variants).length > 0) {
+                imageHtml = recipeImageHtml(recipe);
+                imageHtml += '<div class="placeholder-image" style="height: 200px; background: #eee; display:none; align-items:center; justify-content:center; color:#aaa;">Image not available</div>';
+            } else if (recipe.image_url && recipe.image_url !== 'None' && recipe.image_url.toLowerCase() !== 'null') { 
+                imageHtml = `<img src="${recipe.image_url}" alt="${recipe.name}" loading="lazy" onerror="this.style.display='none'; this.nextElementSibling.style.display='flex';">`;
                 imageHtml += '<div class="placeholder-image" style="height: 200px; background: #eee; display:none; align-items:center; justify-content:center; color:#aaa;">Image not available</div>';
             } else {
                 imageHtml = '<div class="placeholder-image" style="height: 200px; background: #eee; display:flex; align-items:center; justify-content:center; color:#aaa;">No Image Provided</div>';
@@ -578,6 +596,91 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // --- Streaming recipe extraction ---
+    const STAGE_MESSAGES = {
+        fetching: 'Fetching page...',
+        converting: 'Reading page content...',
+        extracting: 'Extracting recipe...'
+    };
+
+    async function readRecipeStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                let eventName = 'message';
+                const dataLines = [];
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                    else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+                });
+                if (dataLines.length > 0) onEvent(eventName, JSON.parse(dataLines.join('\n')));
+            }
+        }
+    }
+
+    function renderPreviewList(tagName, items) {
+        const list = document.createElement(tagName);
+        items.forEach(item => {
+            const li = document.createElement('li');
+            li.textContent = item;
+            list.appendChild(li);
+        });
+        return list;
+    }
+
+    function renderRecipePreview(recipe) {
+        if (!recipePreview) return;
+        recipePreview.innerHTML = '';
+        const title = document.createElement('h3');
+        title.textContent = recipe.name || '...';
+        recipePreview.appendChild(title);
+        if (recipe.ingredients && recipe.ingredients.length > 0) {
+            recipePreview.appendChild(renderPreviewList('ul', recipe.ingredients));
+        }
+        if (recipe.instructions && recipe.instructions.length > 0) {
+            recipePreview.appendChild(renderPreviewList('ol', recipe.instructions));
+        }
+        recipePreview.style.display = 'block';
+    }
+
+    function hideRecipePreview() {
+        if (!recipePreview) return;
+        recipePreview.innerHTML = '';
+        recipePreview.style.display = 'none';
+    }
+
+    async function importAllRecipesFromPage(recipeUrl) {
+        addRecipeStatus.textContent = 'Extracting all recipes on the page... This may take a moment.';
+        const response = await fetch(`${BASE_API_URL}/obtainrecipe`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Authorization': `Bearer ${getToken()}`,
+                'Accept': 'application/json'
+            },
+            body: JSON.stringify({ url: recipeUrl, all_recipes: true })
+        });
+        const responseData = await response.json();
+        if (response.ok && Array.isArray(responseData)) {
+            addRecipeStatus.textContent = `Imported ${responseData.length} recipe(s) from the page.`;
+            addRecipeStatus.style.color = 'green';
+            newRecipeUrlInput.value = '';
+            fetchRecipes();
+        } else {
+            addRecipeStatus.textContent = `Error: ${response.status} - ${responseData.detail || 'Failed to import recipes.'}`;
+            addRecipeStatus.style.color = 'red';
+            console.error('Failed to import recipes:', responseData);
+        }
+    }
+
     // Event listener for the 'Add Recipe from URL' form
     if (addRecipeForm) {
         addRecipeForm.addEventListener('submit', async function(event) {
@@ -600,34 +703,42 @@ document.addEventListener('DOMContentLoaded', () => {
             addRecipeStatus.style.color = 'inherit'; // Use default text color
 
             try {
-                const response = await fetch(`${BASE_API_URL}/obtainrecipe`, { // Changed URL here
+                if (allRecipesCheckbox && allRecipesCheckbox.checked) {
+                    await importAllRecipesFromPage(recipeUrl);
+                    return;
+                }
+
+                const response = await fetch(`${BASE_API_URL}/obtainrecipe/stream`, {
                     method: 'POST',
                     headers: {
                         'Content-Type': 'application/json',
                         'Authorization': `Bearer ${getToken()}`,
-                        'Accept': 'application/json' // Expect a JSON response
+                        'Accept': 'text/event-stream'
                     },
                     body: JSON.stringify({ url: recipeUrl })
                 });
 
-                const responseData = await response.json(); // Try to parse JSON regardless of status for error messages
-
-                console.log('Received responseData:', JSON.stringify(responseData, null, 2));
-
                 if (response.ok) {
-                    // Check if responseData itself is not null and has an id
-                    if (responseData && typeof responseData.id !== 'undefined' && responseData.id !== null) { 
-                        addRecipeStatus.textContent = 'Recipe processed successfully!';
-                        addRecipeStatus.style.color = 'green';
-                        newRecipeUrlInput.value = ''; // Clear input field on success
-                        fetchRecipes(); // Refresh the recipe list
-                    } else {
-                        console.error('Recipe added, but response data was not in expected format or missing ID.', responseData);
-                        addRecipeStatus.textContent = 'Recipe processed, but response data was unexpected.';
-                        addRecipeStatus.style.color = 'red';
-                    }
-
+                    await readRecipeStream(response, (eventName, data) => {
+                        if (eventName === 'status') {
+                            addRecipeStatus.textContent = STAGE_MESSAGES[data.stage] || 'Processing recipe...';
+                        } else if (eventName === 'partial') {
+                            renderRecipePreview(data);
+                        } else if (eventName === 'complete') {
+                            hideRecipePreview();
+                            addRecipeStatus.textContent = 'Recipe processed successfully!';
+                            addRecipeStatus.style.color = 'green';
+                            newRecipeUrlInput.value = ''; // Clear input field on success
+                            fetchRecipes(); // Refresh the recipe list
+                        } else if (eventName === 'error') {
+                            hideRecipePreview();
+                            addRecipeStatus.textContent = `Error: ${data.detail || 'Failed to process recipe.'}`;
+                            addRecipeStatus.style.color = 'red';
+                            console.error('Failed to add recipe:', data);
+                        }
+                    });
                 } else {
+                    const responseData = await response.json(); // Try to parse JSON regardless of status for error messages
                     // Handle HTTP errors (e.g., 400, 404, 422, 500)
                     let errorMessage = `Error: ${response.status} ${response.statusText}`;
                     if (responseData && responseData.detail) {
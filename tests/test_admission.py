@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.admission import AdmissionController
+
+
+def test_user_bucket_rejects_with_retry_after_once_burst_is_spent():
+    controller = AdmissionController(max_concurrent=2, max_queue=2, queue_timeout=1, user_rate_per_minute=6, user_burst=2)
+    asyncio.run(controller.admit(1))
+    asyncio.run(controller.admit(1))
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(controller.admit(1))
+
+    assert exc_info.value.status_code == 429
+    assert 1 <= int(exc_info.value.headers["Retry-After"]) <= 10
+    asyncio.run(controller.admit(2))  # other users have their own bucket
+    assert controller.snapshot()["rejected"]["rate_limited"] == 1
+
+
+def test_requests_queue_for_a_slot_and_overflow_is_rejected():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=5, user_rate_per_minute=600, user_burst=10)
+        release_first = asyncio.Event()
+        order = []
+
+        async def run(name, hold=None):
+            async with controller.slot(user_id=1):
+                order.append(name)
+                if hold is not None:
+                    await hold.wait()
+
+        first = asyncio.create_task(run("first", release_first))
+        await asyncio.sleep(0.05)  # admission takes the user's token in a thread
+        second = asyncio.create_task(run("second"))
+        await asyncio.sleep(0.05)
+        assert controller.snapshot()["queue_depth"] == 1
+
+        with pytest.raises(HTTPException) as exc_info:
+            await controller.admit(user_id=2)
+        assert exc_info.value.status_code == 503
+        assert "Retry-After" in exc_info.value.headers
+
+        release_first.set()
+        await asyncio.gather(first, second)
+        return controller.snapshot(), order
+
+    snapshot, order = asyncio.run(scenario())
+
+    assert order == ["first", "second"]
+    assert snapshot["running"] == 0 and snapshot["queue_depth"] == 0
+    assert snapshot["admitted"] == 2 and snapshot["queued"] == 1
+    assert snapshot["rejected"]["queue_full"] == 1
+
+
+def test_queue_wait_times_out_with_503():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=0.05, user_rate_per_minute=600, user_burst=10)
+        await controller.acquire()
+        with pytest.raises(HTTPException) as exc_info:
+            await controller.acquire()
+        return exc_info.value, controller.snapshot()
+
+    error, snapshot = asyncio.run(scenario())
+
+    assert error.status_code == 503
+    assert snapshot["rejected"]["queue_timeout"] == 1
+    assert snapshot["queue_depth"] == 0
+
+
+def test_stored_recipes_are_served_while_the_user_bucket_is_empty(monkeypatch):
+    from app import backend
+    from app.database import add_canonical_recipes
+    from app.models.recipe import Recipe
+    from tests.test_negative_cache import _Fetcher, _service, _session_generator
+
+    db, sessions = _session_generator()
+    url = "https://cocina.example/tortilla"
+    add_canonical_recipes(db, [(Recipe(name="Tortilla", ingredients=["4 huevos"], instructions=["Cuajar."]), url)])
+    controller = AdmissionController(max_concurrent=1, max_queue=0, queue_timeout=1, user_rate_per_minute=1, user_burst=1)
+    asyncio.run(controller.admit(1))  # the user's only token is spent
+    monkeypatch.setattr(backend, "admission", controller)
+    monkeypatch.setattr(backend, "get_db", sessions)
+
+    class _Request:
+        async def receive(self):
+            await asyncio.Event().wait()  # the client stays connected
+
+    class _User:
+        id, email, tier = 1, "ana@example.com", "free"
+
+    fetcher = _Fetcher("<html></html>")
+    service = _service(fetcher)
+    recipe = asyncio.run(backend.obtain_recipe_endpoint(backend.UrlRequest(url=url), _Request(), current_user=_User(), recipe_service=service))
+
+    assert recipe.name == "Tortilla" and fetcher.calls == 0
+    assert controller.snapshot()["rejected"]["rate_limited"] == 0
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(backend.obtain_recipe_endpoint(backend.UrlRequest(url="https://cocina.example/flan"), _Request(), current_user=_User(), recipe_service=service))
+    assert exc_info.value.status_code == 429
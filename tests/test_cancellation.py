@@ -0,0 +1,153 @@
+import asyncio
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import cancellation, recipe_service
+from app.cancellation import ClientDisconnected, cancel_on_disconnect, iterate_until_disconnected
+from app.coordination import InMemoryCoordination
+from app.database import Base
+from app.html_processor import MarkdownConverter
+from app.models.recipe import Recipe
+from app.page_archive import PageArchive
+from app.recipe_service import RecipeService
+
+
+class _Request:
+    """Delivers `http.disconnect` once `disconnect` is set, like a server whose client went away."""
+
+    def __init__(self):
+        self.disconnect = asyncio.Event()
+
+    async def receive(self):
+        await self.disconnect.wait()
+        return {"type": "http.disconnect"}
+
+
+def test_work_is_cancelled_when_the_client_disconnects(monkeypatch):
+    monkeypatch.setattr(cancellation, "cancellation_stats", cancellation.CancellationStats())
+    unwound = []
+
+    async def work():
+        try:
+            await asyncio.sleep(30)
+        finally:
+            unwound.append(True)
+
+    async def scenario():
+        request = _Request()
+        assert await cancel_on_disconnect(request, asyncio.sleep(0, result="done")) == "done"
+        asyncio.get_running_loop().call_later(0.05, request.disconnect.set)
+        with pytest.raises(ClientDisconnected):
+            await cancel_on_disconnect(request, work())
+
+    asyncio.run(asyncio.wait_for(scenario(), 5))
+    assert unwound == [True]
+    assert cancellation.cancellation_stats.cancelled_requests == 1
+
+
+def test_stream_stops_at_the_pending_step_when_the_client_disconnects():
+    closed = []
+
+    async def events():
+        try:
+            yield "status"
+            await asyncio.sleep(30)
+            yield "never"
+        finally:
+            closed.append(True)
+
+    async def scenario():
+        request = _Request()
+        received = []
+        with pytest.raises(ClientDisconnected):
+            async for event in iterate_until_disconnected(request, events()):
+                received.append(event)
+                asyncio.get_running_loop().call_later(0.05, request.disconnect.set)
+        return received
+
+    assert asyncio.run(asyncio.wait_for(scenario(), 5)) == ["status"]
+    assert closed == [True]
+
+
+def test_cancelling_a_conversion_cancels_the_crawl_on_its_thread():
+    started, cancelled = threading.Event(), threading.Event()
+
+    class _SlowConverter(MarkdownConverter):
+        async def _perform_crawl_async(self, html_content, url):
+            started.set()
+            try:
+                await asyncio.sleep(30)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+    async def scenario():
+        task = asyncio.create_task(_SlowConverter().to_markdown("<p>x</p>", url="https://example.com"))
+        await asyncio.to_thread(started.wait, 5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert cancelled.wait(5)
+
+
+class _Fetcher:
+    calls = 0
+
+    async def fetch_html(self, url):
+        self.calls += 1
+        return "<html><h2>Ingredientes</h2></html>"
+
+
+class _Converter:
+    async def to_markdown(self, html_content, url):
+        return "## Ingredientes\n\n- 4 huevos\n\n## Preparación\n\n1. Batir."
+
+
+class _Agent:
+    current_model_identifier = "test-model"
+
+    def __init__(self):
+        self.started = asyncio.Event()
+        self.hang = True
+
+    async def extract_recipe_from_markdown(self, markdown_content):
+        self.started.set()
+        if self.hang:
+            await asyncio.sleep(30)
+        return Recipe(name="Tortilla", ingredients=["4 huevos"], instructions=["Batir."])
+
+
+def test_retry_after_a_cancelled_extraction_resumes_from_the_kept_page(tmp_path, monkeypatch):
+    monkeypatch.setattr(recipe_service, "page_archive", PageArchive(tmp_path))
+    coordination = InMemoryCoordination()
+    monkeypatch.setattr(recipe_service, "get_coordination", lambda: coordination)
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    service = RecipeService.__new__(RecipeService)
+    service.html_fetcher, service.markdown_converter, service.recipe_agent = _Fetcher(), _Converter(), _Agent()
+    url = "https://example.com/tortilla"
+
+    async def scenario():
+        task = asyncio.create_task(service.process_url_and_store_recipe(url, user_id=1, db_session_generator=lambda: iter([session])))
+        await service.recipe_agent.started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert coordination.get(f"partial:{url}") is not None
+        assert coordination.acquire_lock(f"extract:{url}", "someone-else", ttl=1)  # the cancelled run released it
+        coordination.release_lock(f"extract:{url}", "someone-else")
+
+        service.recipe_agent.hang = False
+        return await service.process_url_and_store_recipe(url, user_id=1, db_session_generator=lambda: iter([session]))
+
+    recipe = asyncio.run(asyncio.wait_for(scenario(), 5))
+    assert recipe.name == "Tortilla"
+    assert service.html_fetcher.calls == 1
+    assert coordination.get(f"partial:{url}") is None
@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+import pytest
+
+from app.coordination import InMemoryCoordination, SqliteCoordination
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backends(request, tmp_path):
+    """Two handles on the same coordination state, as two worker processes would have."""
+    if request.param == "memory":
+        shared = InMemoryCoordination()
+        return shared, shared
+    return SqliteCoordination(tmp_path / "coordination.db"), SqliteCoordination(tmp_path / "coordination.db")
+
+
+def test_lock_is_exclusive_until_released_or_expired(backends):
+    worker_a, worker_b = backends
+    assert worker_a.acquire_lock("extract:https://example.com/", "a", ttl=30)
+    assert not worker_b.acquire_lock("extract:https://example.com/", "b", ttl=30)
+
+    worker_b.release_lock("extract:https://example.com/", "b")  # not the owner: no effect
+    assert not worker_b.acquire_lock("extract:https://example.com/", "b", ttl=30)
+
+    worker_a.release_lock("extract:https://example.com/", "a")
+    assert worker_b.acquire_lock("extract:https://example.com/", "b", ttl=0.05)
+    time.sleep(0.1)
+    assert worker_a.acquire_lock("extract:https://example.com/", "a", ttl=30)
+
+
+def test_cache_values_are_shared_and_expire(backends):
+    worker_a, worker_b = backends
+    worker_a.set("robots:https://example.com", {"status": 200, "text": "User-agent: *"}, ttl=0.1)
+    assert worker_b.get("robots:https://example.com") == {"status": 200, "text": "User-agent: *"}
+    time.sleep(0.15)
+    assert worker_b.get("robots:https://example.com") is None
+
+
+def test_token_buckets_are_shared(backends):
+    worker_a, worker_b = backends
+    assert worker_a.take_token("user:1", capacity=2, refill_per_second=0.1) == (True, 0.0)
+    assert worker_b.take_token("user:1", capacity=2, refill_per_second=0.1)[0]
+    allowed, retry_after = worker_a.take_token("user:1", capacity=2, refill_per_second=0.1)
+    assert not allowed and 9 < retry_after <= 10
+
+
+def test_single_flight_runs_the_work_once(backends):
+    worker_a, worker_b = backends
+    runs = []
+
+    async def extract(coordination):
+        async with coordination.single_flight("extract:page", ttl=10, wait=5) as lease:
+            if lease.waited and runs:
+                return "reused"
+            await asyncio.sleep(0.3)
+            runs.append(1)
+            return "extracted"
+
+    async def scenario():
+        return await asyncio.gather(extract(worker_a), extract(worker_b))
+
+    assert sorted(asyncio.run(scenario())) == ["extracted", "reused"]
+    assert runs == [1]
+
+
+def test_backends_implement_the_interface_and_locks_outlive_the_longest_deadline():
+    from app.coordination import CoordinationBackend
+    from app.deadline import deadline_for
+    from app.recipe_service import EXTRACTION_LOCK_TTL_SECONDS
+
+    with pytest.raises(TypeError):
+        CoordinationBackend()
+    assert EXTRACTION_LOCK_TTL_SECONDS > deadline_for("stream", "premium").total
@@ -0,0 +1,69 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import CanonicalRecipeDB, RecipeDB, add_recipe_to_db, create_db_and_tables, get_canonical_recipe_by_url, get_recipe_rows_for_user, link_recipes_for_user, update_recipe_in_db
+from app.models.recipe import Recipe
+
+URL = "https://example.com/tortilla"
+
+
+def _engine():
+    return create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+
+def test_users_share_one_canonical_recipe_and_edits_are_copy_on_write():
+    engine = _engine()
+    create_db_and_tables(engine)
+    db = sessionmaker(bind=engine)()
+
+    first = add_recipe_to_db(db, Recipe(name="Tortilla", ingredients=["4 huevos"], instructions=["Batir."]), URL, user_id=1)
+    second = link_recipes_for_user(db, [get_canonical_recipe_by_url(db, URL)], user_id=2)[0]
+    update_recipe_in_db(db, second.id, {"name": "Tortilla de la abuela", "ingredients": []})
+
+    assert db.query(CanonicalRecipeDB).count() == 1
+    assert first.id != second.id and first.canonical_id == second.canonical_id
+    assert (first.name, first.ingredients) == ("Tortilla", ["4 huevos"])
+    assert (second.name, second.ingredients, second.instructions) == ("Tortilla de la abuela", [], ["Batir."])
+
+    get_canonical_recipe_by_url(db, URL).instructions = ["Batir y cuajar."]
+    db.commit()
+    assert [row["instructions"] for row in get_recipe_rows_for_user(db, 2)] == [["Batir y cuajar."]]
+    assert [row["name"] for row in get_recipe_rows_for_user(db, 2)] == ["Tortilla de la abuela"]
+
+
+def test_legacy_rows_are_migrated_to_canonical_recipes():
+    engine = _engine()
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE recipes (id INTEGER PRIMARY KEY, name VARCHAR, source_url VARCHAR NOT NULL, "
+            "ingredients JSON, instructions JSON, image_url VARCHAR, user_id INTEGER)"
+        ))
+        connection.execute(text("CREATE UNIQUE INDEX ix_recipes_source_url ON recipes (source_url)"))
+        connection.execute(text(
+            "INSERT INTO recipes (name, source_url, ingredients, instructions, user_id) "
+            "VALUES ('Tortilla', :url, '[\"4 huevos\"]', '[\"Batir.\"]', 1)"
+        ), {"url": URL})
+
+    create_db_and_tables(engine)
+    db = sessionmaker(bind=engine)()
+
+    link = db.query(RecipeDB).one()
+    assert link.canonical.name == "Tortilla" and link.name_override is None
+    assert link.ingredients == ["4 huevos"]
+    link_recipes_for_user(db, [link.canonical], user_id=2)
+    assert db.query(RecipeDB).count() == 2
+
+
+def test_a_cleared_image_does_not_fall_back_to_the_canonical_one():
+    engine = _engine()
+    create_db_and_tables(engine)
+    db = sessionmaker(bind=engine)()
+    first = add_recipe_to_db(db, Recipe(name="Tortilla", ingredients=["4 huevos"], instructions=["Batir."], image_url="https://example.com/t.jpg"), URL, user_id=1)
+    second = add_recipe_to_db(db, Recipe(name="Flan", ingredients=["4 huevos"], instructions=["Cuajar."]), "https://example.com/flan", user_id=1)
+
+    update_recipe_in_db(db, first.id, {"image_url": None, "image_variants": None})
+
+    assert first.image_url is None and first.canonical.image_url == "https://example.com/t.jpg"
+    assert [row["image_url"] for row in get_recipe_rows_for_user(db, 1)] == [None, None]
+    assert db.execute(text("SELECT image_variants IS NULL FROM canonical_recipes WHERE id = :id"), {"id": second.canonical_id}).scalar() == 1
@@ -0,0 +1,74 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app import deadline as deadline_module
+from app.deadline import Deadline, DeadlineExceeded, request_deadline, stage_budget
+from app.fetch_scheduler import FetchScheduler
+from app.html_processor import MarkdownConverter
+from tests.test_recipe_agent import _extractor, _tier
+from tests.test_recipe_quality import MARKDOWN, _recipe
+
+SHARES = {"fetch": 1, "convert": 1, "extract": 2}
+
+
+@pytest.fixture(autouse=True)
+def _fresh_stats(monkeypatch):
+    monkeypatch.setattr(deadline_module, "deadline_stats", deadline_module.DeadlineStats())
+
+
+def test_stages_get_their_share_plus_what_earlier_stages_left():
+    deadline = Deadline(10, SHARES)
+    assert deadline.remaining("fetch") == pytest.approx(2.5, abs=0.05)
+    assert deadline.remaining("convert") == pytest.approx(5, abs=0.05)
+    assert deadline.remaining("extract") == pytest.approx(10, abs=0.05)
+    assert deadline_module.deadline_for("obtainrecipe", "premium").total == 2 * deadline_module.deadline_for("obtainrecipe").total
+
+
+def test_stage_overrunning_its_budget_is_stopped_and_reported():
+    async def scenario():
+        async with stage_budget("fetch"):  # no deadline: unbounded
+            await asyncio.sleep(0)
+        with request_deadline(Deadline(0.2, SHARES)):
+            async with stage_budget("fetch"):
+                await asyncio.sleep(0)
+            with pytest.raises(DeadlineExceeded) as raised:
+                async with stage_budget("convert"):
+                    await asyncio.sleep(5)
+        return raised.value
+
+    error = asyncio.run(asyncio.wait_for(scenario(), 3))
+    assert error.stage == "convert"
+    stages = deadline_module.deadline_stats.snapshot()["stages"]
+    assert (stages["fetch"]["runs"], stages["fetch"]["overruns"]) == (1, 0)
+    assert (stages["convert"]["runs"], stages["convert"]["overruns"]) == (1, 1)
+
+
+def test_short_budgets_degrade_instead_of_failing():
+    class _NoBrowser(MarkdownConverter):
+        def _sync_crawl_wrapper(self, html_content, url, cancellation=None):
+            raise AssertionError("the browser should be skipped")
+
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(503, headers={"Retry-After": "30"})
+
+    scheduler = FetchScheduler(min_delay=0, respect_robots=False, transport=httpx.MockTransport(handler))
+    extractor = _extractor(_tier("small", _recipe(instructions=[])), _tier("large", _recipe()))
+
+    async def scenario():
+        with request_deadline(Deadline(4, SHARES)):
+            markdown = await _NoBrowser().to_markdown("<h2>Ingredientes</h2><ul><li>4 huevos</li></ul>", url="https://example.com")
+            response = await scheduler.fetch("https://example.com/receta")
+            recipe = await extractor.extract_recipe_from_markdown(MARKDOWN)
+        return markdown, response, recipe
+
+    markdown, response, recipe = asyncio.run(asyncio.wait_for(scenario(), 3))
+    assert markdown == "## Ingredientes\n\n- 4 huevos"
+    assert response.status_code == 503 and calls == ["/receta"]
+    assert recipe.instructions == []  # the small tier's answer, not an escalation
+    stages = deadline_module.deadline_stats.snapshot()["stages"]
+    assert {name: stats["degraded"] for name, stats in stages.items()} == {"convert": 1, "fetch": 1, "extract": 1}
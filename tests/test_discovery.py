@@ -0,0 +1,85 @@
+import asyncio
+
+import httpx
+
+from app.discovery import DiscoveryOptions, DiscoveryState, SiteDiscovery, classify_page
+from app.fetch_scheduler import FetchScheduler
+from app.html_processor import HtmlFetcher
+
+SITE = {
+    "/categoria/postres": '<a href="/recetas/flan">Flan</a> <a href="/recetas/natillas#comentarios">Natillas</a> <a href="/sobre-mi">Sobre mí</a>'
+                          ' <a href="https://otro.example/receta">Otro blog</a> <a href="/img/portada.jpg">Foto</a> <link rel="next" href="/categoria/postres/page/2">',
+    "/categoria/postres/page/2": '<a href="/recetas/arroz-con-leche">Arroz con leche</a> <a href="/categoria/postres">Volver</a>',
+    "/recetas/flan": '<script type="application/ld+json">{"@type": "Recipe", "name": "Flan"}</script><a href="/recetas/flan-de-queso">Flan de queso</a>',
+    "/recetas/natillas": "<h2>Ingredientes</h2><ul><li>1 l de leche</li></ul><h2>Preparación</h2><p>Calentar la leche.</p>",
+    "/recetas/arroz-con-leche": '<div itemscope itemtype="https://schema.org/Recipe"><span itemprop="name">Arroz con leche</span></div>',
+    "/recetas/flan-de-queso": "<p>Próximamente.</p>",
+    "/categoria/guisos": "<main>" + "".join(
+        f'<article class="recipe-card" itemscope itemtype="https://schema.org/Recipe"><a href="/recetas/guiso-{i}">Guiso {i}</a></article>' for i in range(20)
+    ) + "</main>",
+    "/sitemap_index.xml": "<?xml version='1.0'?><sitemapindex><sitemap><loc>https://blog.example/post-sitemap.xml</loc></sitemap></sitemapindex>",
+    "/post-sitemap.xml": "<?xml version='1.0'?><urlset><url><loc><![CDATA[https://blog.example/recetas/flan]]></loc></url><url><loc>https://blog.example/sobre-mi</loc></url></urlset>",
+}
+
+
+def _discovery(state, fetched, **options):
+    def handler(request):
+        fetched.append(request.url.path)
+        body = SITE.get(request.url.path)
+        content_type = "application/xml" if request.url.path.endswith(".xml") else "text/html"
+        return httpx.Response(200 if body else 404, headers={"content-type": content_type}, text=f"<html><body>{body}</body></html>" if body and not body.startswith("<?xml") else body or "")
+
+    scheduler = FetchScheduler(min_delay=0, respect_robots=False, transport=httpx.MockTransport(handler))
+    found = []
+
+    async def enqueue(url):
+        found.append(url)
+
+    discovery = SiteDiscovery(state, DiscoveryOptions(requests_per_minute=0, **options), HtmlFetcher(scheduler), enqueue)
+    return discovery, found
+
+
+def test_pages_are_classified_without_the_model():
+    assert classify_page(SITE["/recetas/flan"], "https://blog.example/recetas/flan") == "json-ld"
+    assert classify_page(SITE["/recetas/natillas"], "https://blog.example/recetas/natillas") == "sections"
+    assert classify_page(SITE["/recetas/arroz-con-leche"], "https://blog.example/recetas/arroz-con-leche") == "microdata"
+    assert classify_page(SITE["/categoria/postres"], "https://blog.example/categoria/postres") is None
+
+
+def test_category_walk_is_bounded_filtered_and_resumable(tmp_path):
+    state = DiscoveryState.start("https://blog.example/categoria/postres")
+    fetched = []
+    discovery, found = _discovery(state, fetched, max_depth=1, max_pages=2, exclude=["/sobre"])
+    asyncio.run(discovery.run())
+    state.save(tmp_path / "state.json")
+
+    resumed = DiscoveryState.load(tmp_path / "state.json")
+    discovery, found_later = _discovery(resumed, fetched, max_depth=1, max_pages=50, exclude=["/sobre"])
+    asyncio.run(discovery.run())
+
+    # Depth 1 keeps the flan-de-queso and arroz-con-leche links (two hops away) out.
+    assert fetched == ["/categoria/postres", "/recetas/flan", "/recetas/natillas", "/categoria/postres/page/2"]
+    assert found + found_later == ["https://blog.example/recetas/flan", "https://blog.example/recetas/natillas"]
+    assert resumed.recipes == {url: "queued" for url in found + found_later}
+    assert resumed.counts["filtered"] == 1 and not resumed.frontier
+
+
+def test_sitemap_index_is_followed_to_its_pages():
+    state = DiscoveryState.start("https://blog.example/sitemap_index.xml")
+    fetched = []
+    discovery, found = _discovery(state, fetched, max_depth=2, include=["/recetas/"])
+    asyncio.run(discovery.run())
+
+    assert fetched == ["/sitemap_index.xml", "/post-sitemap.xml", "/recetas/flan"]
+    assert found == ["https://blog.example/recetas/flan"]
+    assert state.counts["sitemap_entries"] == 3
+
+
+def test_listing_pages_are_not_recipes_and_are_read_to_the_end():
+    assert classify_page(SITE["/categoria/guisos"], "https://blog.example/categoria/guisos") is None
+
+    state = DiscoveryState.start("https://blog.example/categoria/guisos")
+    discovery, found = _discovery(state, [], max_depth=1, max_pages=1)
+    asyncio.run(discovery.run())
+
+    assert not found and len(state.frontier) == 20
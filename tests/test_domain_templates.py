@@ -0,0 +1,102 @@
+import asyncio
+
+from app import domain_templates, recipe_service
+from app.coordination import InMemoryCoordination
+from app.database import get_canonical_recipe_by_url, get_domain_template
+from app.domain_templates import apply_template, learn_template
+from app.models.recipe import Recipe
+from app.page_archive import PageArchive
+from app.recipe_service import RecipeService
+from app.utils.markdown_utils import html_to_markdown
+from tests.test_negative_cache import _session_generator
+
+TORTILLA = Recipe(
+    name="Tortilla de patatas",
+    ingredients=["4 huevos", "500 g de patatas", "1 cebolla"],
+    instructions=["Pelar y freír las patatas.", "Batir los huevos y mezclar."],
+    image_url="https://blog.example/img/tortilla.jpg",
+)
+GAZPACHO = Recipe(
+    name="Gazpacho andaluz",
+    ingredients=["1 kg de tomates", "1 pepino", "1 diente de ajo", "50 ml de aceite"],
+    instructions=["Triturar las verduras.", "Colar y enfriar."],
+    image_url="https://blog.example/img/gazpacho.jpg",
+)
+
+
+def _page(recipe, layout="card"):
+    if layout != "card":
+        ingredients = "".join(f'<p class="ingr">{line}</p>' for line in recipe.ingredients)
+        steps = "".join(f'<p class="paso">{line}</p>' for line in recipe.instructions)
+        return f'<html><body><h2 class="titulo">{recipe.name}</h2><section id="receta">{ingredients}{steps}</section></body></html>'
+    ingredients = "".join(f'<li class="ingredient">{line}</li>' for line in recipe.ingredients)
+    steps = "".join(f'<li class="step"><span class="n">{i}</span> {line}</li>' for i, line in enumerate(recipe.instructions, 1))
+    return (
+        f'<html><head><meta property="og:image" content="{recipe.image_url}"></head><body>'
+        '<nav><ul><li>Inicio</li><li>Recetas</li></ul></nav>'
+        f'<article><h1 class="entry-title">{recipe.name}</h1><p>Una receta de la abuela.</p>'
+        f'<div class="recipe-card"><ul class="ingredients">{ingredients}</ul><ol class="steps">{steps}</ol></div></article>'
+        '<aside><ul><li>Más recetas</li><li>Contacto</li></ul></aside></body></html>'
+    )
+
+
+def test_template_learned_on_one_page_extracts_another():
+    template = learn_template(_page(TORTILLA), "https://blog.example/tortilla", TORTILLA)
+    assert template is not None
+
+    recipe = apply_template(template, _page(GAZPACHO), "https://blog.example/gazpacho")
+    assert recipe == {"name": GAZPACHO.name, "ingredients": GAZPACHO.ingredients, "instructions": GAZPACHO.instructions, "image_url": str(GAZPACHO.image_url)}
+    assert learn_template(_page(TORTILLA), "https://blog.example/tortilla", GAZPACHO) is None  # does not reproduce the answer
+
+
+class _Fetcher:
+    def __init__(self, pages):
+        self.pages = pages
+
+    async def fetch_html(self, url):
+        return self.pages[url]
+
+
+class _Converter:
+    async def to_markdown(self, html_content, url):
+        return html_to_markdown(html_content, url)
+
+
+class _Agent:
+    current_model_identifier = "test-model"
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.calls = []
+
+    async def extract_recipe_from_markdown(self, markdown_content):
+        self.calls.append(markdown_content)
+        return self.answers.pop(0)
+
+
+def test_repeat_domains_skip_the_model_and_relearn_after_a_miss(tmp_path, monkeypatch):
+    coordination = InMemoryCoordination()
+    monkeypatch.setattr(recipe_service, "get_coordination", lambda: coordination)
+    monkeypatch.setattr(recipe_service, "page_archive", PageArchive(tmp_path))
+    monkeypatch.setattr(recipe_service, "template_stats", domain_templates.TemplateStats())
+    monkeypatch.setattr(recipe_service, "IMAGE_PIPELINE_ENABLED", False)
+    db, sessions = _session_generator()
+    pages = {
+        "https://blog.example/tortilla": _page(TORTILLA),
+        "https://www.blog.example/gazpacho": _page(GAZPACHO),
+        "https://blog.example/nuevo/tortilla": _page(TORTILLA, layout="redesign"),
+    }
+    agent = _Agent([TORTILLA, TORTILLA])
+    service = RecipeService.__new__(RecipeService)
+    service.html_fetcher, service.markdown_converter, service.recipe_agent = _Fetcher(pages), _Converter(), agent
+
+    for url in pages:
+        assert asyncio.run(service.process_url_and_store_recipe(url, user_id=1, db_session_generator=sessions)) is not None
+
+    assert len(agent.calls) == 2  # the gazpacho page never reached the model
+    gazpacho = get_canonical_recipe_by_url(db, "https://www.blog.example/gazpacho")
+    assert (gazpacho.name, gazpacho.extraction_model) == (GAZPACHO.name, "template")
+    assert get_domain_template(db, "blog.example").learned_from == "https://blog.example/nuevo/tortilla"
+    assert recipe_service.template_stats.snapshot()["domains"]["blog.example"] == {
+        "attempts": 2, "hits": 1, "misses": 1, "learned": 1, "relearned": 1, "learn_failures": 0, "hit_rate": 0.5,
+    }
@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.fetch_scheduler import FetchDisallowed, FetchScheduler, parse_retry_after
+
+
+def _scheduler(handler, **kwargs):
+    options = dict(min_delay=0, backoff_base=0.01, max_backoff=0.05, transport=httpx.MockTransport(handler))
+    options.update(kwargs)
+    return FetchScheduler(**options)
+
+
+def test_retry_after_accepts_seconds_and_http_dates():
+    assert parse_retry_after("7") == 7
+    assert parse_retry_after("Thu, 01 Jan 2026 00:00:30 GMT", now=1767225600) == 30
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+def test_robots_txt_is_cached_and_respected_with_our_user_agent():
+    seen = []
+
+    def handler(request):
+        seen.append((request.url.path, request.headers["user-agent"]))
+        if request.url.path == "/robots.txt":
+            return httpx.Response(200, text="User-agent: *\nDisallow: /private/\n")
+        return httpx.Response(200, text="<html></html>")
+
+    scheduler = _scheduler(handler, user_agent="TestBot/1.0")
+
+    async def scenario():
+        await scheduler.fetch("https://recipes.example/receta/1")
+        await scheduler.fetch("https://recipes.example/receta/2")
+        with pytest.raises(FetchDisallowed):
+            await scheduler.fetch("https://recipes.example/private/3")
+
+    asyncio.run(scenario())
+
+    assert [path for path, _ in seen] == ["/robots.txt", "/receta/1", "/receta/2"]
+    assert {agent for _, agent in seen} == {"TestBot/1.0"}
+    assert scheduler.snapshot()["disallowed"] == 1
+
+
+
+def test_cancelling_one_waiter_does_not_cancel_the_shared_robots_fetch():
+    robots_requests = []
+
+    async def handler(request):
+        if request.url.path == "/robots.txt":
+            robots_requests.append(request)
+            await asyncio.sleep(0.05)
+            return httpx.Response(200, text="User-agent: *\nDisallow: /private/\n")
+        return httpx.Response(200, text="<html></html>")
+
+    scheduler = _scheduler(handler)
+
+    async def scenario():
+        first = asyncio.ensure_future(scheduler.robots_for("https://recipes.example/receta/1"))
+        second = asyncio.ensure_future(scheduler.robots_for("https://recipes.example/receta/2"))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        parser = await second
+        assert first.cancelled() and not parser.can_fetch("*", "https://recipes.example/private/3")
+        await scheduler.robots_for("https://recipes.example/receta/3")
+
+    asyncio.run(scenario())
+
+    assert len(robots_requests) == 1
+
+def test_throttled_responses_are_retried_after_backoff():
+    statuses = iter([429, 503, 200])
+
+    def handler(request):
+        if request.url.path == "/robots.txt":
+            return httpx.Response(404)
+        return httpx.Response(next(statuses), headers={"Retry-After": "0"}, text="ok")
+
+    scheduler = _scheduler(handler)
+    response = asyncio.run(scheduler.fetch("https://busy.example/receta"))
+
+    assert response.status_code == 200
+    assert scheduler.snapshot()["retries"] == 2
+    assert scheduler.snapshot()["throttled_by_status"] == {"429": 1, "503": 1}
+
+
+def test_requests_to_one_domain_are_spaced_but_other_domains_are_not():
+    starts = {}
+
+    def handler(request):
+        starts.setdefault(request.url.host, []).append(time.monotonic())
+        return httpx.Response(200, text="ok")
+
+    scheduler = _scheduler(handler, min_delay=0.1, respect_robots=False)
+
+    async def scenario():
+        urls = [f"https://a.example/{i}" for i in range(3)] + [f"https://b{i}.example/" for i in range(3)]
+        await asyncio.gather(*(scheduler.fetch(url) for url in urls))
+
+    asyncio.run(scenario())
+
+    a_starts = starts["a.example"]
+    assert all(later - earlier >= 0.09 for earlier, later in zip(a_starts, a_starts[1:]))
+    other_starts = [starts[f"b{i}.example"][0] for i in range(3)]
+    assert max(other_starts) - min(other_starts) < 0.09
@@ -0,0 +1,74 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.fetch_scheduler import FetchScheduler
+from app.html_processor import HtmlFetcher, NotHtmlContent
+from app.utils.html_stream import HtmlStreamCleaner
+
+PAGE = (
+    '<html><head><style>body { color: red }</style><script>var tracking = "</p>";</script>'
+    '<script type="application/ld+json">{"@type": "Recipe", "name": "Tortilla"}</script></head>'
+    '<body><!-- ad slot --><img src="data:image/png;base64,iVBORw0KGgoAAAANSUhEUg" alt="x">'
+    '<p style="background: url(data:image/gif;base64,R0lGODlh)">Tortilla</p></body></html>'
+)
+CLEANED = (
+    '<html><head><script type="application/ld+json">{"@type": "Recipe", "name": "Tortilla"}</script></head>'
+    '<body><img src="data:," alt="x"><p style="background: url(data:,)">Tortilla</p></body></html>'
+)
+
+
+def test_cleaner_strips_regions_split_across_chunks():
+    for size in (1, 7, len(PAGE)):
+        cleaner = HtmlStreamCleaner()
+        for start in range(0, len(PAGE), size):
+            cleaner.feed(PAGE[start:start + size])
+        assert cleaner.close() == CLEANED
+        assert cleaner.ld_recipe_seen and not cleaner.done
+
+
+def test_cleaner_stops_only_when_the_section_enclosing_the_recipe_closes():
+    page = (
+        '<html><body><main><article class="recipe-card"><a href="/flan">Flan</a></article>'
+        '<article class="post"><div class="wprm-recipe-container"><li>4 huevos</li></div>'
+        '<aside><article class="related">Gazpacho</article></aside></article>'
+        '<section>comments</section></main></body></html>'
+    )
+    for size in (1, 7, len(page)):
+        cleaner = HtmlStreamCleaner()
+        for start in range(0, len(page), size):
+            cleaner.feed(page[start:start + size])
+        assert cleaner.done
+        assert cleaner.close() == page[:page.index("<section>")] + "</body></html>"
+
+
+def _fetcher(handler, **kwargs):
+    scheduler = FetchScheduler(min_delay=0, respect_robots=False, transport=httpx.MockTransport(handler))
+    return HtmlFetcher(scheduler, **kwargs)
+
+
+def test_download_stops_once_the_recipe_article_has_closed():
+    sent = []
+
+    async def body():
+        for chunk in ('<html><body><article><div class="wprm-recipe-container">', "<li>4 huevos</li></div>", "</article>", "<section>comments</section>" * 1000, "</body></html>"):
+            sent.append(chunk)
+            yield chunk.encode()
+
+    fetcher = _fetcher(lambda request: httpx.Response(200, headers={"content-type": "text/html; charset=utf-8"}, content=body()))
+    html = asyncio.run(fetcher.fetch_html("https://example.com/receta"))
+
+    assert html.endswith("</article></body></html>") and "comments" not in html
+    assert "</body></html>" not in sent  # the tail of the page was never downloaded
+    assert fetcher.scheduler.stats.stopped_early == 1
+
+
+def test_oversized_pages_are_truncated_and_non_html_rejected():
+    fetcher = _fetcher(lambda request: httpx.Response(200, headers={"content-type": "text/html"}, content=b"<p>" + b"a" * 5000), max_bytes=1000)
+    assert len(asyncio.run(fetcher.fetch_html("https://example.com/large"))) == 1000
+    assert fetcher.scheduler.stats.truncated == 1
+
+    fetcher = _fetcher(lambda request: httpx.Response(200, headers={"content-type": "application/octet-stream"}, content=b"%PDF-1.7 ..."))
+    with pytest.raises(NotHtmlContent):
+        asyncio.run(fetcher.fetch_html("https://example.com/recipe.pdf"))
@@ -0,0 +1,33 @@
+import io
+
+from PIL import Image
+
+from app.utils import image_utils
+
+
+def _png(width, height):
+    buffer = io.BytesIO()
+    Image.new("RGBA", (width, height), (200, 80, 20, 255)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_variants_are_content_addressed_and_not_upscaled(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_utils, "IMAGE_STORAGE_DIR", tmp_path)
+
+    variants = image_utils.build_image_variants(_png(800, 600), widths=[160, 640, 1280])
+
+    assert list(variants) == ["160", "640"]
+    for formats in variants.values():
+        for url in formats.values():
+            key = url.removeprefix(f"{image_utils.IMAGE_URL_PREFIX}/")
+            assert image_utils.image_path_for_key(key).is_file()
+    with Image.open(image_utils.image_path_for_key(variants["160"]["webp"].split("/images/")[1])) as thumb:
+        assert thumb.size == (160, 120)
+    assert image_utils.build_image_variants(_png(800, 600), widths=[160, 640, 1280]) == variants
+
+
+def test_small_source_gets_one_variant_and_foreign_keys_are_rejected(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_utils, "IMAGE_STORAGE_DIR", tmp_path)
+
+    assert list(image_utils.build_image_variants(_png(100, 50), widths=[160, 320])) == ["100"]
+    assert image_utils.image_path_for_key("../recipes.db") is None
@@ -0,0 +1,123 @@
+import hashlib
+import io
+import zipfile
+
+import orjson
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import library_transfer
+from app.database import create_db_and_tables, get_recipe_rows_for_user, link_recipes_for_user, add_canonical_recipes
+from app.models.recipe import Recipe
+from app.utils import image_utils
+
+
+def _use_memory_database(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    create_db_and_tables(engine)
+    session_factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(library_transfer, "SessionLocal", session_factory)
+    return session_factory()
+
+
+def _add(db, user_id, name, url, image_variants=None):
+    canonical = add_canonical_recipes(db, [(Recipe(name=name, ingredients=["1 huevo"], instructions=["Batir."]), url)])[0]
+    if image_variants:
+        canonical.image_variants = image_variants
+        db.commit()
+    link_recipes_for_user(db, [canonical], user_id)
+
+
+def test_ndjson_export_round_trips_into_another_library(monkeypatch):
+    db = _use_memory_database(monkeypatch)
+    monkeypatch.setattr(library_transfer, "CHUNK_BYTES", 100)
+    for i in range(5):
+        _add(db, 1, f"Receta {i}", f"https://example.com/{i}")
+    _add(db, 2, "Receta 0", "https://example.com/0")
+
+    chunks = list(library_transfer.export_ndjson(1))
+    assert len(chunks) > 1
+    lines = b"".join(chunks).splitlines()
+    assert [orjson.loads(line)["name"] for line in lines] == [f"Receta {i}" for i in range(5)]
+
+    upload = io.BytesIO(b"".join(chunks) + b"not json\n" + orjson.dumps({"name": "Sin URL"}) + b"\n")
+    summary = library_transfer.import_library(upload, user_id=2)
+
+    assert (summary["imported"], summary["already_in_library"], summary["invalid"]) == (4, 1, 2)
+    assert [error["line"] for error in summary["errors"]] == [6, 7]
+    assert sorted(row["name"] for row in get_recipe_rows_for_user(db, 2)) == [f"Receta {i}" for i in range(5)]
+
+
+def test_zip_export_carries_images_and_import_verifies_them(tmp_path, monkeypatch):
+    db = _use_memory_database(monkeypatch)
+    monkeypatch.setattr(image_utils, "IMAGE_STORAGE_DIR", tmp_path / "source")
+    data = b"fake webp bytes"
+    key = f"{hashlib.sha256(data).hexdigest()[:2]}/{hashlib.sha256(data).hexdigest()}.webp"
+    image_path = image_utils.image_path_for_key(key)
+    image_path.parent.mkdir(parents=True)
+    image_path.write_bytes(data)
+    _add(db, 1, "Tortilla", "https://example.com/tortilla", image_variants={"160": {"webp": f"/images/{key}"}})
+
+    archive_bytes = b"".join(library_transfer.export_zip(1))
+    with zipfile.ZipFile(io.BytesIO(archive_bytes)) as archive:
+        assert archive.read(library_transfer.ZIP_IMAGES_DIR + key) == data
+        # A planted file whose content does not match its hash name must not be restored.
+        forged_key = f"ab/{'ab' * 32}.webp"
+        forged = io.BytesIO()
+        with zipfile.ZipFile(forged, "w") as out:
+            for info in archive.infolist():
+                out.writestr(info, archive.read(info))
+            out.writestr(library_transfer.ZIP_IMAGES_DIR + forged_key, b"something else")
+
+    monkeypatch.setattr(image_utils, "IMAGE_STORAGE_DIR", tmp_path / "target")
+    db = _use_memory_database(monkeypatch)
+    summary = library_transfer.import_library(forged, user_id=3)
+
+    assert (summary["imported"], summary["images_restored"]) == (1, 1)
+    assert image_utils.image_path_for_key(key).read_bytes() == data
+    assert not image_utils.image_path_for_key(forged_key).exists()
+    assert get_recipe_rows_for_user(db, 3)[0]["image_variants"] == {"160": {"webp": f"/images/{key}"}}
+
+
+def test_imports_stay_private_and_do_not_seed_the_shared_store(tmp_path, monkeypatch):
+    import asyncio
+    from app import recipe_service
+    from app.coordination import InMemoryCoordination
+    from app.database import get_canonical_recipe_by_url
+    from app.page_archive import PageArchive
+    from app.recipe_service import RecipeService
+    from tests.test_near_duplicates import _Agent, _Converter, _Fetcher, ORIGINAL
+
+    db = _use_memory_database(monkeypatch)
+    url = "https://cocina.example/fabada"
+    planted = {"source_url": url, "name": "Fabada", "ingredients": ["Compre en tienda-falsa.example"], "instructions": ["Visite el enlace."], "image_url": "https://tienda-falsa.example/a.jpg"}
+    assert library_transfer.import_library(io.BytesIO(orjson.dumps(planted) + b"\n"), user_id=1)["imported"] == 1
+    assert get_canonical_recipe_by_url(db, url) is None
+    assert get_recipe_rows_for_user(db, 1)[0]["ingredients"] == planted["ingredients"]
+
+    coordination = InMemoryCoordination()
+    monkeypatch.setattr(recipe_service, "get_coordination", lambda: coordination)
+    monkeypatch.setattr(recipe_service, "page_archive", PageArchive(tmp_path))
+    monkeypatch.setattr(recipe_service, "DOMAIN_TEMPLATES_ENABLED", False)
+    service = RecipeService.__new__(RecipeService)
+    service.html_fetcher, service.markdown_converter, service.recipe_agent = _Fetcher({url: ORIGINAL}), _Converter(), _Agent()
+
+    recipe = asyncio.run(service.process_url_and_store_recipe(url, user_id=2, db_session_generator=lambda: iter([db])))
+
+    assert service.recipe_agent.calls == 1 and recipe.name == "Fabada asturiana" and recipe.image_url is None
+    assert get_recipe_rows_for_user(db, 1)[0]["ingredients"] == planted["ingredients"]
+
+
+def test_damaged_zip_uploads_are_rejected_as_invalid(monkeypatch):
+    import pytest
+
+    db = _use_memory_database(monkeypatch)
+    for i in range(50):
+        _add(db, 1, f"Receta {i}", f"https://example.com/{i}")
+    archive_bytes = bytearray(b"".join(library_transfer.export_zip(1)))
+    start = archive_bytes.index(library_transfer.ZIP_RECIPES_NAME.encode()) + len(library_transfer.ZIP_RECIPES_NAME) + 40
+    archive_bytes[start:start + 40] = b"\x00" * 40  # corrupt the compressed recipes, keep the directory intact
+
+    with pytest.raises(ValueError, match="damaged"):
+        library_transfer.import_library(io.BytesIO(bytes(archive_bytes)), user_id=2)
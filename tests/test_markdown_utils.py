@@ -0,0 +1,43 @@
+from app.utils.markdown_utils import find_section, split_markdown
+
+
+def _page(sections=30):
+    parts = []
+    for i in range(sections):
+        parts.append(f"## Section {i}\n\n" + " ".join(f"word{i}-{j}" for j in range(40)))
+    return "\n\n".join(parts)
+
+
+def test_short_markdown_is_a_single_chunk():
+    assert split_markdown("# Title\n\nBody", max_chars=100) == ["# Title\n\nBody"]
+
+
+def test_chunks_respect_size_limit_and_cover_everything():
+    page = _page()
+    chunks = split_markdown(page, max_chars=1200, overlap_chars=200)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 1200 for chunk in chunks)
+    for i in range(30):
+        assert any(f"## Section {i}" in chunk for chunk in chunks)
+
+
+def test_chunks_overlap_and_split_on_block_boundaries():
+    chunks = split_markdown(_page(), max_chars=1200, overlap_chars=600)
+
+    for previous, current in zip(chunks, chunks[1:]):
+        first_block = current.split("\n\n")[0]
+        assert first_block in previous.split("\n\n")
+
+
+def test_oversized_paragraph_is_hard_split():
+    chunks = split_markdown("x" * 2500, max_chars=1000)
+    assert [len(c) for c in chunks] == [1000, 1000, 500]
+
+
+def test_find_section_stops_at_next_heading_of_same_level():
+    markdown = "# Tortilla\n## Ingredientes\n- 4 huevos\n### Para la salsa\n- tomate\n## Preparación\n1. Batir."
+
+    assert find_section(markdown, ["ingredient"], 1000) == "## Ingredientes\n- 4 huevos\n### Para la salsa\n- tomate"
+    assert find_section(markdown, ["preparaci"], 1000).startswith("## Preparación")
+    assert find_section(markdown, ["notas"], 1000) is None
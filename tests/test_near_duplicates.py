@@ -0,0 +1,98 @@
+import asyncio
+
+from app import near_duplicates, recipe_service
+from app.coordination import InMemoryCoordination
+from app.database import get_canonical_recipe_by_url
+from app.models.recipe import Recipe
+from app.near_duplicates import content_signature, estimated_similarity, signature_bands
+from app.page_archive import PageArchive
+from app.recipe_service import RecipeService
+from tests.test_negative_cache import _session_generator
+
+FABADA = Recipe(
+    name="Fabada asturiana",
+    ingredients=["500 g de fabes", "2 chorizos", "2 morcillas", "200 g de panceta", "1 pizca de azafrán"],
+    instructions=["Poner las fabes en remojo la noche anterior.", "Cocer a fuego lento con el compango durante tres horas."],
+)
+BODY = """# Fabada asturiana
+
+La fabada es el plato más conocido de Asturias, un guiso contundente de alubias blancas con
+chorizo, morcilla y panceta que se cocina despacio durante toda la mañana del domingo.
+
+## Ingredientes
+
+- 500 g de fabes de la granja
+- 2 chorizos asturianos ahumados
+- 2 morcillas asturianas
+- 200 g de panceta curada
+- 1 lacón pequeño desalado
+- 1 pizca de azafrán en hebras
+- Agua fría y sal
+
+## Preparación
+
+1. Poner las fabes en remojo la noche anterior con agua fría, y el lacón en otro recipiente.
+2. Colocar las fabes en una cazuela amplia con el compango por encima y cubrir con agua fría.
+3. Cocer a fuego lento con el compango durante tres horas, asustando las fabes con agua fría
+   cada vez que rompa a hervir y moviendo la cazuela en lugar de remover con cuchara.
+4. Añadir el azafrán a media cocción, probar de sal al final y dejar reposar antes de servir.
+"""
+ORIGINAL = "[Inicio](https://cocina.example/) [Recetas](https://cocina.example/recetas)\n\n" + BODY + "\nSuscríbete a la newsletter de Cocina Casera."
+COPY = "Aceptar cookies | [Portada](https://otro.example/)\n\n" + BODY + "\nPublicado en la sección de cocina tradicional. © Otro Sitio"
+OTHER = BODY.replace("Fabada asturiana", "Cocido madrileño").replace("fabes", "garbanzos").replace("Asturias", "Madrid").replace("asturianos", "de León").replace("azafrán", "comino")
+
+
+def test_copies_with_other_chrome_are_similar_and_share_a_band():
+    original, copy, other = content_signature(ORIGINAL), content_signature(COPY), content_signature(OTHER)
+
+    assert estimated_similarity(original, copy) >= near_duplicates.NEAR_DUPLICATE_MIN_SIMILARITY
+    assert estimated_similarity(original, other) < near_duplicates.NEAR_DUPLICATE_MIN_SIMILARITY
+    assert set(signature_bands(original)) & set(signature_bands(copy))
+    assert content_signature("# Fabada\n\nUna receta corta.") is None
+
+
+class _Fetcher:
+    def __init__(self, pages):
+        self.pages = pages
+
+    async def fetch_html(self, url):
+        return self.pages[url]
+
+
+class _Converter:
+    async def to_markdown(self, html_content, url):
+        return html_content
+
+
+class _Agent:
+    current_model_identifier = "test-model"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def extract_recipe_from_markdown(self, markdown_content):
+        self.calls += 1
+        return FABADA.model_copy(update={"name": markdown_content.split("# ", 1)[1].splitlines()[0]})
+
+
+def test_syndicated_copy_reuses_the_stored_extraction(tmp_path, monkeypatch):
+    coordination = InMemoryCoordination()
+    monkeypatch.setattr(recipe_service, "get_coordination", lambda: coordination)
+    monkeypatch.setattr(recipe_service, "page_archive", PageArchive(tmp_path))
+    monkeypatch.setattr(recipe_service, "near_duplicate_stats", near_duplicates.NearDuplicateStats())
+    monkeypatch.setattr(near_duplicates, "near_duplicate_stats", recipe_service.near_duplicate_stats)
+    monkeypatch.setattr(recipe_service, "DOMAIN_TEMPLATES_ENABLED", False)
+    db, sessions = _session_generator()
+    pages = {"https://cocina.example/fabada": ORIGINAL, "https://otro.example/2024/fabada": COPY, "https://cocina.example/cocido": OTHER}
+    service = RecipeService.__new__(RecipeService)
+    service.html_fetcher, service.markdown_converter, service.recipe_agent = _Fetcher(pages), _Converter(), _Agent()
+
+    recipes = [asyncio.run(service.process_url_and_store_recipe(url, user_id=1, db_session_generator=sessions)) for url in pages]
+
+    assert [recipe.name for recipe in recipes] == ["Fabada asturiana", "Fabada asturiana", "Cocido madrileño"]
+    assert service.recipe_agent.calls == 2
+    copy = get_canonical_recipe_by_url(db, "https://otro.example/2024/fabada")
+    assert copy.extraction_model == "near-duplicate" and copy.ingredients == FABADA.ingredients
+    assert copy.content_signature and len(copy.signature_bands) == near_duplicates.BAND_COUNT
+    snapshot = recipe_service.near_duplicate_stats.snapshot()
+    assert (snapshot["fingerprinted"], snapshot["extractions_avoided"]) == (3, 1)
@@ -0,0 +1,147 @@
+import asyncio
+
+import httpx
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import recipe_service
+from app.coordination import InMemoryCoordination
+from app.database import Base, get_active_url_failure
+from app.negative_cache import CachedUrlFailure, canonical_url, classify_empty_extraction, classify_exception
+from app.page_archive import PageArchive
+from app.recipe_service import RecipeService
+
+
+@pytest.fixture(autouse=True)
+def _memory_coordination(monkeypatch):
+    coordination = InMemoryCoordination()
+    monkeypatch.setattr(recipe_service, "get_coordination", lambda: coordination)
+
+
+class _Fetcher:
+    def __init__(self, result):
+        self.result = result
+        self.calls = 0
+
+    async def fetch_html(self, url):
+        self.calls += 1
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+class _Converter:
+    async def to_markdown(self, html_content, url):
+        return "# Mis vacaciones\n\nFotos del viaje a la playa."
+
+
+class _Agent:
+    current_model_identifier = "test-model"
+
+    async def extract_recipe_from_markdown(self, markdown_content):
+        return None
+
+    async def stream_recipe_from_markdown(self, markdown_content):
+        return
+        yield
+
+
+def _service(fetcher):
+    service = RecipeService.__new__(RecipeService)
+    service.html_fetcher = fetcher
+    service.markdown_converter = _Converter()
+    service.recipe_agent = _Agent()
+    return service
+
+
+def _session_generator():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    return session, lambda: iter([session])
+
+
+def _not_found():
+    request = httpx.Request("GET", "https://example.com/gone")
+    return httpx.HTTPStatusError("404", request=request, response=httpx.Response(404, request=request))
+
+
+def test_canonical_url_drops_fragment_tracking_and_case():
+    assert canonical_url("HTTPS://Example.com:443/receta?id=3&utm_source=x#paso-2") == "https://example.com/receta?id=3"
+    assert canonical_url("http://example.com") == "http://example.com/"
+
+
+def test_failures_are_classified():
+    assert classify_exception(_not_found()) == "not_found"
+    assert classify_exception(httpx.ReadTimeout("slow")) == "timeout"
+    assert classify_exception(RuntimeError("bug")) is None
+    assert classify_empty_extraction("# Vacaciones\n\nFotos.") == "not_a_recipe"
+    assert classify_empty_extraction("# Tortilla\n\n## Ingredientes\n\n- 4 huevos") == "extraction_failed"
+
+
+def test_failed_url_fails_fast_until_forced():
+    db, sessions = _session_generator()
+    fetcher = _Fetcher(_not_found())
+    service = _service(fetcher)
+
+    assert asyncio.run(service.process_url_and_store_recipe("https://example.com/gone", user_id=1, db_session_generator=sessions)) is None
+    with pytest.raises(CachedUrlFailure) as exc_info:
+        asyncio.run(service.process_url_and_store_recipe("https://example.com/gone#top", user_id=2, db_session_generator=sessions))
+    assert exc_info.value.failure_class == "not_found"
+    assert exc_info.value.policy.status_code == 422
+    assert fetcher.calls == 1
+
+    asyncio.run(service.process_url_and_store_recipe("https://example.com/gone", user_id=1, db_session_generator=sessions, force=True))
+    assert fetcher.calls == 2
+    assert get_active_url_failure(db, "https://example.com/gone").failures == 2
+
+
+def test_pages_without_recipe_sections_are_cached_as_not_a_recipe(tmp_path, monkeypatch):
+    monkeypatch.setattr(recipe_service, "page_archive", PageArchive(tmp_path))
+    db, sessions = _session_generator()
+    service = _service(_Fetcher("<html>vacaciones</html>"))
+
+    events = asyncio.run(_collect(service.stream_url_and_store_recipe("https://blog.example/vacaciones", user_id=1, db_session_generator=sessions)))
+    cached = asyncio.run(_collect(service.stream_url_and_store_recipe("https://blog.example/vacaciones", user_id=1, db_session_generator=sessions)))
+
+    assert events[-1][1]["failure_class"] == "not_a_recipe"
+    assert cached == [("error", {"detail": cached[0][1]["detail"], "failure_class": "not_a_recipe", "retry_after": cached[0][1]["retry_after"]})]
+    assert cached[0][1]["retry_after"] > 6 * 24 * 3600
+
+
+async def _collect(stream):
+    return [event async for event in stream]
+
+
+def test_robots_disallowed_pages_fail_the_same_way_in_every_path(monkeypatch):
+    from fastapi import HTTPException
+    from app import backend
+    from app.fetch_scheduler import FetchDisallowed
+
+    db, sessions = _session_generator()
+    url = "https://example.com/privado"
+    service = _service(_Fetcher(FetchDisallowed(f"robots.txt disallows {url}")))
+    with pytest.raises(FetchDisallowed):
+        asyncio.run(service.process_url_and_store_recipe(url, user_id=1, db_session_generator=sessions))
+    assert get_active_url_failure(db, url).failure_class == "robots_disallowed"
+
+    service = _service(_Fetcher(FetchDisallowed(f"robots.txt disallows {url}")))
+    with pytest.raises(FetchDisallowed):
+        asyncio.run(service.process_url_and_store_recipes(f"{url}/todas", user_id=1, db_session_generator=sessions))
+    events = asyncio.run(_collect(service.stream_url_and_store_recipe(f"{url}/stream", user_id=1, db_session_generator=sessions)))
+    assert events[-1] == ("error", {"detail": "The site's robots.txt does not allow fetching this page.", "failure_class": "robots_disallowed"})
+
+    class _Request:
+        async def receive(self):
+            await asyncio.Event().wait()  # the client stays connected
+
+    class _User:
+        id, email, tier = 1, "ana@example.com", "free"
+
+    monkeypatch.setattr(backend, "get_db", sessions)
+    request = backend.UrlRequest(url=f"{url}/endpoint")
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(backend.obtain_recipe_endpoint(request, _Request(), current_user=_User(), recipe_service=service))
+    assert exc_info.value.status_code == 422 and exc_info.value.headers["X-Failure-Class"] == "robots_disallowed"
@@ -0,0 +1,101 @@
+import asyncio
+import io
+import json
+import tarfile
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import offline_extract, recipe_service
+from app.database import Base, get_canonical_recipe_by_url, get_recipe_by_url
+from app.models.recipe import Recipe
+from app.offline_extract import OfflineExtractor, QuickConverter, page_url, pending_pages
+from app.page_archive import PageArchive
+from app.recipe_service import RecipeService
+from app.utils.batch import Checkpoint
+
+PAGES = {
+    "postres/flan.html": '<html><head><link rel="canonical" href="https://blog.example/flan"></head><body><h1>Flan</h1><h2>Ingredientes</h2><ul><li>4 huevos</li></ul></body></html>',
+    "postres/natillas.htm": "<html><body><h1>Natillas</h1><h2>Ingredientes</h2><ul><li>1 l de leche</li></ul></body></html>",
+    "sobre-mi.html": "<html><body><p>Hola, soy Ana.</p></body></html>",
+    "notas.txt": "no es una página",
+}
+
+
+class _Agent:
+    current_model_identifier = "test-model"
+    calls = 0
+
+    async def extract_recipe_from_markdown(self, markdown_content):
+        self.calls += 1
+        if "Ingredientes" not in markdown_content:
+            return None
+        name = markdown_content.splitlines()[0].lstrip("# ")
+        return Recipe(name=name, ingredients=[markdown_content.splitlines()[-1].lstrip("- ")], instructions=["Mezclar."])
+
+
+def _service():
+    service = RecipeService.__new__(RecipeService)
+    service.markdown_converter = QuickConverter()
+    service.recipe_agent = _Agent()
+    return service
+
+
+def _args(**overrides):
+    values = dict(workers=2, url_base=None, database=False, user_id=None, no_templates=True)
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
+def test_source_urls_come_from_the_page_or_the_base_url():
+    assert page_url(PAGES["postres/flan.html"], "postres/flan.html") == "https://blog.example/flan"
+    assert page_url("<meta content='https://blog.example/n' property='og:url'>", "x.html") == "https://blog.example/n"
+    assert page_url(PAGES["postres/natillas.htm"], "postres/natillas.htm", "https://blog.example/archivo") == "https://blog.example/archivo/postres/natillas.htm"
+    assert page_url(PAGES["sobre-mi.html"], "sobre-mi.html") is None
+
+
+def test_directory_is_extracted_to_ndjson_and_resumed(tmp_path, monkeypatch):
+    monkeypatch.setattr(offline_extract, "SessionLocal", lambda: SimpleNamespace(close=lambda: None, rollback=lambda: None))
+    source = tmp_path / "pages"
+    for name, content in PAGES.items():
+        (source / name).parent.mkdir(parents=True, exist_ok=True)
+        (source / name).write_text(content, encoding="utf-8")
+    output, checkpoint = tmp_path / "out.ndjson", Checkpoint(tmp_path / "checkpoint.jsonl")
+    service = _service()
+
+    totals = asyncio.run(OfflineExtractor(_args(), service).run(pending_pages(source, checkpoint), checkpoint, output))
+    again = asyncio.run(OfflineExtractor(_args(), service).run(pending_pages(source, Checkpoint(tmp_path / "checkpoint.jsonl")), checkpoint, output))
+
+    lines = {entry["id"]: entry for entry in map(json.loads, output.read_text(encoding="utf-8").splitlines())}
+    assert totals == {"extracted": 2, "no_recipe": 1} and not again
+    assert service.recipe_agent.calls == 3
+    assert lines["postres/flan.html"]["recipe"]["name"] == "Flan"
+    assert lines["postres/flan.html"]["source_url"] == "https://blog.example/flan"
+    assert lines["sobre-mi.html"]["status"] == "no_recipe"
+
+
+def test_tarball_is_stored_in_the_database(tmp_path, monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(offline_extract, "SessionLocal", session_factory)
+    monkeypatch.setattr(offline_extract, "page_archive", PageArchive(tmp_path / "archive"))
+    monkeypatch.setattr(recipe_service, "DOMAIN_TEMPLATES_ENABLED", False)
+    tarball = tmp_path / "pages.tar.gz"
+    with tarfile.open(tarball, "w:gz") as archive:
+        for name, content in PAGES.items():
+            data = content.encode("utf-8")
+            member = tarfile.TarInfo(name)
+            member.size = len(data)
+            archive.addfile(member, io.BytesIO(data))
+
+    args = _args(database=True, user_id=7, url_base="https://blog.example/", no_templates=False)
+    totals = asyncio.run(OfflineExtractor(args, _service()).run(pending_pages(tarball, None), None, None))
+    repeat = asyncio.run(OfflineExtractor(args, _service()).run(pending_pages(tarball, None, limit=1), None, None))
+
+    db = session_factory()
+    assert totals == {"extracted": 2, "no_recipe": 1} and repeat == {"exists": 1}
+    assert get_canonical_recipe_by_url(db, "https://blog.example/postres/natillas.htm").name == "Natillas"
+    assert get_recipe_by_url(db, "https://blog.example/flan", user_id=7).name == "Flan"
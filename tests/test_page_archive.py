@@ -0,0 +1,35 @@
+import os
+
+from app.page_archive import PageArchive
+
+
+def _files(directory):
+    return [p for p in directory.rglob("*") if p.is_file()]
+
+
+def test_documents_round_trip_and_are_stored_once(tmp_path):
+    archive = PageArchive(directory=tmp_path, max_document_bytes=1_000_000, max_total_bytes=10_000_000)
+    html = "<html><body>" + "<p>Tortilla de patatas</p>" * 500 + "</body></html>"
+
+    first = archive.put(html)
+    second = archive.put(html)
+
+    assert first == second
+    assert len(_files(tmp_path)) == 1
+    assert _files(tmp_path)[0].stat().st_size < len(html) // 10
+    assert archive.get(first) == html
+    assert archive.get("0" * 64) is None
+
+
+def test_size_caps_skip_large_documents_and_prune_least_recently_used(tmp_path):
+    archive = PageArchive(directory=tmp_path, max_document_bytes=5_000, max_total_bytes=2_500)
+    assert archive.put("x" * 6_000) is None
+
+    digests = []
+    for i in range(6):
+        digests.append(archive.put(os.urandom(1_200).hex()[:1_000] + str(i)))
+        os.utime(next(tmp_path.rglob(f"{digests[-1]}.*")), (i, i))
+
+    assert archive.total_bytes() <= 2_500
+    assert archive.get(digests[-1]) is not None
+    assert archive.get(digests[0]) is None
@@ -0,0 +1,126 @@
+import asyncio
+import json
+
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelResponse, ToolCallPart
+from pydantic_ai.models.function import DeltaToolCall, FunctionModel
+
+from app.models.recipe import PartialRecipe, Recipe
+from app.recipe_agent import ModelTier, RecipeExtractorAgent, merge_recipe_fragments
+from app.recipe_service import recipe_anchor
+from tests.test_recipe_quality import MARKDOWN, _recipe
+
+
+def _tier(identifier, recipe):
+    payload = recipe.model_dump(mode="json")
+
+    def respond(messages, info):
+        return ModelResponse(parts=[ToolCallPart(tool_name=info.output_tools[0].name, args=payload)])
+
+    async def stream(messages, info):
+        raw = json.dumps(payload)
+        for start in range(0, len(raw), 8):
+            yield {0: DeltaToolCall(name=info.output_tools[0].name if start == 0 else None, json_args=raw[start:start + 8])}
+
+    model = FunctionModel(respond, stream_function=stream)
+    return ModelTier(identifier=identifier, agent=Agent(model, output_type=Recipe), model=model)
+
+
+def _extractor(*tiers):
+    extractor = RecipeExtractorAgent.__new__(RecipeExtractorAgent)
+    extractor.output_model = Recipe
+    extractor.tiers = list(tiers)
+    extractor.agent = extractor.tiers[0].agent
+    return extractor
+
+
+def test_cascade_escalates_only_when_checks_fail():
+    extractor = _extractor(_tier("small", _recipe(instructions=[])), _tier("large", _recipe()))
+    assert asyncio.run(extractor.extract_recipe_from_markdown(MARKDOWN)).instructions
+
+    extractor = _extractor(_tier("small-ok", _recipe()), _tier("large-unused", _recipe(name="Other")))
+    assert asyncio.run(extractor.extract_recipe_from_markdown(MARKDOWN)).name == "Tortilla de patatas"
+
+
+def test_stream_yields_partials_before_final_recipe(monkeypatch):
+    monkeypatch.setattr("app.recipe_agent.STREAM_DEBOUNCE_SECONDS", 0)
+    extractor = _extractor(_tier("small", _recipe()))
+
+    async def collect():
+        return [item async for item in extractor.stream_recipe_from_markdown(MARKDOWN)]
+
+    events = asyncio.run(collect())
+    partials = [recipe for recipe, is_final in events if not is_final]
+    final, is_final = events[-1]
+
+    assert is_final and isinstance(final, Recipe)
+    assert any(p.name and not p.instructions for p in partials)
+
+
+def test_fragments_merge_in_order_without_overlap_duplicates():
+    fragments = [
+        PartialRecipe(name="Tortilla de patatas", ingredients=["4 huevos", "500 g de patatas"], image_url="/relative.jpg"),
+        PartialRecipe(name="Tortilla de patatas", ingredients=["500 g de Patatas.", "1 cebolla"], instructions=["Freír."]),
+        PartialRecipe(name="Comentarios", instructions=["Freír", "Batir"], image_url="https://example.com/t.jpg"),
+    ]
+
+    merged = merge_recipe_fragments(fragments)
+
+    assert merged["name"] == "Tortilla de patatas"
+    assert merged["ingredients"] == ["4 huevos", "500 g de patatas", "1 cebolla"]
+    assert merged["instructions"] == ["Freír.", "Batir"]
+    assert merged["image_url"] == "https://example.com/t.jpg"
+
+
+def test_long_markdown_is_extracted_from_chunks(monkeypatch):
+    monkeypatch.setattr("app.recipe_agent.MAX_PROMPT_CHARS", 80)
+    extractor = _extractor(_tier("small", _recipe()))
+
+    result = asyncio.run(extractor.extract_recipe_from_markdown(MARKDOWN))
+
+    assert result.name == "Tortilla de patatas"
+    assert result.ingredients == ["4 huevos", "500 g de patatas", "1 cebolla"]
+
+
+def test_extract_recipes_returns_every_recipe_on_the_page():
+    second = Recipe(name="Cebolla frita", ingredients=["1 cebolla"], instructions=["Freír las patatas y la cebolla."])
+    payload = {"recipes": [_recipe().model_dump(mode="json"), second.model_dump(mode="json")]}
+
+    def respond(messages, info):
+        return ModelResponse(parts=[ToolCallPart(tool_name=info.output_tools[0].name, args=payload)])
+
+    model = FunctionModel(respond)
+    extractor = _extractor(ModelTier(identifier="multi", agent=Agent(model, output_type=Recipe), model=model))
+
+    recipes = asyncio.run(extractor.extract_recipes_from_markdown(MARKDOWN))
+
+    assert [r.name for r in recipes] == ["Tortilla de patatas", "Cebolla frita"]
+
+
+def test_recipe_anchors_are_unique_slugs():
+    used = set()
+    anchors = [recipe_anchor(name, i, used) for i, name in enumerate(["Tortilla de Patatas", "Tortilla de patatas", "¡!"])]
+    assert anchors == ["tortilla-de-patatas", "tortilla-de-patatas-2", "recipe-3"]
+
+
+def test_failing_field_is_repaired_from_its_section():
+    prompts = []
+
+    def respond(messages, info):
+        prompt = messages[-1].parts[-1].content
+        prompts.append(prompt)
+        fields = set(info.output_tools[0].parameters_json_schema["properties"])
+        if fields == {"instructions"}:
+            args = {"instructions": ["Pelar y freír las patatas.", "Batir los huevos y mezclar."]}
+        else:
+            args = _recipe(instructions=[]).model_dump(mode="json")
+        return ModelResponse(parts=[ToolCallPart(tool_name=info.output_tools[0].name, args=args)])
+
+    model = FunctionModel(respond)
+    extractor = _extractor(ModelTier(identifier="small", agent=Agent(model, output_type=Recipe), model=model))
+
+    recipe = asyncio.run(extractor.extract_recipe_from_markdown(MARKDOWN))
+
+    assert recipe.instructions == ["Pelar y freír las patatas.", "Batir los huevos y mezclar."]
+    assert len(prompts) == 2
+    assert "## Preparación" in prompts[1] and "500 g de patatas" not in prompts[1]
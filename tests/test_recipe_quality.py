@@ -0,0 +1,37 @@
+from app.models.recipe import Recipe
+from app.recipe_quality import find_quality_issues
+
+MARKDOWN = """# Tortilla de patatas
+## Ingredientes
+- 4 huevos
+- 500 g de patatas
+- 1 cebolla
+## Preparación
+1. Pelar y freír las patatas.
+2. Batir los huevos y mezclar.
+"""
+
+
+def _recipe(**overrides):
+    data = dict(
+        name="Tortilla de patatas",
+        ingredients=["4 huevos", "500 g de patatas", "1 cebolla"],
+        instructions=["Pelar y freír las patatas.", "Batir los huevos y mezclar."],
+    )
+    data.update(overrides)
+    return Recipe(**data)
+
+
+def test_grounded_recipe_has_no_issues():
+    assert find_quality_issues(_recipe(), MARKDOWN) == []
+
+
+def test_missing_fields_and_generic_name_are_reported():
+    issues = find_quality_issues(_recipe(name="Recipe", instructions=[]), MARKDOWN)
+    assert any("name" in issue for issue in issues)
+    assert "no instructions" in issues
+
+
+def test_hallucinated_ingredients_are_reported():
+    recipe = _recipe(ingredients=["200 g chocolate negro", "mantequilla", "azúcar moreno"])
+    assert any("appear in the source" in issue for issue in find_quality_issues(recipe, MARKDOWN))
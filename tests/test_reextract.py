@@ -0,0 +1,98 @@
+import asyncio
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import reextract
+from app.database import Base, CanonicalRecipeDB, add_recipe_to_db, get_recipes_for_reextraction
+from app.models.recipe import Recipe
+from app.utils.batch import Checkpoint
+
+
+class _Agent:
+    current_model_identifier = "openai:gpt-4o"
+    tiers = ["openai:gpt-4o"]
+
+    async def extract_recipe_from_markdown(self, markdown_content):
+        return Recipe(name="Tortilla de patatas", ingredients=["4 huevos", "1 cebolla"], instructions=["Batir."])
+
+
+class _Service:
+    recipe_agent = _Agent()
+
+    async def load_page_markdown(self, url, markdown_sha256=None, html_sha256=None, refetch=False):
+        return "# Tortilla", "html-sha", "md-sha"
+
+
+def _args(**overrides):
+    values = dict(concurrency=2, requests_per_minute=0, batch_size=1, refetch=False, dry_run=False)
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
+def test_diff_reports_added_and_removed_lines():
+    changes = reextract.recipe_diff(
+        {"name": "Tortilla", "ingredients": ["4 huevos", "sal"], "instructions": ["Batir."], "image_url": None},
+        {"name": "Tortilla", "ingredients": ["4 huevos", "1 cebolla"], "instructions": ["Batir."], "image_url": None},
+    )
+    assert changes == {"ingredients": {"added": ["1 cebolla"], "removed": ["sal"], "reordered": False}}
+
+
+def test_run_updates_rows_and_resumes_from_checkpoint(tmp_path, monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(reextract, "SessionLocal", session_factory)
+    db = session_factory()
+    add_recipe_to_db(db, Recipe(name="Tortilla de patatas", ingredients=["4 huevos", "sal"], instructions=["Batir."]), "https://www.example.com/tortilla", user_id=1)
+    add_recipe_to_db(db, Recipe(name="Gazpacho", ingredients=["tomate"], instructions=["Triturar."]), "https://other.org/gazpacho", user_id=1)
+
+    rows = [reextract._snapshot(r) for r in get_recipes_for_reextraction(db, domain="example.com")]
+    assert [row["name"] for row in rows] == ["Tortilla de patatas"]
+
+    checkpoint = Checkpoint(tmp_path / "checkpoint.jsonl")
+    totals = asyncio.run(reextract.Reextractor(_args(), _Service()).run(rows, checkpoint, tmp_path / "report.jsonl"))
+
+    db.expire_all()
+    updated = db.get(CanonicalRecipeDB, rows[0]["id"])
+    assert totals["changed"] == 1 and totals["field:ingredients"] == 1
+    assert updated.ingredients == ["4 huevos", "1 cebolla"]
+    assert updated.extraction_model == "openai:gpt-4o" and updated.markdown_sha256 == "md-sha"
+    assert rows[0]["id"] in Checkpoint(tmp_path / "checkpoint.jsonl")
+    assert get_recipes_for_reextraction(db, model="unknown")[0].name == "Gazpacho"
+
+
+def test_run_refreshes_the_page_signature_and_new_image_variants(tmp_path, monkeypatch):
+    from app.database import SignatureBandDB
+    from app.near_duplicates import content_signature, format_signature, signature_bands
+    from tests.test_near_duplicates import COPY, ORIGINAL
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(reextract, "SessionLocal", session_factory)
+    built = []
+
+    async def build(canonical_id, image_url):
+        built.append((canonical_id, image_url))
+
+    monkeypatch.setattr(reextract, "build_canonical_image_variants", build)
+    db = session_factory()
+    stored = add_recipe_to_db(db, Recipe(name="Tortilla de patatas", ingredients=["4 huevos"], instructions=["Batir."]), "https://www.example.com/tortilla", user_id=1, content_signature=content_signature(ORIGINAL))
+    service = _Service()
+    service.load_page_markdown = lambda *args, **kwargs: asyncio.sleep(0, result=(COPY, "html-sha", "md-sha"))
+    service.recipe_agent = SimpleNamespace(current_model_identifier="openai:gpt-4o", extract_recipe_from_markdown=lambda markdown: asyncio.sleep(0, result=Recipe(
+        name="Tortilla de patatas", ingredients=["4 huevos"], instructions=["Batir."], image_url="https://www.example.com/tortilla.jpg",
+    )))
+
+    rows = [reextract._snapshot(r) for r in get_recipes_for_reextraction(db)]
+    asyncio.run(reextract.Reextractor(_args(), service).run(rows, None, tmp_path / "report.jsonl"))
+
+    db.expire_all()
+    updated = db.get(CanonicalRecipeDB, stored.canonical_id)
+    assert updated.content_signature == format_signature(content_signature(COPY)) != format_signature(content_signature(ORIGINAL))
+    assert sorted(band for (band,) in db.query(SignatureBandDB.band)) == sorted(signature_bands(content_signature(COPY)))
+    assert updated.updated_at is not None  # re-indexed for similar recipes
+    assert built == [(updated.id, "https://www.example.com/tortilla.jpg")]
@@ -0,0 +1,46 @@
+import orjson
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from starlette.requests import Request
+
+from app.database import Base, add_recipe_to_db, get_recipe_rows_for_user
+from app.models.recipe import Recipe
+from app.serialization import negotiated_response
+
+
+def _session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+
+def _request(accept):
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": [(b"accept", accept.encode())]})
+
+
+def test_rows_are_plain_dicts_with_decoded_json_columns():
+    session = _session()
+    add_recipe_to_db(session, Recipe(name="Tortilla", ingredients=["4 huevos"], instructions=["Batir."]), "https://example.com/t", user_id=1)
+    add_recipe_to_db(session, Recipe(name="Other user", ingredients=[], instructions=[]), "https://example.com/o", user_id=2)
+
+    rows = get_recipe_rows_for_user(session, user_id=1)
+
+    assert rows == [{
+        "id": 1, "name": "Tortilla", "ingredients": ["4 huevos"], "instructions": ["Batir."],
+        "image_url": None, "source_url": "https://example.com/t", "image_variants": None,
+    }]
+    response = negotiated_response(rows, _request("application/json"))
+    assert response.media_type == "application/json"
+    assert orjson.loads(response.body) == rows
+
+
+def test_library_endpoint_documents_json_and_msgpack():
+    from app.backend import app
+
+    schema = app.openapi()
+    content = schema["paths"]["/getallrecipes"]["get"]["responses"]["200"]["content"]
+
+    assert set(content) == {"application/json", "application/msgpack"}
+    assert content["application/json"]["schema"]["items"] == content["application/msgpack"]["schema"]["items"] == {"$ref": "#/components/schemas/Recipe"}
+    assert "Recipe" in schema["components"]["schemas"]
@@ -0,0 +1,76 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from app import database, recipe_service
+from app.database import add_recipe_to_db
+from app.models.recipe import Recipe
+from app.recipe_service import RecipeService
+from app.similar_recipes import SimilarRecipeIndex, recipe_terms
+from tests.test_negative_cache import _session_generator
+
+RECIPES = [
+    ("Tortilla de patatas", ["4 huevos", "500 g de patatas", "1 cebolla", "Aceite de oliva"]),
+    ("Tortilla de patatas sin cebolla", ["5 huevos", "600 g de patatas", "Aceite de oliva", "Sal"]),
+    ("Tortilla de calabacín", ["4 huevos", "2 calabacines", "1 cebolla"]),
+    ("Gazpacho andaluz", ["1 kg de tomates", "1 pepino", "1 pimiento verde", "Aceite de oliva"]),
+    ("Patatas bravas", ["1 kg de patatas", "Salsa brava", "Aceite de oliva"]),
+]
+
+
+def _rows(recipes, first_id=1):
+    return [SimpleNamespace(id=first_id + i, name=name, ingredients=ingredients) for i, (name, ingredients) in enumerate(recipes)]
+
+
+def test_terms_drop_quantities_and_weight_the_title():
+    assert recipe_terms("Tortilla de patatas", ["4 huevos", "500 g de patatas", "1 cucharada de aceite"]) == {"tortilla": 2, "patatas": 3, "huevos": 1, "aceite": 1}
+
+
+def test_pending_and_merged_rows_rank_alike_and_survive_a_restart(tmp_path):
+    index = SimilarRecipeIndex(tmp_path / "similar.npz", merge_rows=100)
+    index.load()
+    index.add(_rows(RECIPES[:3]))
+    index.merge()
+    index.enqueue(_rows(RECIPES[3:], first_id=4))  # indexed by the next query, still pending
+
+    ranked = index.similar(1, k=4)
+    assert [canonical_id for canonical_id, _ in ranked][::3] == [2, 4]  # the other potato omelette first, gazpacho last
+    assert [score for _, score in ranked] == sorted((score for _, score in ranked), reverse=True)
+    assert [canonical_id for canonical_id, _ in index.similar(1, k=5, among={3, 4})] == [3, 4]
+
+    index.remove(2)
+    assert 2 not in dict(index.similar(1, k=5))
+    index.replace([SimpleNamespace(id=3, name="Gazpacho de sandía", ingredients=["1 kg de sandía", "1 pepino"], updated_at=None)])
+    assert 3 not in dict(index.similar(1, k=5)) and dict(index.similar(3, k=5)).keys() == {4}
+    index.save()
+    restarted = SimilarRecipeIndex(tmp_path / "similar.npz")
+    restarted.load()
+    assert restarted.similar(1, k=5) == index.similar(1, k=5) and len(restarted) == 4
+
+
+def test_similar_recipes_from_the_library_and_the_catalogue(tmp_path, monkeypatch):
+    index = SimilarRecipeIndex(tmp_path / "similar.npz")
+    index.load()
+    monkeypatch.setattr(database, "similar_index", index)
+    monkeypatch.setattr(recipe_service, "similar_index", index)
+    db, sessions = _session_generator()
+    stored = [
+        add_recipe_to_db(db, Recipe(name=name, ingredients=ingredients, instructions=["Cocinar."]), f"https://blog.example/{i}", user_id=1 if i != 1 else 2)
+        for i, (name, ingredients) in enumerate(RECIPES)
+    ]
+    service = RecipeService.__new__(RecipeService)
+
+    library = service.similar_recipes(stored[0].id, user_id=1, k=3, db_session_generator=sessions)
+    catalogue = service.similar_recipes(stored[0].id, user_id=1, k=3, scope="catalogue", db_session_generator=sessions)
+
+    assert {recipe.name for recipe in library} == {"Tortilla de calabacín", "Patatas bravas", "Gazpacho andaluz"}
+    assert library[-1].name == "Gazpacho andaluz" and all(recipe.in_library and recipe.id for recipe in library)
+    assert (catalogue[0].name, catalogue[0].in_library, catalogue[0].id) == ("Tortilla de patatas sin cebolla", False, None)
+    assert catalogue[0].score > catalogue[1].score > 0 and catalogue[1].in_library
+    assert service.similar_recipes(stored[1].id, user_id=1, db_session_generator=sessions) is None  # user 2's recipe
+
+    # A re-extraction in another process is picked up through updated_at.
+    gazpacho = stored[3].canonical
+    gazpacho.ingredients, gazpacho.updated_at = ["4 huevos", "500 g de patatas", "1 cebolla"], datetime.now(timezone.utc)
+    db.commit()
+    rescored = service.similar_recipes(stored[0].id, user_id=1, k=3, db_session_generator=sessions)
+    assert [recipe.score for recipe in rescored if recipe.name == "Gazpacho andaluz"][0] > library[-1].score
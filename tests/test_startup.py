@@ -0,0 +1,60 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+
+from app import backend, startup
+from app.startup import StartupReport
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+
+def test_importing_the_backend_does_not_load_providers_or_the_crawler():
+    heavy = ["pydantic_ai", "openai", "crawl4ai", "playwright"]
+    code = f"import sys, app.backend; print([m for m in {heavy!r} if m in sys.modules])"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.strip().splitlines()[-1] == "[]"
+
+
+def test_warm_up_times_each_component(monkeypatch):
+    report = StartupReport()
+    monkeypatch.setattr(startup, "startup_report", report)
+    built = []
+
+    asyncio.run(startup.warm_up(lambda: built.append("service")))
+
+    assert built == ["service"]
+    assert report.warmup_done and not report.ready  # the database step has not run
+    agent = report.snapshot()["components"]["agent"]
+    assert agent["status"] == "ready" and agent["import_seconds"] is not None and agent["init_seconds"] is not None
+
+
+def test_failed_component_is_reported_without_blocking_readiness(monkeypatch):
+    report = StartupReport()
+    report.database_ready = True
+    monkeypatch.setattr(startup, "startup_report", report)
+
+    def broken_factory():
+        raise RuntimeError("OPENAI_API_KEY not set")
+
+    asyncio.run(startup.warm_up(broken_factory))
+
+    assert report.ready
+    assert report.components["agent"].status == "failed"
+    assert report.components["agent"].error == "OPENAI_API_KEY not set"
+
+
+def test_liveness_and_readiness_are_separate(monkeypatch):
+    report = StartupReport()
+    monkeypatch.setattr(backend, "startup_report", report)
+    client = TestClient(backend.app)  # no lifespan: the warm-up never ran
+
+    assert client.get("/health/live").status_code == 200
+    assert client.get("/health/ready").status_code == 503
+
+    report.database_ready = True
+    report.finish_warmup()
+    assert client.get("/health/ready").json() == {"status": "ready"}
+    assert client.get("/health/startup").json()["ready_after_seconds"] is not None
@@ -0,0 +1,40 @@
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+
+from app.static_assets import PrecompressedStaticFiles
+
+
+def _client(tmp_path):
+    (tmp_path / "index.html").write_text('<link rel="stylesheet" href="style.css"><script src="app.js"></script>')
+    (tmp_path / "app.js").write_text("console.log('recipes');\n" * 200)
+    (tmp_path / "style.css").write_text("body { margin: 0; }\n" * 200)
+    static = PrecompressedStaticFiles(directory=str(tmp_path))
+    return static, TestClient(Starlette(routes=[Mount("/", app=static)]))
+
+
+def test_index_references_fingerprinted_assets_served_immutable(tmp_path):
+    static, client = _client(tmp_path)
+
+    index = client.get("/", headers={"Accept-Encoding": "gzip"})
+    fingerprinted_js = static.fingerprints["app.js"]
+
+    assert index.headers["cache-control"] == "no-cache"
+    assert f'src="{fingerprinted_js}"' in index.text
+    asset = client.get(f"/{fingerprinted_js}", headers={"Accept-Encoding": "gzip"})
+    assert asset.headers["content-encoding"] == "gzip"
+    assert "immutable" in asset.headers["cache-control"]
+    assert asset.text.startswith("console.log")
+
+
+def test_encoding_follows_accept_encoding_and_etag_revalidates(tmp_path):
+    _, client = _client(tmp_path)
+
+    plain = client.get("/style.css", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.headers["vary"] == "Accept-Encoding"
+
+    gzipped = client.get("/style.css", headers={"Accept-Encoding": "gzip;q=1, br;q=0"})
+    assert gzipped.headers["content-encoding"] == "gzip"
+    revalidated = client.get("/style.css", headers={"Accept-Encoding": "gzip", "If-None-Match": gzipped.headers["etag"]})
+    assert revalidated.status_code == 304